@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import time
+import numpy as np
+from game_rules import (
+    STAT_FIELDS, HP, BULLETS, BOMBS, SHIELD_HP, DEATHS, SHIELDS, INITIAL_STATS,
+    GUN_DAMAGE, BOMB_DAMAGE, RAIN_BOMB_DAMAGE, AI_ACTION_DAMAGE, AI_ACTIONS,
+)
+from game_state import MAX_HP, MAX_BULLETS, MAX_BOMBS, MAX_SHIELDS, MAX_SHIELD_HP
+
+# Integer codes for action types; anything else is NO_ACTION and only triggers rain bomb ticks
+ACTIONS = ('gun', 'bomb', 'reload', 'shield', 'logout') + AI_ACTIONS
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+GUN, BOMB, RELOAD, SHIELD, LOGOUT = range(5)
+FIRST_AI_ACTION = len(ACTIONS) - len(AI_ACTIONS)
+NO_ACTION = len(ACTIONS)
+
+class BatchSimulator:
+    """Advance many independent games in lockstep with the rules of game_rules.
+
+    stats has shape (games, 2, len(STAT_FIELDS)) and login has shape (games, 2).
+    Every step takes one action per game, given as arrays of shape (games,).
+    """
+
+    def __init__(self, games):
+        self.games = games
+        self.index = np.arange(games)
+        self.stats = np.empty((games, 2, len(STAT_FIELDS)), dtype=np.int32)
+        self.stats[:] = INITIAL_STATS
+        self.login = np.ones((games, 2), dtype=bool)
+
+    def damage(self, stats, amount, mask):
+        # Vectorized game_rules.damage applied where mask is set; returns (hit, shield_hit)
+        amount = np.where(mask, amount, 0)
+        shield_hp = stats[:, SHIELD_HP]
+        damage_to_shield = np.minimum(amount, shield_hp)
+        shield_hit = damage_to_shield > 0
+        stats[:, SHIELD_HP] = shield_hp - damage_to_shield
+        amount = amount - damage_to_shield
+        hit = amount > 0
+        stats[:, HP] = np.maximum(0, stats[:, HP] - amount)
+        died = mask & (stats[:, HP] <= 0)
+        if died.any():
+            stats[died, HP] = MAX_HP
+            stats[died, BULLETS] = MAX_BULLETS
+            stats[died, BOMBS] = MAX_BOMBS
+            stats[died, SHIELD_HP] = 0
+            stats[died, DEATHS] += 1
+            stats[died, SHIELDS] = MAX_SHIELDS
+        return hit, shield_hit
+
+    def step(self, actor, action, hit, opponent_visible, opponent_in_rain_bomb):
+        """Apply one action per game. actor is 0 for p1 and 1 for p2.
+
+        Returns (registered, display, opponent_hit, opponent_shield_hit) arrays.
+        """
+        index = self.index
+        defender_index = 1 - actor
+        attacker = self.stats[index, actor]
+        defender = self.stats[index, defender_index]
+
+        # Players that are logged out cannot perform actions
+        registered = self.login[index, actor]
+        visible = opponent_visible & registered
+        gun_hit = hit | opponent_visible
+
+        opponent_hit = np.zeros(self.games, dtype=bool)
+        opponent_shield_hit = np.zeros(self.games, dtype=bool)
+
+        # Rain bombs tick once per action while the opponent is visible
+        rain = np.where(visible, opponent_in_rain_bomb, 0)
+        for tick in range(int(rain.max(initial=0))):
+            hit_now, shield_hit_now = self.damage(defender, RAIN_BOMB_DAMAGE, rain > tick)
+            opponent_hit |= hit_now
+            opponent_shield_hit |= shield_hit_now
+
+        bullets = attacker[:, BULLETS]
+        bombs = attacker[:, BOMBS]
+        shields = attacker[:, SHIELDS]
+        shield_hp = attacker[:, SHIELD_HP]
+
+        fired = registered & (action == GUN) & (bullets > 0)
+        thrown = registered & (action == BOMB) & (bombs > 0)
+        reloaded = registered & (action == RELOAD) & (bullets == 0)
+        shielded = registered & (action == SHIELD) & (shields > 0) & (shield_hp == 0)
+        logged_out = registered & (action == LOGOUT)
+        ai_action = registered & (action >= FIRST_AI_ACTION) & (action < NO_ACTION)
+        display = fired | thrown | reloaded | shielded | logged_out | ai_action
+
+        attacker[:, BULLETS] = np.where(reloaded, MAX_BULLETS, bullets - fired)
+        attacker[:, BOMBS] = bombs - thrown
+        attacker[:, SHIELDS] = shields - shielded
+        attacker[:, SHIELD_HP] = np.where(shielded, MAX_SHIELD_HP, shield_hp)
+
+        new_damage = (
+            (fired & gun_hit) * GUN_DAMAGE
+            + (thrown & visible) * BOMB_DAMAGE
+            + (ai_action & visible) * AI_ACTION_DAMAGE
+        )
+
+        hit_now, shield_hit_now = self.damage(defender, new_damage, registered)
+        opponent_hit |= hit_now
+        opponent_shield_hit |= shield_hit_now
+
+        self.stats[index, actor] = attacker
+        self.stats[index, defender_index] = defender
+        self.login[index[logged_out], actor[logged_out]] = False
+
+        return registered, display, opponent_hit & registered, opponent_shield_hit & registered
+
+    def run(self, actors, actions, hits, opponent_visible, opponent_in_rain_bomb):
+        """Run whole action sequences, each argument has shape (games, steps)."""
+        for step in range(actions.shape[1]):
+            self.step(
+                actors[:, step],
+                actions[:, step],
+                hits[:, step],
+                opponent_visible[:, step],
+                opponent_in_rain_bomb[:, step],
+            )
+        return self.stats
+
+    def check_invariants(self):
+        """Return a dict of invariant name to the number of games violating it."""
+        stats = self.stats
+        return {
+            'hp_in_range': int(((stats[..., HP] < 1) | (stats[..., HP] > MAX_HP)).any(axis=1).sum()),
+            'bullets_in_range': int(((stats[..., BULLETS] < 0) | (stats[..., BULLETS] > MAX_BULLETS)).any(axis=1).sum()),
+            'bombs_in_range': int(((stats[..., BOMBS] < 0) | (stats[..., BOMBS] > MAX_BOMBS)).any(axis=1).sum()),
+            'shield_hp_in_range': int(((stats[..., SHIELD_HP] < 0) | (stats[..., SHIELD_HP] > MAX_SHIELD_HP)).any(axis=1).sum()),
+            'shields_in_range': int(((stats[..., SHIELDS] < 0) | (stats[..., SHIELDS] > MAX_SHIELDS)).any(axis=1).sum()),
+            'deaths_not_negative': int((stats[..., DEATHS] < 0).any(axis=1).sum()),
+        }
+
+    def game_state(self, game):
+        """Final state of one game in the eval server's wire shape."""
+        return {
+            player_key: dict(zip(STAT_FIELDS, (int(value) for value in self.stats[game, player])))
+            for player, player_key in enumerate(('p1', 'p2'))
+        }
+
+def random_sequences(rng, games, steps, max_rain_bombs=2):
+    """Random action sequences for (games, steps) in the argument order of BatchSimulator.run."""
+    actors = rng.integers(0, 2, size=(games, steps), dtype=np.int8)
+    # Logouts are rare so most games keep going
+    weights = np.array([6, 2, 3, 2, 0.05, 1, 1, 1, 1, 1], dtype=float)
+    actions = rng.choice(len(weights), size=(games, steps), p=weights / weights.sum()).astype(np.int8)
+    hits = rng.random((games, steps)) < 0.5
+    opponent_visible = rng.random((games, steps)) < 0.6
+    opponent_in_rain_bomb = rng.integers(0, max_rain_bombs + 1, size=(games, steps), dtype=np.int8)
+    return actors, actions, hits, opponent_visible, opponent_in_rain_bomb
+
+def main():
+    parser = argparse.ArgumentParser(description='Vectorized batch simulator for the game rules')
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixtures', help='Write the action sequences and expected final states of the first games to this JSON file')
+    parser.add_argument('--fixture-count', type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    sequences = random_sequences(rng, args.games, args.steps)
+    simulator = BatchSimulator(args.games)
+
+    start = time.perf_counter()
+    simulator.run(*sequences)
+    elapsed = time.perf_counter() - start
+    print(f'[DEBUG] Simulated {args.games} games x {args.steps} actions in {elapsed:.2f} s '
+          f'({args.games * args.steps / elapsed:,.0f} actions/s)')
+    print(f'[DEBUG] Invariant violations: {simulator.check_invariants()}')
+    print(f'[DEBUG] Mean deaths per player: {simulator.stats[..., DEATHS].mean():.2f}')
+
+    if args.fixtures:
+        actors, actions, hits, opponent_visible, opponent_in_rain_bomb = sequences
+        fixtures = []
+        for game in range(min(args.fixture_count, args.games)):
+            messages = []
+            for step in range(args.steps):
+                action = int(actions[game, step])
+                messages.append({
+                    'player_id': int(actors[game, step]) + 1,
+                    'action_type': ACTIONS[action] if action < NO_ACTION else None,
+                    'hit': bool(hits[game, step]),
+                    'opponent_visible': bool(opponent_visible[game, step]),
+                    'opponent_in_rain_bomb': int(opponent_in_rain_bomb[game, step]),
+                })
+            fixtures.append({'actions': messages, 'expected_game_state': simulator.game_state(game)})
+        with open(args.fixtures, 'w') as file:
+            json.dump(fixtures, file)
+        print(f'[DEBUG] Wrote {len(fixtures)} fixtures to {args.fixtures}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+from dotenv import load_dotenv
+from log import get_logger
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Milliseconds a window waits for more windows of its device before the batch runs. 0 batches the
+# windows delivered in the same event loop iteration and those arriving while a batch runs; a few ms
+# also batches players whose windows arrive that far apart, at the cost of that much latency
+AI_BATCH_MS = float(os.getenv('AI_BATCH_MS', '0'))
+
+log = get_logger('batcher')
+
+class MicroBatcher:
+    """Groups the IMU windows of each device into predict_batch calls of an InferenceWorker.
+
+    The first window of a device opens a batch, which runs window_ms later or as soon as it holds
+    max_batch windows. A device has at most worker.depth batches in the worker, one running and one
+    staged: windows that arrive meanwhile collect into the next batch, which runs once one completes,
+    so batches grow with the load instead of queueing up. predict() resolves with the window's own result.
+
+    capacity is the most windows that can be waiting at once, the consumer's prefetch count. Once that
+    many wait, no more can arrive before a batch completes, so the open batches run without waiting.
+    """
+
+    def __init__(self, worker, window_ms=None, max_batch=None, capacity=None):
+        self.worker = worker
+        self.window = (AI_BATCH_MS if window_ms is None else window_ms) / 1000
+        self.max_batch = max_batch or worker.max_batch
+        self.capacity = capacity
+        # Windows given to predict() and not answered yet
+        self.waiting = 0
+        # device -> [(data, future)] waiting for the next batch
+        self.pending = {}
+        # device -> its model, and the timer handle of its open batch
+        self.models = {}
+        self.timers = {}
+        # device -> its batches in the worker, and the tasks awaiting them
+        self.running = {}
+        self.tasks = set()
+        self.batches = 0
+        self.windows = 0
+
+    async def predict(self, data, model):
+        future = asyncio.get_running_loop().create_future()
+        self.models[model.device] = model
+        batch = self.pending.setdefault(model.device, [])
+        batch.append((data, future))
+        if self.capacity and self.waiting + 1 >= self.capacity:
+            self.flush_all()
+        elif len(batch) >= self.max_batch:
+            self.flush(model)
+        elif model.device not in self.timers:
+            self.timers[model.device] = asyncio.get_running_loop().call_later(self.window, self.flush, model)
+        self.waiting += 1
+        try:
+            return await future
+        finally:
+            self.waiting -= 1
+
+    def flush_all(self):
+        # Devices with a running batch flush theirs when it completes
+        for device in list(self.pending):
+            self.flush(self.models[device])
+
+    def flush(self, model):
+        timer = self.timers.pop(model.device, None)
+        if timer is not None:
+            timer.cancel()
+        # A running batch flushes the pending windows itself when it completes
+        if self.running.get(model.device, 0) >= self.worker.depth or not self.pending.get(model.device):
+            return
+        pending = self.pending[model.device]
+        batch, self.pending[model.device] = pending[:self.max_batch], pending[self.max_batch:]
+        self.running[model.device] = self.running.get(model.device, 0) + 1
+        task = asyncio.create_task(self.run(batch, model))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self, batch, model):
+        self.batches += 1
+        self.windows += len(batch)
+        try:
+            results = await self.worker.predict_batch([data for data, _ in batch], model)
+        except Exception as e:
+            log.error('Error during batch inference of %d %s windows: %s', len(batch), model.device, e)
+            results = [e] * len(batch)
+        finally:
+            self.running[model.device] -= 1
+        for (_, future), result in zip(batch, results):
+            # Skip windows whose consumer was cancelled meanwhile
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        pending = self.pending.get(model.device)
+        if pending and (model.device not in self.timers or len(pending) >= self.max_batch):
+            self.flush(model)
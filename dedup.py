@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+import itertools
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Message IDs remembered by a consumer, and for how many seconds
+DEDUP_SIZE = int(os.getenv('DEDUP_SIZE', '10000'))
+DEDUP_TTL = float(os.getenv('DEDUP_TTL', '300'))
+
+# IDs are this process' random prefix and a counter, unique across services and restarts
+_prefix = uuid.uuid4().hex[:12]
+_counter = itertools.count(1)
+
+def new_message_id():
+    return f'{_prefix}-{next(_counter)}'
+
+class DedupCache:
+    """Bounded LRU of recently applied message IDs, forgetting IDs not seen for ttl seconds.
+
+    Redeliveries (e.g. after a reconnect) carry the ID of the original, so a consumer that checks
+    every message here applies each one at most once under at-least-once delivery.
+    """
+
+    def __init__(self, max_size=None, ttl=None, clock=time.monotonic):
+        self.max_size = max_size or DEDUP_SIZE
+        self.ttl = DEDUP_TTL if ttl is None else ttl
+        self.clock = clock
+        # message_id -> time last seen, oldest first
+        self.entries = OrderedDict()
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def seen(self, message_id):
+        """Record message_id and return True if it was already recorded."""
+        now = self.clock()
+        entries = self.entries
+        while entries:
+            oldest_id, seen_at = next(iter(entries.items()))
+            if now - seen_at < self.ttl:
+                break
+            del entries[oldest_id]
+        if message_id in entries:
+            entries.move_to_end(message_id)
+            entries[message_id] = now
+            self.duplicates += 1
+            return True
+        entries[message_id] = now
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+        return False
@@ -1,24 +1,14 @@
 module.exports = {
     apps : [
       {
-        name: "eval_client",
+        // Starts the eval_client, game_engine and ai_server together in one process, see launcher.py
+        name: "external_comms",
         script: "sudo",
-        args: ["-E", "python", "-u", "/home/xilinx/.external_comms/eval_client.py"],
+        args: ["-E", "python", "-u", "/home/xilinx/.external_comms/launcher.py"],
         env: {
           PORT: process.env.PORT,
           SECRET_PASSWORD: process.env.SECRET_PASSWORD
         }
-      },
-      {
-        name: "game_engine",
-        script: "sudo",
-        args: ["-E", "python", "-u", "/home/xilinx/.external_comms/game_engine.py"],
-      },
-      {
-        name: "ai_server",
-        script: "sudo",
-        args: ["-E", "python", "-u", "/home/xilinx/.external_comms/ai_server.py"],
       }
     ]
   };
-  
\ No newline at end of file
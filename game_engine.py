@@ -1,42 +1,90 @@
 #!/usr/bin/env python
 
 import asyncio
-import json
 import os
+import time
+from operator import itemgetter
 from dotenv import load_dotenv
-import aio_pika
 import aiomqtt
 import purge_queues
+from dedup import DedupCache, new_message_id
+from gateway import StateGateway, GATEWAY_PORT
+from game_state import MatchState, DeltaEncoder, StateSnapshot, splice_game_state, PLAYER_KEYS
+from game_rules import resolve_action, rain_bomb_tick
+from journal import Journal
+from log import get_logger
+from publisher import Publisher
+from timer_wheel import TimerWheel
+from transport import create_transport
+from wire import WIRE_FORMAT, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, decode, decode_message, encode, splice_packed
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Use the same broker, username, and password for both RabbitMQ and MQTT
-BROKER = os.getenv('BROKER')
-BROKERUSER = os.getenv('BROKERUSER')
-PASSWORD = os.getenv('PASSWORD')
-
-# Abstracted RabbitMQ port
-RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT', '5672'))
-
 # RabbitMQ queues
 UPDATE_EVAL_SERVER_QUEUE = os.getenv('UPDATE_EVAL_SERVER_QUEUE', 'update_eval_server_queue')
 UPDATE_GE_QUEUE = os.getenv('UPDATE_GE_QUEUE', 'update_ge_queue') 
+# High-priority lane for player actions; update_ge_queue stays the lane for state updates and single-queue producers
+UPDATE_GE_ACTION_QUEUE = os.getenv('UPDATE_GE_ACTION_QUEUE', 'update_ge_action_queue')
 
 # RabbitMQ exchanges
 UPDATE_EVERYONE_EXCHANGE = os.getenv('UPDATE_EVERYONE_EXCHANGE', 'update_everyone_exchange')
 
+# Opt-in delta broadcasts: only changed fields are sent, with a full keyframe every KEYFRAME_INTERVAL broadcasts
+DELTA_BROADCASTS = os.getenv('DELTA_BROADCASTS', 'false').lower() == 'true'
+KEYFRAME_INTERVAL = int(os.getenv('KEYFRAME_INTERVAL', '30'))
+
+# 'event' processes every message on its own, 'batch' drains up to BATCH_SIZE messages
+# (or whatever arrives within BATCH_WINDOW_MS) and applies them under one lock acquisition per match,
+# 'tick' buffers messages and applies them at a fixed TICK_RATE with one broadcast per match per tick,
+# 'lanes' serves every pending action before any state update and coalesces the state updates waiting behind them
+ENGINE_MODE = os.getenv('ENGINE_MODE', 'event')
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '32'))
+BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', '5'))
+TICK_RATE = float(os.getenv('TICK_RATE', '30'))
+TICK_STATS_INTERVAL = float(os.getenv('TICK_STATS_INTERVAL', '10'))  # Seconds between tick statistics reports
+
+# Crash recovery journal of applied messages, disabled unless JOURNAL_DIR is set
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', '')
+SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', '500'))  # Journal records between state snapshots
+JOURNAL_FSYNC = os.getenv('JOURNAL_FSYNC', 'false').lower() == 'true'
+JOURNAL_RESET = os.getenv('JOURNAL_RESET', 'false').lower() == 'true'  # Discard the journal and start a fresh match
+
+# Opt-in timed effects run by a timer wheel: rain bombs tick every RAIN_BOMB_INTERVAL seconds instead of on the
+# attacker's actions, shields expire SHIELD_DURATION seconds after being raised, a killed player cannot act for
+# RESPAWN_DELAY seconds and an action cannot be repeated for ACTION_COOLDOWN seconds. A duration of 0 turns that effect off.
+TIMED_EFFECTS = os.getenv('TIMED_EFFECTS', 'false').lower() == 'true'
+TIMER_TICK_MS = float(os.getenv('TIMER_TICK_MS', '10'))
+RAIN_BOMB_INTERVAL = float(os.getenv('RAIN_BOMB_INTERVAL', '1'))
+SHIELD_DURATION = float(os.getenv('SHIELD_DURATION', '10'))
+RESPAWN_DELAY = float(os.getenv('RESPAWN_DELAY', '3'))
+ACTION_COOLDOWN = float(os.getenv('ACTION_COOLDOWN', '0.5'))
+
+# Deliveries of each queue unacked at once in event and lanes mode; safe above 1 since redeliveries are
+# skipped by message_id
+PREFETCH_COUNT = int(os.getenv('PREFETCH_COUNT', '64'))
+
+log = get_logger('game_engine')
+
+# Match used for messages that do not carry a match_id
+DEFAULT_MATCH_ID = os.getenv('DEFAULT_MATCH_ID', 'default')
+
 DEBUG = False
 
 # Example full schema for messages to and from the game engine
+# Every message is sent as JSON or as MessagePack of the same shape, as given by its content_type (see wire.py)
 """
-Schema for messages received from 'update_ge_queue' (from various sources):
+Schema for messages received from 'update_ge_queue' and 'update_ge_action_queue' (from various sources):
+Actions may be sent to either queue; in lanes mode the action queue is always served first.
 
 {
+  "match_id": "arena1",           # Optional, match the message belongs to (defaults to DEFAULT_MATCH_ID)
+  "message_id": "3f2a9c1b04de-17", # Optional, set by producers so redeliveries are applied only once
   "update": true,                 # Indicates whether to send an update to all nodes
   "action": false,                # When true, perform calculations and update the game state
   "player_id": 1,                 # ID of the player performing the action
   "action_type": "gun",           # Type of action performed
+  "keyframe": false,              # Optional, request a full game state broadcast (e.g. after a receiver spots a seq gap)
   "hit": true,                    # For 'gun' action, indicates if the shot hit the target, need to make the distinction because gun can shoot without hitting the target (such as in eval server)  
   "game_state": {
     "p1": {
@@ -57,335 +105,911 @@ Schema for messages received from 'update_ge_queue' (from various sources):
 Schema for messages published to 'update_everyone' (to Nodes):
 
 {
+  "match_id": "arena1",
+  "seq": 42,             # Only with DELTA_BROADCASTS, increases by one per broadcast of the match
+  "keyframe": false,     # Only with DELTA_BROADCASTS, true when game_state is the full state
   "player_id": 1,
   "action": "gun",
-  "game_state": { ... }  # Updated game state after calculations
+  "game_state": { ... }  # Updated game state after calculations, only the changed fields in a delta
+  "actions": [           # Only in batch mode, when more than one displayed action was applied in the batch
+    {"player_id": 1, "action": "gun"},
+    {"player_id": 2, "action": "shield"}
+  ],
+  "effects": ["rain_bomb"]  # Only with TIMED_EFFECTS, timed effects that changed the state since the last broadcast
 }
 
 Schema for messages published to 'update_eval_server_queue' (to Evaluation Server):
 
 {
+  "match_id": "arena1",
+  "message_id": "3f2a9c1b04de-18",
   "player_id": 1,
   "action": "gun",
   "game_state": { ... }  # Updated game state after calculations
 }
 """
 
-class GameEngine:
-    def __init__(self):
-        self.rabbitmq_connection = None
-        self.channel = None
-        self.update_ge_queue = None
-        self.exchange = None
+OPPONENT_KEYS = {'p1': 'p2', 'p2': 'p1'}
+PLAYER_NUMBERS = {'p1': 1, 'p2': 2}
+
+def check_message(data):
+    # Malformed messages are refused before any of their fields are applied
+    game_state = data.get('game_state', {})
+    if not isinstance(game_state, dict) or not all(isinstance(player_state, dict) for player_state in game_state.values()):
+        raise ValueError('game_state must map players to their fields')
+    if data.get('action', False) and data.get('player_id') not in PLAYER_KEYS:
+        raise ValueError(f'Action from unknown player {data.get("player_id")!r}')
+
+def is_valid(data):
+    try:
+        check_message(data)
+    except ValueError:
+        return False
+    return True
+
+def effect_key(data):
+    # Key of a timed effect in Match.timers
+    return data['effect'], PLAYER_KEYS[data['player_id']], data.get('action_type')
+
+class Match:
+    def __init__(self, match_id):
+        self.match_id = match_id
         
-        # Initialize lock for ensuring single access to message processing
+        # Each match has its own lock so a burst in one arena never blocks another
         self.lock = asyncio.Lock()
         
         # Initialize internal game state
-        self.game_state = {
-            'p1': {
-                'hp': 100,
-                'bullets': 6,
-                'bombs': 2,
-                'shield_hp': 0,
-                'deaths': 0,
-                'shields': 3,
-                'opponent_hit': False, # Visualizer shows when opponent is damaged
-                'opponent_shield_hit': False,  # Visualizer shows when opponent's shield is damaged
-                'opponent_visible': DEBUG,
-                'opponent_in_rain_bomb': 0,  # Counter for rain bombs
-                'glove_connected': False,
-                'vest_connected': False,
-                'leg_connected': False,
-                'login': True,
-                'profile_pic': 0
-            },
-            'p2': {
-                'hp': 100,
-                'bullets': 6,
-                'bombs': 2,
-                'shield_hp': 0,
-                'deaths': 0,
-                'shields': 3,
-                'opponent_hit': False,
-                'opponent_shield_hit': False,  # Visualizer shows when opponent's shield is damaged
-                'opponent_visible': DEBUG,
-                'opponent_in_rain_bomb': 0,
-                'glove_connected': False,
-                'vest_connected': False,
-                'leg_connected': False,
-                'login': True,
-                'profile_pic': 0
-            }
-        }
-
-    async def setup_rabbitmq(self):
-        # Set up RabbitMQ connection using aio_pika
-        print('[DEBUG] Connecting to RabbitMQ broker...')
-        self.rabbitmq_connection = await aio_pika.connect_robust(
-            host=BROKER,
-            port=RABBITMQ_PORT,
-            login=BROKERUSER,
-            password=PASSWORD,
-        )
-        self.channel = await self.rabbitmq_connection.channel()
-        # Declare the update_ge_queue
-        self.update_ge_queue = await self.channel.declare_queue(UPDATE_GE_QUEUE, durable=True)
+        self.state = MatchState(opponent_visible=DEBUG)
         
-        self.exchange = await self.channel.declare_exchange(UPDATE_EVERYONE_EXCHANGE, aio_pika.ExchangeType.FANOUT, durable=True)
-        print(f'[DEBUG] Connected to RabbitMQ broker at {BROKER}:{RABBITMQ_PORT}')
+        # Tracks what was last broadcast when delta broadcasts are enabled
+        self.delta_encoder = DeltaEncoder(KEYFRAME_INTERVAL)
         
-        # publish game state once to everyone
-        update_everyone_message = {
-            "game_state": self.game_state,
-            "update": True
-        }
-        update_everyone_message_string = json.dumps(update_everyone_message)
-        # Publish to Exchange
-        await self.exchange.publish(
-            aio_pika.Message(body=update_everyone_message_string.encode('utf-8')),
-            routing_key=''
-        )   
-        print(f'[DEBUG] Published message to RabbitMQ exchange "{UPDATE_EVERYONE_EXCHANGE}": {json.dumps(update_everyone_message, indent = 2)}')
-        
-    async def publish_to_update_eval_server_queue(self, message):
-        # Publish message to update_eval_server_queue
-        message_body = json.dumps(message).encode('utf-8')
-        await self.channel.default_exchange.publish(
-            aio_pika.Message(body=message_body),
-            routing_key=UPDATE_EVAL_SERVER_QUEUE,
-        )
-        # print(f'[DEBUG] Published message to {UPDATE_EVAL_SERVER_QUEUE}: {json.dumps(message, indent = 2)}')
+        # Encoded state shared by every publisher and logger until the next mutation
+        self.snapshot = StateSnapshot(self.state)
+        
+        # Sequence number of the last journal record applied to this match
+        self.journal_seq = 0
+        
+        # Players that cannot act until a timed effect lifts the gate, and pending timers keyed by effect_key()
+        self.respawning = set()
+        self.cooldowns = set()
+        self.timers = {}
+
+    @property
+    def game_state(self):
+        # Projection of the internal state to the JSON wire shape
+        return self.state.to_dict()
 
     def update_internal_game_state(self, incoming_game_state):
-        # Update internal game state with the incoming data
-        changed = False
-        for player_key in ['p1', 'p2']:
-            if player_key in incoming_game_state:
-                for key, value in self.game_state[player_key].items():
-                    # if something changed, update the internal game state
-                    if key in incoming_game_state[player_key] and incoming_game_state[player_key][key] != value:
-                        changed = True
-                self.game_state[player_key].update(incoming_game_state[player_key])
+        # Update internal game state with the incoming data, returns True if something changed
+        if not incoming_game_state:
+            return False
+        extras = self.state.extra_count()
+        changed = self.state.update(incoming_game_state)
+        # New unknown fields do not count as a change but are part of the encoded state
+        if changed or self.state.extra_count() != extras:
+            self.snapshot.invalidate()
         return changed
 
-    def revive_player(self, player_id):
-        player_key = f'p{player_id}'
-        player = self.game_state[player_key]
-        player['hp'] = 100
-        player['deaths'] += 1
-        player['shields'] = 3
-        player['shield_hp'] = 0
-        player['bullets'] = 6
-        player['bombs'] = 2
-        print(f'[DEBUG] Player {player_key[-1]} died and respawned.')
-    
-    def perform_damage(self, player_id, damage):
-        player_key = f'p{player_id}'
-        player = self.game_state[player_key]
-        
-        player_hit = False
-        player_shield_hit = False
-        
-        # perform damage to shield first
-        if player['shield_hp'] > 0:
-            damage_to_shield = min(damage, player['shield_hp'])
-            if damage_to_shield > 0:
-                player_shield_hit = True
-            player['shield_hp'] -= damage_to_shield
-            damage -= damage_to_shield
-            print(f'[DEBUG] Player {player_id}: Damage to shield: {damage_to_shield}. Shield HP left: {player["shield_hp"]}')
-        
-        # perform damage to HP
-        if damage > 0:
-            player_hit = True
-            
-        player['hp'] = max(0, player['hp'] - damage)
-        print(f'[DEBUG] Player {player_id}: Damage to HP: {damage}. HP left: {player["hp"]}')
-        if player['hp'] <= 0:
-            self.revive_player(player_id)
+    def show_opponents(self):
+        # In DEBUG mode both players always see each other
+        if self.state.p1.opponent_visible is True and self.state.p2.opponent_visible is True:
+            return
+        self.snapshot.invalidate()
+        self.state.p1.opponent_visible = True
+        self.state.p2.opponent_visible = True
+
+    def apply_action(self, player_id, action_type, data):
+        # Apply an action with the pure rules core, returns the ActionResult or None if not registered
+        player = self.state.player(player_id)
+        opponent = self.state.opponent(player_id)
         
-        return player_hit, player_shield_hit
+        # If the player is not logged in, do not perform any actions
+        if not player.login:
+            return None
         
-    
-    def perform_action(self, player_id, action_type, data):
-        display = False
-        player_key = f'p{player_id}'
-        opponent_key = 'p1' if player_key == 'p2' else 'p2'
+        player_key = PLAYER_KEYS[player_id]
+        if TIMED_EFFECTS and (player_key in self.respawning or (player_key, action_type) in self.cooldowns):
+            return None
         
-        # If the player is not logged in, do not perform any actions
-        if not self.game_state[player_key]['login']:
-            print(f'[DEBUG] Player {player_id} is not logged in. Cannot perform actions.')
-            return False, display
+        self.snapshot.invalidate()
+        
+        opponent_deaths = opponent.deaths
+        result = resolve_action(
+            player.get_stats(),
+            opponent.get_stats(),
+            action_type,
+            data.get('hit', False),
+            player.opponent_visible,
+            # Timed rain bombs tick on their own timer instead
+            0 if TIMED_EFFECTS and RAIN_BOMB_INTERVAL > 0 else player.opponent_in_rain_bomb,
+        )
+        player.set_stats(result.attacker)
+        opponent.set_stats(result.defender)
+        if result.logout:
+            player.login = DEBUG
+        
+        if TIMED_EFFECTS:
+            if ACTION_COOLDOWN > 0:
+                self.cooldowns.add((player_key, action_type))
+            if RESPAWN_DELAY > 0 and opponent.deaths != opponent_deaths:
+                self.respawning.add(OPPONENT_KEYS[player_key])
+        
+        player.opponent_hit = result.opponent_hit
+        player.opponent_shield_hit = result.opponent_shield_hit
+        return result
+
+    def perform_action(self, player_id, action_type, data):
+        opponent = self.state.opponent(player_id)
+        opponent_id = 1 if opponent is self.state.p1 else 2
+        opponent_deaths = opponent.deaths
         
         # Perform calculations based on action_type
+        result = self.apply_action(player_id, action_type, data)
+        if result is None:
+            log.debug('Player is not logged in, respawning or on cooldown. Cannot perform actions.',
+                      match_id=self.match_id, player_id=player_id, action_type=action_type)
+            return False, False
+        
+        player = self.state.player(player_id)
+        if log.debug_enabled:
+            log.debug('Performed action', match_id=self.match_id, player_id=player_id, action_type=action_type,
+                      registered=result.display, bullets=player.bullets, bombs=player.bombs, shields=player.shields,
+                      opponent_hp=opponent.hp, opponent_shield_hp=opponent.shield_hp)
+        if opponent.deaths != opponent_deaths:
+            log.info('Player %s died and respawned.', opponent_id, match_id=self.match_id)
+        
+        return True, result.display
 
-        player = self.game_state[player_key]
-        opponent = self.game_state[opponent_key]
-
-        # Extract necessary data
-        opponent_visible = player.get('opponent_visible', False)
-        opponent_in_rain_bomb = player.get('opponent_in_rain_bomb', 0)
-        gun_hit = data.get('hit', False) or opponent_visible
-
-        opponent_hit = False
-        opponent_shield_hit = False
-        
-        # Handle rain bomb damage
-        if opponent_visible and opponent_in_rain_bomb > 0:
-            for _ in range(opponent_in_rain_bomb):
-                hit, shield_hit = self.perform_damage(opponent_key[-1], 5)
-                opponent_hit = hit or opponent_hit
-                opponent_shield_hit = shield_hit or opponent_shield_hit
-                print(f'[DEBUG] Player {opponent_key[-1]}: Rain bomb damage: {5}')
-        
-        new_damage = 0
-        
-        # Handle actions
-        if action_type == 'gun':
-            #When player has ammo
-            if player['bullets'] > 0:
-                player['bullets'] -= 1
-                display = True
-                if gun_hit:
-                    new_damage = 5
-                print(f'[DEBUG] Player {player_id} fired a gun. Bullets left: {player["bullets"]}. Hit: {gun_hit}')
-                
-        elif action_type == 'bomb':
-            if player['bombs'] > 0 :
-                display = True
-                # Reduce bombs
-                player['bombs'] -= 1
-                print(f'[DEBUG] Player {player_id} threw a bomb. Bombs left: {player["bombs"]}')
-                if opponent_visible:
-                    # Inflict immediate damage
-                    new_damage = 5
-                    
-        elif action_type == 'reload':
-            # Can only reload if bullets are zero
-            if player['bullets'] == 0:
-                display = True
-                player['bullets'] = 6
-                print(f'[DEBUG] Player {player_id} reloaded. Bullets: {player["bullets"]}')
-                
-        elif action_type == 'shield':
-            if player['shields'] > 0 and player['shield_hp'] == 0:
-                display = True
-                # Reduce shields count
-                player['shields'] -= 1
-                # Reset shield HP
-                player['shield_hp'] = 30
-                print(f'[DEBUG] Player {player_id} activated a shield. Shields left: {player["shields"]}')
-                
-        elif action_type == 'logout':
-            display = True
-            player['login'] = DEBUG
+    def apply_effect(self, data):
+        # Apply a timed effect that became due, returns True if the game state changed
+        effect = data['effect']
+        player_key = PLAYER_KEYS[data['player_id']]
+        player = getattr(self.state, player_key)
+        if effect == 'rain_bomb':
+            if not (player.opponent_visible and player.opponent_in_rain_bomb > 0):
+                return False
+            self.snapshot.invalidate()
+            opponent = getattr(self.state, OPPONENT_KEYS[player_key])
+            opponent_deaths = opponent.deaths
+            stats, hit, shield_hit = rain_bomb_tick(opponent.get_stats(), player.opponent_in_rain_bomb)
+            opponent.set_stats(stats)
+            player.opponent_hit = hit or player.opponent_hit
+            player.opponent_shield_hit = shield_hit or player.opponent_shield_hit
+            if RESPAWN_DELAY > 0 and opponent.deaths != opponent_deaths:
+                self.respawning.add(OPPONENT_KEYS[player_key])
+            return True
+        if effect == 'shield_expiry':
+            if player.shield_hp == 0:
+                return False
+            self.snapshot.invalidate()
+            player.shield_hp = 0
+            return True
+        if effect == 'respawn':
+            self.respawning.discard(player_key)
+        elif effect == 'cooldown':
+            self.cooldowns.discard((player_key, data['action_type']))
+        else:
+            log.warning('Match %s: unknown timed effect "%s"', self.match_id, effect)
+        return False
+
+    def schedule_effects(self, timer_wheel):
+        # Start the timers the state needs and cancel rain bomb and shield timers it no longer needs
+        for player_key in ('p1', 'p2'):
+            player = getattr(self.state, player_key)
+            self.set_timer(timer_wheel, ('rain_bomb', player_key, None), RAIN_BOMB_INTERVAL,
+                           player.opponent_in_rain_bomb > 0)
+            self.set_timer(timer_wheel, ('shield_expiry', player_key, None), SHIELD_DURATION, player.shield_hp > 0)
+        for player_key in self.respawning:
+            self.set_timer(timer_wheel, ('respawn', player_key, None), RESPAWN_DELAY, True)
+        for player_key, action_type in self.cooldowns:
+            self.set_timer(timer_wheel, ('cooldown', player_key, action_type), ACTION_COOLDOWN, True)
+
+    def set_timer(self, timer_wheel, key, delay, wanted):
+        timer = self.timers.get(key)
+        if wanted and timer is None and delay > 0:
+            effect, player_key, action_type = key
+            data = {"match_id": self.match_id, "effect": effect, "player_id": PLAYER_NUMBERS[player_key]}
+            if action_type is not None:
+                data["action_type"] = action_type
+            self.timers[key] = timer_wheel.schedule(delay, data)
+        elif not wanted and timer is not None:
+            timer_wheel.cancel(timer)
+            del self.timers[key]
+
+    def replay(self, data):
+        # Re-apply a journaled message to the state without publishing anything
+        if 'effect' in data:
+            self.apply_effect(data)
+            self.reset_hit_flags()
+            return
+        # Journals written before messages were checked first may hold ones that were rejected live
+        check_message(data)
+        self.update_internal_game_state(data.get('game_state', {}))
+        if DEBUG:
+            self.show_opponents()
+        if data.get('action', False):
+            self.apply_action(data.get('player_id'), data.get('action_type'), data)
+        self.reset_hit_flags()
+
+    def reset_hit_flags(self):
+        # After doing any update, reset the opponent_hit and opponent_shield_hit flags
+        p1 = self.state.p1
+        p2 = self.state.p2
+        if not (p1.opponent_hit or p1.opponent_shield_hit or p2.opponent_hit or p2.opponent_shield_hit):
+            return
+        self.snapshot.invalidate()
+        self.state.p1.opponent_hit = False
+        self.state.p1.opponent_shield_hit = False
+        self.state.p2.opponent_hit = False
+        self.state.p2.opponent_shield_hit = False
+
+    def get_hit_flags(self):
+        p1 = self.state.p1
+        p2 = self.state.p2
+        return [p1.opponent_hit, p1.opponent_shield_hit, p2.opponent_hit, p2.opponent_shield_hit]
+
+    def set_hit_flags(self, flags):
+        self.snapshot.invalidate()
+        p1 = self.state.p1
+        p2 = self.state.p2
+        p1.opponent_hit, p1.opponent_shield_hit, p2.opponent_hit, p2.opponent_shield_hit = flags
+
+class TickStats:
+    def __init__(self, period):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped_ticks = 0
+        self.messages = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.max_lateness = 0.0
+
+    def record(self, duration, lateness, message_count):
+        self.ticks += 1
+        self.messages += message_count
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        self.max_lateness = max(self.max_lateness, lateness)
+        if duration > self.period:
+            self.overruns += 1
+
+    def report(self):
+        average = self.total_duration / self.ticks if self.ticks else 0.0
+        return (f'ticks={self.ticks} messages={self.messages} overruns={self.overruns} '
+                f'skipped={self.skipped_ticks} avg_ms={average * 1000:.2f} max_ms={self.max_duration * 1000:.2f} '
+                f'max_late_ms={self.max_lateness * 1000:.2f} budget_ms={self.period * 1000:.2f}')
+
+class GameEngine:
+    def __init__(self, transport=None, clock=None):
+        # RabbitMQ unless TRANSPORT=local, see transport.py
+        self.transport = transport or create_transport()
+        
+        # Outbound messages are pipelined so match locks are not held across broker round trips
+        self.publisher = Publisher(self.transport)
+        
+        # Timed effects are due on clock, time.monotonic unless a timer_wheel.VirtualClock is given
+        self.clock = clock or time.monotonic
+        self.timer_wheel = TimerWheel(TIMER_TICK_MS / 1000, now=self.clock())
+        self.timer_task = None
+        
+        # Independent matches hosted by this engine, keyed by match_id
+        self.matches = {}
+        self.get_match(DEFAULT_MATCH_ID)
+        
+        # HTTP/WebSocket access to the match states for visualizers, see gateway.py
+        self.gateway = StateGateway(self.matches, DEFAULT_MATCH_ID) if GATEWAY_PORT else None
+        
+        # IDs of recently applied messages, so a redelivered message is not applied twice
+        self.dedup = DedupCache()
+        
+        # Publishes to queues that failed, by the message_id of the delivery that made them, to be made
+        # again when it is redelivered
+        self.unconfirmed = {}
+        
+        # Journal of applied messages for crash recovery
+        self.journal = Journal(JOURNAL_DIR, fsync=JOURNAL_FSYNC) if JOURNAL_DIR else None
+        self.snapshot_task = None
+        
+        # Deliveries waiting for the batch consumer in batch mode, or the next tick in tick mode
+        self.pending_messages = asyncio.Queue()
+        self.batch_task = None
+        
+        # Decoded deliveries waiting in lanes mode, actions are served before the state updates that came after them
+        self.pending_actions = []
+        self.pending_updates = []
+        # Arrival order across both lanes, so updates are never applied after an action they preceded
+        self.lane_seq = 0
+        self.lane_ready = asyncio.Event()
+        self.tick_stats = TickStats(1 / TICK_RATE)
+
+    def get_match(self, match_id):
+        # Matches are created on first use so new arenas need no extra setup
+        match = self.matches.get(match_id)
+        if match is None:
+            match = Match(match_id)
+            self.matches[match_id] = match
+            log.info('Created match "%s"', match_id)
+        return match
+
+    def journal_message(self, match, body):
+        # Called with the match lock held, right before the message is applied
+        if self.journal is None:
+            return
+        match.journal_seq = self.journal.append(body)
+        if self.journal.records_since_snapshot >= SNAPSHOT_INTERVAL and self.snapshot_task is None:
+            self.snapshot_task = asyncio.create_task(self.snapshot_matches())
+
+    async def snapshot_matches(self):
+        try:
+            # Every record appended so far is applied once its match lock can be taken
+            covered_seq = self.journal.seq
+            matches = {}
+            for match in list(self.matches.values()):
+                async with match.lock:
+                    matches[match.match_id] = (match.journal_seq, match.state.to_dict())
+            self.journal.snapshot(covered_seq, matches)
+            log.debug('Queued snapshot of %d matches at journal seq %d', len(matches), covered_seq)
+        finally:
+            self.snapshot_task = None
+
+    def restore_from_journal(self):
+        # Restore every match from the latest snapshot plus the journal tail, returns True if anything was restored
+        if self.journal is None:
+            return False
+        if JOURNAL_RESET:
+            self.journal.reset()
+            log.info('Discarded journal in %s', JOURNAL_DIR)
+            return False
+        
+        start = time.perf_counter()
+        snapshot, records = self.journal.load()
+        if snapshot is None and not records:
+            return False
+        
+        if snapshot is not None:
+            for match_id, saved in snapshot['matches'].items():
+                match = self.get_match(match_id)
+                match.state.update(saved['game_state'])
+                match.journal_seq = saved['seq']
+        
+        replayed = 0
+        for seq, body in records:
+            # Bodies are journaled as received, in either wire format
+            data = decode(body)
+            # Messages applied before the restart may be redelivered now
+            if 'message_id' in data:
+                self.dedup.seen(data['message_id'])
+            match = self.get_match(data.get('match_id', DEFAULT_MATCH_ID))
+            if seq <= match.journal_seq:
+                continue
+            try:
+                match.replay(data)
+            except Exception as e:
+                # Rejected when it was received, so it left the state as it was then
+                log.warning('Skipped journal record %d that could not be applied: %s', seq, e)
+            match.journal_seq = seq
+            replayed += 1
+        
+        elapsed = time.perf_counter() - start
+        log.info('Restored %d matches from journal in %.1f ms (snapshot seq %d, replayed %d of %d records)',
+                 len(self.matches), elapsed * 1000, snapshot['seq'] if snapshot else 0, replayed, len(records))
+        return True
+
+    async def setup_transport(self):
+        await self.transport.connect()
+        # Independent declarations, made at once
+        await asyncio.gather(
+            self.transport.declare_queue(UPDATE_GE_QUEUE),
+            self.transport.declare_queue(UPDATE_GE_ACTION_QUEUE),
+            self.transport.declare_exchange(UPDATE_EVERYONE_EXCHANGE),
+        )
+        
+        # publish game state of every hosted match once to everyone
+        for match in self.matches.values():
+            match.delta_encoder.request_keyframe()
+            message_body = await self.publish_to_update_everyone_exchange(match, {"update": True})
+            log.info('Published message to RabbitMQ exchange "%s": %s', UPDATE_EVERYONE_EXCHANGE, message_body)
+        
+    async def publish_to_update_everyone_exchange(self, match, update_everyone_message):
+        # Attach the match's game state, as a delta against the previous broadcast when enabled
+        update_everyone_message["match_id"] = match.match_id
+        if self.gateway is not None:
+            # Gateway clients always get the full state, so a slow one can skip to the latest
+            self.gateway.broadcast(match, update_everyone_message)
+        if DELTA_BROADCASTS:
+            seq, keyframe, game_state = match.delta_encoder.encode(match.state)
+            update_everyone_message["seq"] = seq
+            update_everyone_message["keyframe"] = keyframe
+            update_everyone_message["game_state"] = game_state
+            message_body, content_type = encode(update_everyone_message, WIRE_FORMAT)
+        elif WIRE_FORMAT == 'msgpack':
+            # Reuse the state encoded once for this mutation
+            message_body = splice_packed(update_everyone_message, match.snapshot.get_state_packed())
+            content_type = MSGPACK_CONTENT_TYPE
+        else:
+            message_body = splice_game_state(update_everyone_message, match.snapshot.get_state_json())
+            content_type = JSON_CONTENT_TYPE
+        # Publish to Exchange
+        await self.publisher.publish_exchange(UPDATE_EVERYONE_EXCHANGE, message_body, content_type)
+        return message_body
+
+    async def publish_to_update_eval_server_queue(self, match, action_type, player_id):
+        # Publish message to update_eval_server_queue, the eval server projection is cached like the full state
+        update_eval_server_message = {
+            "match_id": match.match_id,
+            "message_id": new_message_id(),
+            "action": action_type,
+            "player_id": player_id
+        }
+        if WIRE_FORMAT == 'msgpack':
+            message_body = splice_packed(update_eval_server_message, match.snapshot.get_eval_packed())
+            content_type = MSGPACK_CONTENT_TYPE
+        else:
+            message_body = splice_game_state(update_eval_server_message, match.snapshot.get_eval_json())
+            content_type = JSON_CONTENT_TYPE
+        await self.publisher.publish(UPDATE_EVAL_SERVER_QUEUE, message_body, content_type)
+        log.debug('Published message to %s', UPDATE_EVAL_SERVER_QUEUE, match_id=match.match_id, body=message_body)
+        return message_body
+
+    def is_duplicate(self, data):
+        message_id = data.get('message_id')
+        if message_id is None or not self.dedup.seen(message_id):
+            return False
+        log.info('Skipping already applied message %s', message_id)
+        return True
+
+    async def settle(self, message, data, *receipts):
+        # Ack a delivery once the publishes it made are confirmed, or requeue it
+        failed = [publish for receipt in receipts for publish in await receipt.failed()]
+        if not failed:
+            await message.ack()
+            return
+        message_id = data.get('message_id')
+        if message_id is None:
+            # A redelivery would be applied twice, so the lost publishes are only reported
+            log.error('Publishes of a message without message_id failed', match_id=data.get('match_id'))
+            await message.ack()
+            return
+        # The redelivery is skipped as a duplicate, so the failed publishes to queues are made again then;
+        # a failed broadcast is superseded by the next one
+        resend = [publish for publish in failed if publish[1] != UPDATE_EVERYONE_EXCHANGE]
+        if resend:
+            self.unconfirmed[message_id] = resend
+        log.warning('Requeued message %s, %d of its publishes failed', message_id, len(failed))
+        await message.reject(requeue=True)
+
+    async def settle_duplicate(self, message, data):
+        publishes = self.unconfirmed.pop(data['message_id'], None)
+        if publishes is None:
+            await message.ack()
+            return
+        with self.publisher.recording() as receipt:
+            await self.publisher.resend(publishes)
+        await self.settle(message, data, receipt)
+
+    async def process_message(self, message):
+        # Settled here rather than on exit once the message is applied, see settle()
+        async with message.process(ignore_processed=True):
+            log.debug('Received message from RabbitMQ queue "%s"', UPDATE_GE_QUEUE, body=message.body)
+            data = decode_message(message)
+            if self.is_duplicate(data):
+                await self.settle_duplicate(message, data)
+                return
+
+            # Messages without a match_id belong to the default match
+            match = self.get_match(data.get('match_id', DEFAULT_MATCH_ID))
+
+            with self.publisher.recording() as receipt:
+                async with match.lock:  # Ensures only one message per match is processed at a time
+                    # Rejected messages are not journaled, so they cannot change the recovered state either
+                    check_message(data)
+                    self.journal_message(match, message.body)
+                    await self.process_match_message(match, data)
+                    if TIMED_EFFECTS:
+                        match.schedule_effects(self.timer_wheel)
+            # The confirms are awaited without the lock, so the next message of the match is applied meanwhile
+            await self.settle(message, data, receipt)
+
+    async def process_match_message(self, match, data):
+        action_performed = data.get("action", False)
+        to_update = data.get("update", False)
+        player_id = data.get('player_id')
+        action_type = data.get('action_type')
+        incoming_game_state = data.get('game_state', {})
+        forced_update = data.get('f', False)
+        keyframe_requested = data.get('keyframe', False)
+
+        # Update internal game state with non-action-related info
+        to_update = match.update_internal_game_state(incoming_game_state) or forced_update
+        
+        if keyframe_requested:
+            # A receiver missed a broadcast, answer with the full state
+            match.delta_encoder.request_keyframe()
+            to_update = True
+        
+        if DEBUG:
+            match.show_opponents()
+        
+        if action_performed:
+            # Perform action calculations before updating internal state
+            action_registered, display = match.perform_action(player_id, action_type, data)
+            if not action_registered:
+                return
             
-        elif action_type in ['basket', 'volley', "soccer", "bowl"]:
-            display = True
-            # AI actions inflict damage only if opponent is visible
-            if opponent_visible:
-                new_damage = 10
-
-        hit, shield_hit = self.perform_damage(opponent_key[-1], new_damage)
-        opponent_hit = hit or opponent_hit
-        opponent_shield_hit = shield_hit or opponent_shield_hit
-        
-        player['opponent_hit'] = opponent_hit
-        player['opponent_shield_hit'] = opponent_shield_hit
-        
-        return True, display
-
-    async def process_message(self, message: aio_pika.IncomingMessage):
-        async with self.lock:  # Ensures only one process runs at a time
-            async with message.process():
-                print(f'[DEBUG] Received message from RabbitMQ queue "{UPDATE_GE_QUEUE}"')
-                data = json.loads(message.body.decode('utf-8'))
-                print(f'[DEBUG] Message content:\n{json.dumps(data, indent=2)}')
-
-                action_performed = data.get("action", False)
-                to_update = data.get("update", False)
-                player_id = data.get('player_id')
-                action_type = data.get('action_type')
-                incoming_game_state = data.get('game_state', {})
-                forced_update = data.get('f', False)
-
-                # Update internal game state with non-action-related info
-                to_update = self.update_internal_game_state(incoming_game_state) or forced_update
-                
-                if DEBUG:
-                    self.game_state['p1']['opponent_visible'] = True
-                    self.game_state['p2']['opponent_visible'] = True
+            # Prepare message to publish
+            update_everyone_message = {}
+
+            if display:
+                update_everyone_message["action"] = action_type
+                update_everyone_message["player_id"] = player_id
                 
-                if action_performed:
-                    # Perform action calculations before updating internal state
-                    action_registered, display = self.perform_action(player_id, action_type, data)
-                    if not action_registered:
-                        return
-                    
-                    # Prepare message to publish
-                    update_everyone_message = {
-                        "game_state": self.game_state
-                    }
-
-                    if display:
-                        update_everyone_message["action"] = action_type
-                        update_everyone_message["player_id"] = player_id
-                        
-                    update_everyone_message_string = json.dumps(update_everyone_message)
-                    
-                    # Publish to Exchange
-                    await self.exchange.publish(
-                        aio_pika.Message(body=update_everyone_message_string.encode('utf-8')),
-                        routing_key=''
-                    )
-                    
-                    update_everyone_message["action"] = action_type
-                    update_everyone_message["player_id"] = player_id
-                    
-                    # Publish to update_eval_server_queue
-                    await self.publish_to_update_eval_server_queue(update_everyone_message)
-                    
-                    
-                    print(f'[DEBUG] Published message to RabbitMQ exchange "{UPDATE_EVERYONE_EXCHANGE}": {json.dumps(update_everyone_message, indent = 2)}')
-                elif to_update:
-                    # Prepare message to publish
-                    
-                    update_everyone_message = {
-                        "game_state": self.game_state
-                    }
-                    update_everyone_message_string = json.dumps(update_everyone_message)
-                    # Publish to Exchange
-                    await self.exchange.publish(
-                        aio_pika.Message(body=update_everyone_message_string.encode('utf-8')),
-                        routing_key=''
-                    )
-                    # print(f'[DEBUG] Published message to RabbitMQ exchange "{UPDATE_EVERYONE_EXCHANGE}": {json.dumps(update_everyone_message, indent = 2)}')
+            # Publish to Exchange
+            message_body = await self.publish_to_update_everyone_exchange(match, update_everyone_message)
+            
+            # Publish to update_eval_server_queue
+            await self.publish_to_update_eval_server_queue(match, action_type, player_id)
+            
+            
+            log.debug('Published message to RabbitMQ exchange "%s"', UPDATE_EVERYONE_EXCHANGE, match_id=match.match_id,
+                      body=message_body)
+        elif to_update:
+            # Publish to Exchange
+            message_body = await self.publish_to_update_everyone_exchange(match, {})
+            log.debug('Published message to RabbitMQ exchange "%s"', UPDATE_EVERYONE_EXCHANGE, match_id=match.match_id,
+                      body=message_body)
+        else:
+            # Only update internal game state without sending messages
+            log.debug('Updated internal game state without sending any messages')
+        
+        match.reset_hit_flags()
+
+    async def enqueue_message(self, message):
+        # Batch mode consumer callback, the message is acked once its batch has been applied
+        await self.pending_messages.put(message)
+
+    async def collect_batch(self):
+        # Wait for one message, then take up to BATCH_SIZE within BATCH_WINDOW_MS
+        loop = asyncio.get_running_loop()
+        batch = [await self.pending_messages.get()]
+        deadline = loop.time() + BATCH_WINDOW_MS / 1000
+        while len(batch) < BATCH_SIZE:
+            if not self.pending_messages.empty():
+                batch.append(self.pending_messages.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.pending_messages.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def enqueue_action(self, message):
+        # Lanes mode consumer of the action queue
+        data = await self.decode_delivery(message)
+        if data is not None:
+            self.lane_seq += 1
+            self.pending_actions.append((self.lane_seq, message, data))
+            self.lane_ready.set()
+
+    async def enqueue_update(self, message):
+        # Lanes mode consumer of update_ge_queue, where single-queue producers still send their actions
+        data = await self.decode_delivery(message)
+        if data is None:
+            return
+        self.lane_seq += 1
+        if data.get('action', False):
+            self.pending_actions.append((self.lane_seq, message, data))
+        else:
+            self.pending_updates.append((self.lane_seq, message, data))
+        self.lane_ready.set()
+
+    async def serve_lanes(self):
+        while True:
+            await self.lane_ready.wait()
+            self.lane_ready.clear()
+            while self.pending_actions or self.pending_updates:
+                if self.pending_actions:
+                    actions, self.pending_actions = self.pending_actions, []
+                    # Actions skip ahead of the updates that came after them, but not of the ones before them
+                    last_action = actions[-1][0]
+                    earlier = 0
+                    while earlier < len(self.pending_updates) and self.pending_updates[earlier][0] < last_action:
+                        earlier += 1
+                    batch = sorted(actions + self.pending_updates[:earlier], key=itemgetter(0))
+                    del self.pending_updates[:earlier]
+                    log.debug('Serving %d actions with %d earlier state updates', len(actions), earlier)
                 else:
-                    # Only update internal game state without sending messages
-                    # print(f'Game state updated internally: {json.dumps(self.game_state, indent=2)}')
-                    print('[DEBUG] Updated internal game state without sending any messages')
-                
-                # After doing any update, reset the opponent_hit and opponent_shield_hit flags
-                self.game_state['p1']['opponent_hit'] = False
-                self.game_state['p1']['opponent_shield_hit'] = False
-                self.game_state['p2']['opponent_hit'] = False
-                self.game_state['p2']['opponent_shield_hit'] = False
+                    # Everything that piled up while actions were served is merged into one broadcast per match
+                    batch, self.pending_updates = self.pending_updates, []
+                    log.debug('Serving %d coalesced state updates', len(batch))
+                await self.apply_decoded([(message, data) for _, message, data in batch])
 
-    async def run(self):
-        # Create instance of QueuePurger and purge the queues before running the game engine
-        purger = purge_queues.QueuePurger()
-        print('[DEBUG] Purging queues before starting the game engine...')
-        await purger.run_purge()  # Purge the queues
+    async def drain_batches(self):
+        while True:
+            batch = await self.collect_batch()
+            log.debug('Draining batch of %d messages from "%s"', len(batch), UPDATE_GE_QUEUE)
+            await self.apply_batch(batch)
+
+    async def run_ticks(self):
+        # Apply everything buffered since the previous tick at a fixed rate
+        loop = asyncio.get_running_loop()
+        period = 1 / TICK_RATE
+        next_tick = loop.time() + period
+        next_report = loop.time() + TICK_STATS_INTERVAL
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            tick_start = loop.time()
+            
+            batch = []
+            while not self.pending_messages.empty():
+                batch.append(self.pending_messages.get_nowait())
+            if batch:
+                await self.apply_batch(batch)
+            
+            now = loop.time()
+            self.tick_stats.record(now - tick_start, tick_start - next_tick, len(batch))
+            next_tick += period
+            if now > next_tick:
+                # Overran into the following tick(s), skip them instead of bursting to catch up
+                skipped = int((now - next_tick) // period) + 1
+                self.tick_stats.skipped_ticks += skipped
+                next_tick += skipped * period
+                log.warning('Tick overran by %.2f ms, skipped %d tick(s)', (now - tick_start - period) * 1000, skipped)
+            
+            if now >= next_report:
+                log.info('Tick stats: %s', self.tick_stats.report())
+                self.tick_stats.reset()
+                next_report = now + TICK_STATS_INTERVAL
+
+    async def decode_delivery(self, message):
+        # Returns the decoded message, or None once an undecodable or duplicate message is settled
+        try:
+            data = decode_message(message)
+        except Exception as e:
+            log.error('Could not decode message: %s', e)
+            await message.reject()
+            return None
+        if self.is_duplicate(data):
+            await self.settle_duplicate(message, data)
+            return None
+        return data
+
+    async def apply_batch(self, batch):
+        decoded = []
+        for message in batch:
+            data = await self.decode_delivery(message)
+            if data is not None:
+                decoded.append((message, data))
+        await self.apply_decoded(decoded)
+
+    async def apply_decoded(self, decoded):
+        # Group messages by match, keeping their original order
+        match_batches = {}
+        for message, data in decoded:
+            match_id = data.get('match_id', DEFAULT_MATCH_ID)
+            match_batches.setdefault(match_id, []).append((message, data))
         
-        # print the starting game state
-        print(f'[DEBUG] Starting game state: {json.dumps(self.game_state, indent=2)}')
+        await asyncio.gather(*(
+            self.process_batch(self.get_match(match_id), messages)
+            for match_id, messages in match_batches.items()
+        ))
+
+    async def process_batch(self, match, messages):
+        # The eval server publishes of each message, the batch broadcast is in receipt
+        receipts = {}
+        try:
+            with self.publisher.recording() as receipt:
+                async with match.lock:  # One lock acquisition for the whole batch of this match
+                    for message, data in messages:
+                        if is_valid(data):
+                            self.journal_message(match, message.body)
+                    failed = await self.process_match_batch(match, [data for _, data in messages], receipts)
+                    if TIMED_EFFECTS:
+                        match.schedule_effects(self.timer_wheel)
+        except Exception as e:
+            log.error('Failed to process batch: %s', e, match_id=match.match_id)
+            for message, _ in messages:
+                await message.reject()
+            return
+        # Like in event mode, only the messages that could not be applied are rejected, and the others are
+        # acked once their publishes are confirmed
+        for index, (message, data) in enumerate(messages):
+            if index in failed:
+                await message.reject()
+            else:
+                await self.settle(message, data, receipt, *receipts.get(index, ()))
+
+    async def process_match_batch(self, match, batch, receipts):
+        # Apply every message of the batch and broadcast once, returns the indices of the messages that failed.
+        # The publishes made for the message at index are recorded in receipts[index]
+        failed = set()
+        to_update = False
+        displayed_actions = []
+        hit_flags = [False, False, False, False]
         
-        await self.setup_rabbitmq()
+        # Consecutive state-only updates are merged last-write-wins and applied before the next action
+        merged_game_state = {}
+        
+        for index, data in enumerate(batch):
+            try:
+                check_message(data)
+            except Exception as e:
+                log.error('Rejected message: %s', e, match_id=match.match_id)
+                failed.add(index)
+                continue
+            
+            incoming_game_state = data.get('game_state', {})
+            for player_key, player_state in incoming_game_state.items():
+                merged_game_state.setdefault(player_key, {}).update(player_state)
+            to_update = data.get('f', False) or to_update
+            if data.get('keyframe', False):
+                match.delta_encoder.request_keyframe()
+                to_update = True
+            
+            if not data.get('action', False):
+                continue
+            
+            # Actions are applied in their original order on top of the state sent before them
+            to_update = match.update_internal_game_state(merged_game_state) or to_update
+            merged_game_state = {}
+            if DEBUG:
+                match.show_opponents()
+            if TIMED_EFFECTS:
+                # Timers follow the state around every action like in event mode, so a shield broken and
+                # raised again within the batch does not keep the timer of the broken one
+                match.schedule_effects(self.timer_wheel)
+            
+            player_id = data.get('player_id')
+            action_type = data.get('action_type')
+            try:
+                action_registered, display = match.perform_action(player_id, action_type, data)
+            except Exception as e:
+                log.error('Failed to apply action: %s', e, match_id=match.match_id, player_id=player_id,
+                          action_type=action_type)
+                failed.add(index)
+                continue
+            if not action_registered:
+                continue
+            to_update = True
+            if display:
+                displayed_actions.append({"player_id": player_id, "action": action_type})
+            
+            # The evaluation server still gets one message per action with the state right after it
+            with self.publisher.recording() as action_receipt:
+                await self.publish_to_update_eval_server_queue(match, action_type, player_id)
+            receipts[index] = (action_receipt,)
+            
+            # Hits are reported once in the batch broadcast
+            hit_flags = [old or new for old, new in zip(hit_flags, match.get_hit_flags())]
+            match.reset_hit_flags()
+            if TIMED_EFFECTS:
+                match.schedule_effects(self.timer_wheel)
+        
+        to_update = match.update_internal_game_state(merged_game_state) or to_update
+        if DEBUG:
+            match.show_opponents()
+        
+        if not to_update:
+            log.debug('Updated internal game state without sending any messages')
+            return failed
+        
+        # One broadcast for the whole batch
+        update_everyone_message = {}
+        if displayed_actions:
+            update_everyone_message.update(displayed_actions[-1])
+            if len(displayed_actions) > 1:
+                update_everyone_message["actions"] = displayed_actions
+        if any(hit_flags):
+            match.set_hit_flags(hit_flags)
+        message_body = await self.publish_to_update_everyone_exchange(match, update_everyone_message)
+        log.debug('Published message to RabbitMQ exchange "%s"', UPDATE_EVERYONE_EXCHANGE, match_id=match.match_id,
+                  body=message_body)
+        
+        match.reset_hit_flags()
+        return failed
+
+    async def run_timers(self):
+        while True:
+            await asyncio.sleep(TIMER_TICK_MS / 1000)
+            await self.fire_timers()
+
+    async def fire_timers(self):
+        # Apply the effects due by now, grouped so each match is locked and broadcast once
+        match_effects = {}
+        for data in self.timer_wheel.advance(self.clock()):
+            match_effects.setdefault(data['match_id'], []).append(data)
+        await asyncio.gather(*(
+            self.apply_effects(self.get_match(match_id), effects)
+            for match_id, effects in match_effects.items()
+        ))
+
+    async def apply_effects(self, match, effects):
+        async with match.lock:
+            applied = []
+            for data in effects:
+                match.timers.pop(effect_key(data), None)
+                self.journal_message(match, encode(data)[0])
+                if match.apply_effect(data):
+                    applied.append(data['effect'])
+            # Periodic effects such as rain bomb ticks are rescheduled here
+            match.schedule_effects(self.timer_wheel)
+            if applied:
+                message_body = await self.publish_to_update_everyone_exchange(match, {"effects": applied})
+                log.debug('Published message to RabbitMQ exchange "%s"', UPDATE_EVERYONE_EXCHANGE, match_id=match.match_id,
+                          body=message_body)
+            match.reset_hit_flags()
 
-        # Start consuming messages
-        await self.update_ge_queue.consume(self.process_message)
-        print(f'[DEBUG] Started consuming messages from {UPDATE_GE_QUEUE}')
+    def restore(self):
+        # Resume a match that was in progress when the engine stopped
+        restored = self.restore_from_journal()
+        if self.journal is not None:
+            self.journal.start()
+        
+        if restored:
+            # Messages still queued belong to the restored match, so keep them
+            log.info('Resuming from journal, skipping queue purge')
+            for match in self.matches.values():
+                log.info('Restored game state of match "%s": %s', match.match_id, match.snapshot.get_state_json())
+        else:
+            # Log the starting game state
+            log.info('Starting game state: %s', MatchState(opponent_visible=DEBUG).to_dict())
+        return restored
+
+    async def start(self):
+        # Declare the queues and start consuming, the queues must have been purged unless the match was restored
+        await self.setup_transport()
+        
+        if self.gateway is not None:
+            await self.gateway.start()
+        
+        if TIMED_EFFECTS:
+            # Timers do not survive a restart, so start the ones the restored state needs
+            for match in self.matches.values():
+                match.schedule_effects(self.timer_wheel)
+            self.timer_task = asyncio.create_task(self.run_timers())
+
+        # Start consuming messages from both lanes
+        if ENGINE_MODE == 'lanes':
+            self.batch_task = asyncio.create_task(self.serve_lanes())
+            await asyncio.gather(
+                self.transport.consume(UPDATE_GE_ACTION_QUEUE, self.enqueue_action, PREFETCH_COUNT),
+                self.transport.consume(UPDATE_GE_QUEUE, self.enqueue_update, PREFETCH_COUNT),
+            )
+        else:
+            # Batch and tick mode ack a delivery once its batch is applied, so a prefetch window would cap every
+            # batch or tick at PREFETCH_COUNT messages; their consumers take deliveries without a limit
+            prefetch_count = None
+            if ENGINE_MODE == 'batch':
+                self.batch_task = asyncio.create_task(self.drain_batches())
+                callback = self.enqueue_message
+            elif ENGINE_MODE == 'tick':
+                self.batch_task = asyncio.create_task(self.run_ticks())
+                callback = self.enqueue_message
+            else:
+                callback = self.process_message
+                prefetch_count = PREFETCH_COUNT
+            await asyncio.gather(
+                self.transport.consume(UPDATE_GE_ACTION_QUEUE, callback, prefetch_count),
+                self.transport.consume(UPDATE_GE_QUEUE, callback, prefetch_count),
+            )
+        log.info('Started consuming messages from %s and %s in %s mode', UPDATE_GE_ACTION_QUEUE, UPDATE_GE_QUEUE,
+                 ENGINE_MODE)
+
+    async def run(self):
+        if not self.restore():
+            # Create instance of QueuePurger and purge the queues before running the game engine
+            purger = purge_queues.QueuePurger(self.transport)
+            log.info('Purging queues before starting the game engine...')
+            await purger.run_purge()  # Purge the queues
+        
+        await self.start()
         # Keep the program running
         await asyncio.Future()
 
@@ -394,6 +1018,9 @@ if __name__ == '__main__':
     try:
         asyncio.run(game_engine.run())
     except KeyboardInterrupt:
-        print('[DEBUG] Game engine stopped by user')
+        log.info('Game engine stopped by user')
     except Exception as e:
-        print(f'[ERROR] {e}')
+        log.error('%s', e)
+    finally:
+        if game_engine.journal is not None:
+            game_engine.journal.close()  # Write out any journal records still queued
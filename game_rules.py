@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+from game_state import MAX_HP, MAX_BULLETS, MAX_BOMBS, MAX_SHIELDS, MAX_SHIELD_HP
+
+# Pure game rules shared by the game engine and the vectorized batch simulator.
+# A player's combat stats are a tuple in the same order as the first fields of PLAYER_FIELDS.
+STAT_FIELDS = ('hp', 'bullets', 'bombs', 'shield_hp', 'deaths', 'shields')
+HP, BULLETS, BOMBS, SHIELD_HP, DEATHS, SHIELDS = range(len(STAT_FIELDS))
+
+INITIAL_STATS = (MAX_HP, MAX_BULLETS, MAX_BOMBS, 0, 0, MAX_SHIELDS)
+
+GUN_DAMAGE = 5
+BOMB_DAMAGE = 5
+RAIN_BOMB_DAMAGE = 5
+AI_ACTION_DAMAGE = 10
+
+AI_ACTIONS = ('basket', 'volley', 'soccer', 'bowl')
+
+# Outcome of one action; attacker and defender are the new stats tuples
+ActionResult = namedtuple('ActionResult', [
+    'attacker',
+    'defender',
+    'display',
+    'opponent_hit',
+    'opponent_shield_hit',
+    'logout',
+])
+
+def revive(stats):
+    return (MAX_HP, MAX_BULLETS, MAX_BOMBS, 0, stats[DEATHS] + 1, MAX_SHIELDS)
+
+def damage(stats, amount):
+    """Apply damage to the shield first, then HP, reviving on 0 HP. Returns (stats, hit, shield_hit)."""
+    hp, bullets, bombs, shield_hp, deaths, shields = stats
+    shield_hit = False
+    if shield_hp > 0:
+        damage_to_shield = min(amount, shield_hp)
+        if damage_to_shield > 0:
+            shield_hit = True
+        shield_hp -= damage_to_shield
+        amount -= damage_to_shield
+    hit = amount > 0
+    hp = max(0, hp - amount)
+    stats = (hp, bullets, bombs, shield_hp, deaths, shields)
+    if hp <= 0:
+        stats = revive(stats)
+    return stats, hit, shield_hit
+
+def rain_bomb_tick(defender, opponent_in_rain_bomb):
+    """Damage of one tick of every rain bomb the opponent stands in. Returns (stats, hit, shield_hit)."""
+    hit = False
+    shield_hit = False
+    for _ in range(opponent_in_rain_bomb):
+        defender, hit_now, shield_hit_now = damage(defender, RAIN_BOMB_DAMAGE)
+        hit = hit_now or hit
+        shield_hit = shield_hit_now or shield_hit
+    return defender, hit, shield_hit
+
+def resolve_action(attacker, defender, action_type, hit, opponent_visible, opponent_in_rain_bomb):
+    """Resolve one action of a logged in player against the opponent's stats."""
+    display = False
+    logout = False
+    opponent_hit = False
+    opponent_shield_hit = False
+    gun_hit = hit or opponent_visible
+
+    # Rain bombs the opponent stands in tick once per action while the opponent is visible
+    if opponent_visible and opponent_in_rain_bomb > 0:
+        defender, opponent_hit, opponent_shield_hit = rain_bomb_tick(defender, opponent_in_rain_bomb)
+
+    hp, bullets, bombs, shield_hp, deaths, shields = attacker
+    new_damage = 0
+
+    if action_type == 'gun':
+        if bullets > 0:
+            bullets -= 1
+            display = True
+            if gun_hit:
+                new_damage = GUN_DAMAGE
+    elif action_type == 'bomb':
+        if bombs > 0:
+            display = True
+            bombs -= 1
+            if opponent_visible:
+                new_damage = BOMB_DAMAGE
+    elif action_type == 'reload':
+        # Can only reload if bullets are zero
+        if bullets == 0:
+            display = True
+            bullets = MAX_BULLETS
+    elif action_type == 'shield':
+        if shields > 0 and shield_hp == 0:
+            display = True
+            shields -= 1
+            shield_hp = MAX_SHIELD_HP
+    elif action_type == 'logout':
+        display = True
+        logout = True
+    elif action_type in AI_ACTIONS:
+        display = True
+        # AI actions inflict damage only if opponent is visible
+        if opponent_visible:
+            new_damage = AI_ACTION_DAMAGE
+
+    attacker = (hp, bullets, bombs, shield_hp, deaths, shields)
+    defender, hit_now, shield_hit_now = damage(defender, new_damage)
+    opponent_hit = hit_now or opponent_hit
+    opponent_shield_hit = shield_hit_now or opponent_shield_hit
+
+    return ActionResult(attacker, defender, display, opponent_hit, opponent_shield_hit, logout)
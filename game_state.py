@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+import json
+from operator import attrgetter
+import msgpack
+
+# Fields of a single player's state, in the same order as the JSON wire shape
+PLAYER_FIELDS = (
+    'hp',
+    'bullets',
+    'bombs',
+    'shield_hp',
+    'deaths',
+    'shields',
+    'opponent_hit',  # Visualizer shows when opponent is damaged
+    'opponent_shield_hit',  # Visualizer shows when opponent's shield is damaged
+    'opponent_visible',
+    'opponent_in_rain_bomb',  # Counter for rain bombs
+    'glove_connected',
+    'vest_connected',
+    'leg_connected',
+    'login',
+    'profile_pic',
+)
+
+# Explicit field indices into PLAYER_FIELDS / PlayerState.as_tuple()
+(
+    HP,
+    BULLETS,
+    BOMBS,
+    SHIELD_HP,
+    DEATHS,
+    SHIELDS,
+    OPPONENT_HIT,
+    OPPONENT_SHIELD_HIT,
+    OPPONENT_VISIBLE,
+    OPPONENT_IN_RAIN_BOMB,
+    GLOVE_CONNECTED,
+    VEST_CONNECTED,
+    LEG_CONNECTED,
+    LOGIN,
+    PROFILE_PIC,
+) = range(len(PLAYER_FIELDS))
+
+PLAYER_FIELD_INDEX = {field: index for index, field in enumerate(PLAYER_FIELDS)}
+
+# Player ids arrive as ints from most producers but as strings from some
+PLAYER_KEYS = {1: 'p1', 2: 'p2', '1': 'p1', '2': 'p2'}
+
+MAX_HP = 100
+MAX_BULLETS = 6
+MAX_BOMBS = 2
+MAX_SHIELDS = 3
+MAX_SHIELD_HP = 30
+
+_player_values = attrgetter(*PLAYER_FIELDS)
+
+class PlayerState:
+    # One slot per field plus 'extra' for fields nodes send that the engine does not model
+    __slots__ = PLAYER_FIELDS + ('extra',)
+
+    def __init__(self, opponent_visible=False):
+        self.hp = MAX_HP
+        self.bullets = MAX_BULLETS
+        self.bombs = MAX_BOMBS
+        self.shield_hp = 0
+        self.deaths = 0
+        self.shields = MAX_SHIELDS
+        self.opponent_hit = False
+        self.opponent_shield_hit = False
+        self.opponent_visible = opponent_visible
+        self.opponent_in_rain_bomb = 0
+        self.glove_connected = False
+        self.vest_connected = False
+        self.leg_connected = False
+        self.login = True
+        self.profile_pic = 0
+        self.extra = None
+
+    def as_tuple(self):
+        """Field values in PLAYER_FIELDS order."""
+        return _player_values(self)
+
+    def get_stats(self):
+        """Combat stats tuple (hp, bullets, bombs, shield_hp, deaths, shields) used by game_rules."""
+        return (self.hp, self.bullets, self.bombs, self.shield_hp, self.deaths, self.shields)
+
+    def set_stats(self, stats):
+        self.hp, self.bullets, self.bombs, self.shield_hp, self.deaths, self.shields = stats
+
+    def update(self, incoming):
+        """Apply incoming wire fields and return True if any value changed."""
+        changed = False
+        for key, value in incoming.items():
+            if key in PLAYER_FIELD_INDEX:
+                if getattr(self, key) != value:
+                    setattr(self, key, value)
+                    changed = True
+            else:
+                # Unknown fields are kept and relayed unchanged, like the old dict state did
+                if self.extra is None:
+                    self.extra = {}
+                elif key in self.extra and self.extra[key] != value:
+                    changed = True
+                self.extra[key] = value
+        return changed
+
+    def to_dict(self):
+        """Project to the JSON wire shape used by nodes and the eval client."""
+        state = {
+            'hp': self.hp,
+            'bullets': self.bullets,
+            'bombs': self.bombs,
+            'shield_hp': self.shield_hp,
+            'deaths': self.deaths,
+            'shields': self.shields,
+            'opponent_hit': self.opponent_hit,
+            'opponent_shield_hit': self.opponent_shield_hit,
+            'opponent_visible': self.opponent_visible,
+            'opponent_in_rain_bomb': self.opponent_in_rain_bomb,
+            'glove_connected': self.glove_connected,
+            'vest_connected': self.vest_connected,
+            'leg_connected': self.leg_connected,
+            'login': self.login,
+            'profile_pic': self.profile_pic,
+        }
+        if self.extra:
+            state.update(self.extra)
+        return state
+
+    def to_eval_dict(self):
+        """Project to the fields the evaluation server checks."""
+        return {
+            'hp': self.hp,
+            'bullets': self.bullets,
+            'bombs': self.bombs,
+            'shield_hp': self.shield_hp,
+            'deaths': self.deaths,
+            'shields': self.shields,
+        }
+
+class MatchState:
+    __slots__ = ('p1', 'p2')
+
+    def __init__(self, opponent_visible=False):
+        self.p1 = PlayerState(opponent_visible)
+        self.p2 = PlayerState(opponent_visible)
+
+    def player(self, player_id):
+        return getattr(self, PLAYER_KEYS[player_id])
+
+    def opponent(self, player_id):
+        return self.p2 if PLAYER_KEYS[player_id] == 'p1' else self.p1
+
+    def extra_count(self):
+        return len(self.p1.extra or ()) + len(self.p2.extra or ())
+
+    def update(self, incoming_game_state):
+        """Apply an incoming wire game_state and return True if anything changed."""
+        changed = False
+        if 'p1' in incoming_game_state:
+            changed = self.p1.update(incoming_game_state['p1'])
+        if 'p2' in incoming_game_state:
+            changed = self.p2.update(incoming_game_state['p2']) or changed
+        return changed
+
+    def to_dict(self):
+        return {'p1': self.p1.to_dict(), 'p2': self.p2.to_dict()}
+
+    def to_eval_dict(self):
+        return {'p1': self.p1.to_eval_dict(), 'p2': self.p2.to_eval_dict()}
+
+def splice_game_state(fields, game_state_json):
+    """Encode fields as a JSON object with already encoded game_state bytes appended."""
+    if not fields:
+        return b'{"game_state": ' + game_state_json + b'}'
+    return json.dumps(fields).encode('utf-8')[:-1] + b', "game_state": ' + game_state_json + b'}'
+
+# The eval fields lead every player's wire shape (see to_dict), so the eval projection of an encoded
+# player ends where its first other field starts
+EVAL_END_JSON = b', "opponent_hit": '
+EVAL_END_PACKED = msgpack.packb('opponent_hit')
+EVAL_MAP_HEADER = bytes((0x80 | len(PLAYER_FIELDS[:SHIELDS + 1]),))
+
+def cut_eval_packed(player):
+    # Swap the header of the player's map for one counting only the eval fields
+    header_size = {0xde: 3, 0xdf: 5}.get(player[0], 1)
+    return EVAL_MAP_HEADER + player[header_size:player.index(EVAL_END_PACKED)]
+
+class StateSnapshot:
+    """Encoded game state of a match, encoded at most once per version.
+
+    The broadcast, the gateway and the eval server messages all splice the same encoding, the eval
+    projection being cut out of it.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        # (full state, eval projection) encodings of the current version
+        self.json = None
+        self.packed = None
+        self.encodes = 0
+        # Bumped on every invalidation, which only happens when the state changed
+        self.version = 0
+
+    def invalidate(self):
+        self.version += 1
+        self.json = None
+        self.packed = None
+
+    def get_state_json(self):
+        return self.get_json()[0]
+
+    def get_eval_json(self):
+        return self.get_json()[1]
+
+    def get_json(self):
+        if self.json is None:
+            players = [json.dumps(player.to_dict()).encode('utf-8') for player in (self.state.p1, self.state.p2)]
+            evals = [player[:player.index(EVAL_END_JSON)] + b'}' for player in players]
+            self.json = (b'{"p1": %s, "p2": %s}' % tuple(players), b'{"p1": %s, "p2": %s}' % tuple(evals))
+            self.encodes += 1
+        return self.json
+
+    def get_state_packed(self):
+        # MessagePack counterparts of the JSON encodings, see wire.py
+        return self.get_packed()[0]
+
+    def get_eval_packed(self):
+        return self.get_packed()[1]
+
+    def get_packed(self):
+        if self.packed is None:
+            players = [msgpack.packb(player.to_dict()) for player in (self.state.p1, self.state.p2)]
+            evals = [cut_eval_packed(player) for player in players]
+            self.packed = (b'\x82\xa2p1%s\xa2p2%s' % tuple(players), b'\x82\xa2p1%s\xa2p2%s' % tuple(evals))
+            self.encodes += 1
+        return self.packed
+
+class DeltaEncoder:
+    """Encode successive match states as sequenced deltas with periodic keyframes."""
+
+    def __init__(self, keyframe_interval):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        # Broadcasts since (and including) the last keyframe
+        self.since_keyframe = 0
+        self.keyframe_requested = True
+        # Field values and extras of the last broadcast state, per player
+        self.last_values = None
+        self.last_extras = None
+
+    def request_keyframe(self):
+        self.keyframe_requested = True
+
+    def encode(self, state):
+        """Return (seq, keyframe, game_state) for the next broadcast of state."""
+        self.seq += 1
+        players = (state.p1, state.p2)
+        values = (state.p1.as_tuple(), state.p2.as_tuple())
+        extras = tuple(dict(player.extra) if player.extra else None for player in players)
+
+        keyframe = self.keyframe_requested or self.since_keyframe >= self.keyframe_interval
+        if keyframe:
+            game_state = state.to_dict()
+            self.keyframe_requested = False
+            self.since_keyframe = 1
+        else:
+            game_state = {}
+            for player_key, player_values, last_values, extra, last_extra in zip(
+                    ('p1', 'p2'), values, self.last_values, extras, self.last_extras):
+                changed = {}
+                if player_values != last_values:
+                    for index, value in enumerate(player_values):
+                        if value != last_values[index]:
+                            changed[PLAYER_FIELDS[index]] = value
+                if extra != last_extra and extra:
+                    for key, value in extra.items():
+                        if last_extra is None or last_extra.get(key) != value:
+                            changed[key] = value
+                if changed:
+                    game_state[player_key] = changed
+            self.since_keyframe += 1
+
+        self.last_values = values
+        self.last_extras = extras
+        return self.seq, keyframe, game_state
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+import asyncio
+import base64
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import socket
+import struct
+import uuid
+from urllib.parse import parse_qs, urlsplit
+from dotenv import load_dotenv
+from game_state import splice_game_state
+from log import get_logger
+
+# Load environment variables from .env file
+load_dotenv()
+
+# HTTP/WebSocket state gateway of the game engine, disabled unless GATEWAY_PORT is set
+GATEWAY_HOST = os.getenv('GATEWAY_HOST', '0.0.0.0')
+GATEWAY_PORT = int(os.getenv('GATEWAY_PORT', '0'))
+GATEWAY_BUFFER = int(os.getenv('GATEWAY_BUFFER', '8'))  # Updates queued per client before it is skipped to the latest
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC11B85'
+MAX_REQUEST_HEAD = 8192
+MAX_CLIENT_FRAME = 4096
+# Bytes a WebSocket client may have in flight in each of the kernel and transport buffers
+SEND_BUFFER = 65536
+
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+log = get_logger('gateway')
+
+"""
+Endpoints:
+
+GET /matches                     -> ["default", "arena1"]
+GET /state?match_id=arena1       -> {"match_id": "arena1", "game_state": {...}}, with an ETag; 304 on If-None-Match
+GET /ws?match_id=arena1          -> WebSocket, the current state on connect and then every broadcast of the match,
+                                    each a full state in the 'update_everyone' schema
+match_id defaults to DEFAULT_MATCH_ID.
+"""
+
+def websocket_frame(payload, opcode=OPCODE_TEXT):
+    # Server frames are never masked
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('>BB', 0x80 | opcode, length)
+    elif length < 0x10000:
+        header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+async def read_websocket_frame(reader):
+    """Return (opcode, payload) of the next client frame."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7f
+    if length == 126:
+        length = struct.unpack('>H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', await reader.readexactly(8))[0]
+    if length > MAX_CLIENT_FRAME:
+        raise ValueError(f'Client frame of {length} bytes')
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    return first & 0x0f, payload
+
+def http_response(status, body=b'', headers=()):
+    head = [f'HTTP/1.1 {status}', f'Content-Length: {len(body)}', *headers]
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+class GatewayClient:
+    """A WebSocket subscriber with a bounded buffer of pending frames.
+
+    push() never waits: when the buffer is full the client is too slow to keep up, and since every
+    state frame carries the full state, the pending state frames are dropped in favour of the latest one.
+    Control frames from push_control() are never dropped.
+    """
+
+    def __init__(self, writer, buffer_size):
+        self.writer = writer
+        self.buffer_size = buffer_size
+        # (frame, opcode) pairs, the opcode of state frames being None
+        self.frames = collections.deque()
+        self.pending_states = 0
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def push(self, frame):
+        if self.pending_states >= self.buffer_size:
+            self.dropped += self.pending_states
+            self.pending_states = 0
+            self.frames = collections.deque(item for item in self.frames if item[1] is not None)
+        self.frames.append((frame, None))
+        self.pending_states += 1
+        self.ready.set()
+
+    def push_control(self, frame, opcode):
+        if opcode == OPCODE_PONG:
+            # A pong only has to answer the latest ping, which keeps a client flooding pings bounded
+            self.frames = collections.deque(item for item in self.frames if item[1] != OPCODE_PONG)
+        self.frames.append((frame, opcode))
+        self.ready.set()
+
+    async def send_frames(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.frames:
+                frame, opcode = self.frames.popleft()
+                if opcode is None:
+                    self.pending_states -= 1
+                self.writer.write(frame)
+                self.sent += 1
+                # Only this client's task waits on a slow socket
+                await self.writer.drain()
+
+class StateGateway:
+    """HTTP/WebSocket access to the game state of every match hosted by a GameEngine."""
+
+    def __init__(self, matches, default_match_id, host=None, port=None, buffer_size=None):
+        self.matches = matches
+        self.default_match_id = default_match_id
+        self.host = host or GATEWAY_HOST
+        self.port = GATEWAY_PORT if port is None else port
+        self.buffer_size = buffer_size or GATEWAY_BUFFER
+        # ETags carry a per-process prefix so a restarted engine never matches an old one
+        self.etag_prefix = uuid.uuid4().hex[:8]
+        self.subscribers = {}
+        # Open connections, writer -> handler task
+        self.connections = {}
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        log.info('State gateway listening on %s:%s', self.host, self.port)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # Aborted sockets end their handlers with EOF, a cancelled handler would be reported as an error.
+            # Aborting also discards what a client that stopped reading left in its send buffer
+            for writer in self.connections:
+                writer.transport.abort()
+            await asyncio.gather(*self.connections.values(), return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+
+    def client_count(self):
+        return sum(len(clients) for clients in self.subscribers.values())
+
+    def broadcast(self, match, fields):
+        # Called by the engine with every broadcast of a match; encodes once for all of its clients
+        clients = self.subscribers.get(match.match_id)
+        if not clients:
+            return
+        frame = websocket_frame(splice_game_state(fields, match.snapshot.get_state_json()))
+        for client in clients:
+            client.push(frame)
+
+    def etag(self, match):
+        return f'"{self.etag_prefix}-{match.snapshot.version}"'
+
+    async def handle_connection(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                if len(head) > MAX_REQUEST_HEAD:
+                    writer.write(http_response('431 Request Header Fields Too Large'))
+                    return
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, _ = lines[0].split(' ', 2)
+                except ValueError:
+                    writer.write(http_response('400 Bad Request'))
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                if headers.get('upgrade', '').lower() == 'websocket':
+                    await self.serve_websocket(reader, writer, target, headers)
+                    return
+                writer.write(self.handle_request(method, target, headers))
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    return
+        except ConnectionError:
+            pass
+        except Exception as e:
+            log.error('Gateway connection failed: %s', e)
+        finally:
+            del self.connections[writer]
+            writer.close()
+
+    def find_match(self, target):
+        query = parse_qs(urlsplit(target).query)
+        return self.matches.get(query.get('match_id', [self.default_match_id])[0])
+
+    def handle_request(self, method, target, headers):
+        path = urlsplit(target).path
+        if method != 'GET':
+            return http_response('405 Method Not Allowed', headers=('Allow: GET',))
+        if path == '/matches':
+            body = json.dumps(list(self.matches)).encode('utf-8')
+            return http_response('200 OK', body, ('Content-Type: application/json',))
+        if path != '/state':
+            return http_response('404 Not Found')
+        match = self.find_match(target)
+        if match is None:
+            return http_response('404 Not Found')
+        etag = self.etag(match)
+        cache_headers = (f'ETag: {etag}', 'Cache-Control: no-cache')
+        if etag in headers.get('if-none-match', ''):
+            return http_response('304 Not Modified', headers=cache_headers)
+        body = splice_game_state({'match_id': match.match_id}, match.snapshot.get_state_json())
+        return http_response('200 OK', body, ('Content-Type: application/json',) + cache_headers)
+
+    async def serve_websocket(self, reader, writer, target, headers):
+        match = self.find_match(target)
+        key = headers.get('sec-websocket-key')
+        if urlsplit(target).path != '/ws' or match is None or key is None:
+            writer.write(http_response('404 Not Found'))
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode('latin-1') + WEBSOCKET_GUID).digest()).decode('ascii')
+        writer.write(http_response('101 Switching Protocols', headers=(
+            'Upgrade: websocket', 'Connection: Upgrade', f'Sec-WebSocket-Accept: {accept}')))
+
+        # Without a cap the kernel buffers megabytes of stale states for a stalled client
+        # before its bounded buffer starts skipping to the latest one
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        writer.transport.set_write_buffer_limits(high=SEND_BUFFER)
+        client = GatewayClient(writer, self.buffer_size)
+        # New and reconnecting clients see the state right away instead of at the next broadcast
+        client.push(websocket_frame(splice_game_state({'match_id': match.match_id}, match.snapshot.get_state_json())))
+        clients = self.subscribers.setdefault(match.match_id, set())
+        clients.add(client)
+        sender = asyncio.create_task(client.send_frames())
+        try:
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                if opcode == OPCODE_CLOSE:
+                    client.push_control(websocket_frame(payload[:2], OPCODE_CLOSE), OPCODE_CLOSE)
+                    break
+                if opcode == OPCODE_PING:
+                    client.push_control(websocket_frame(payload, OPCODE_PONG), OPCODE_PONG)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            clients.discard(client)
+            # Let a queued close frame go out, but never wait on a client that stopped reading
+            await asyncio.sleep(0)
+            sender.cancel()
+            # A sender that stopped on a dropped connection has nothing left to report
+            with contextlib.suppress(asyncio.CancelledError, ConnectionError):
+                await sender
+            log.debug('Gateway client of match %s left (sent %d, dropped %d)', match.match_id, client.sent, client.dropped)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import struct
+from wire import decode_message
+
+# Binary IMU windows on ai_queue, sent with this AMQP content_type. JSON and MessagePack windows
+# stay accepted, see decode_imu_message.
+IMU_CONTENT_TYPE = 'application/x-imu-int16'
+IMU_VERSION = 1
+
+AXES = ('ax', 'ay', 'az', 'gx', 'gy', 'gz')
+DEVICES = ('glove', 'leg')
+
+FLAG_TIMESTAMP = 0x1
+FLAG_MESSAGE_ID = 0x2
+FLAG_MATCH_ID = 0x4
+
+HEADER = struct.Struct('<BBBBH')
+TIMESTAMP = struct.Struct('<d')
+
+"""
+Layout, little-endian:
+
+u8   version, 1 (a JSON body starts with '{' and a MessagePack map with 0x8_, 0xde or 0xdf)
+u8   flags: 1 timestamp, 2 message_id, 4 match_id
+u8   player_id
+u8   device: 0 glove, 1 leg
+u16  sample count n
+f64  timestamp in seconds                        if flags & 1
+u8   length, then the UTF-8 message_id           if flags & 2
+u8   length, then the UTF-8 match_id             if flags & 4
+n * 6 int16 samples, one ax ay az gx gy gz group per sample
+"""
+
+def pack_imu(window):
+    """Pack a window in the JSON form ({'player_id', 'imu_device', 'ax', ... 'gz'}) into the binary form.
+
+    Axes shorter than the longest one are zero padded, which is what fill_input does with the JSON form.
+    """
+    axes = [window[axis] for axis in AXES]
+    count = max(len(values) for values in axes)
+    # The JSON form may carry the player as '1', like game_state.PLAYER_KEYS accepts
+    try:
+        player_id = int(window['player_id'])
+    except (TypeError, ValueError):
+        raise ValueError(f'IMU window player_id {window["player_id"]!r} is not a number') from None
+    if not 0 <= player_id <= 0xFF:
+        raise ValueError(f'IMU window player_id {player_id} does not fit in a byte')
+    flags = 0
+    extra = []
+    if window.get('timestamp') is not None:
+        flags |= FLAG_TIMESTAMP
+        extra.append(TIMESTAMP.pack(window['timestamp']))
+    for flag, key in ((FLAG_MESSAGE_ID, 'message_id'), (FLAG_MATCH_ID, 'match_id')):
+        if window.get(key) is not None:
+            value = str(window[key]).encode('utf-8')
+            flags |= flag
+            extra.append(bytes((len(value),)) + value)
+    # Interleave the axes, sample by sample
+    padded = [values if len(values) == count else [*values, *[0] * (count - len(values))] for values in axes]
+    samples = [value for group in zip(*padded) for value in group]
+    return b''.join([
+        HEADER.pack(IMU_VERSION, flags, player_id, DEVICES.index(window['imu_device']), count),
+        *extra,
+        struct.pack(f'<{len(samples)}h', *samples),
+    ])
+
+def encode_imu(window):
+    """Return (body, content_type) of a binary IMU window."""
+    return pack_imu(window), IMU_CONTENT_TYPE
+
+def is_imu(body, content_type=None):
+    if content_type is not None:
+        return content_type == IMU_CONTENT_TYPE
+    return len(body) >= HEADER.size and body[0] == IMU_VERSION
+
+def unpack_imu(body):
+    """Return the window as a dict whose 'samples' is an (n, 6) int16 array viewing body."""
+    # Imported here so producers can pack windows without NumPy
+    import numpy as np
+
+    version, flags, player_id, device, count = HEADER.unpack_from(body, 0)
+    if version != IMU_VERSION:
+        raise ValueError(f'Unsupported IMU window version {version}')
+    window = {'player_id': player_id, 'imu_device': DEVICES[device]}
+    offset = HEADER.size
+    if flags & FLAG_TIMESTAMP:
+        window['timestamp'] = TIMESTAMP.unpack_from(body, offset)[0]
+        offset += TIMESTAMP.size
+    for flag, key in ((FLAG_MESSAGE_ID, 'message_id'), (FLAG_MATCH_ID, 'match_id')):
+        if flags & flag:
+            length = body[offset]
+            window[key] = bytes(body[offset + 1:offset + 1 + length]).decode('utf-8')
+            offset += 1 + length
+    if len(body) - offset != count * len(AXES) * 2:
+        raise ValueError(f'IMU window of {count} samples has {len(body) - offset} bytes of samples')
+    window['samples'] = np.frombuffer(body, dtype='<i2', count=count * len(AXES), offset=offset).reshape(count, len(AXES))
+    return window
+
+def decode_imu_message(message):
+    # Binary windows by content_type, anything else through the JSON/MessagePack decoder
+    if is_imu(message.body, getattr(message, 'content_type', None)):
+        return unpack_imu(message.body)
+    return decode_message(message)
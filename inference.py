@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from log import get_logger
+from model_bundle import AI_FOLDER
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 'fpga' runs the gesture networks on the Ultra96 overlay, 'cpu' runs them with NumPy anywhere
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'fpga')
+BITSTREAM = os.getenv('BITSTREAM', os.path.join(AI_FOLDER, 'new_unseen.bit'))
+# Windows of one device run by a single predict_batch call, the size of the staging buffers
+AI_BATCH_MAX = int(os.getenv('AI_BATCH_MAX', '16'))
+# Batches queued for or running on the inference thread; more wait on the event loop
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '8'))
+
+log = get_logger('inference')
+
+# First word of a DMA input buffer, selecting the network of the device
+DEVICE_HEADERS = {'glove': 1.0, 'leg': 0.0}
+
+# Staging buffers per device: one batch is staged into a set while the device works on the other
+BUFFER_SETS = 2
+
+class Batch:
+    """Windows of one device staged into buffer set slot of a backend."""
+
+    def __init__(self, windows, model, slot):
+        self.windows = windows
+        self.model = model
+        self.slot = slot
+        # The exception of a window that failed staging, the (action_index, confidence) of the others once finished
+        self.results = [None] * len(windows)
+        # Indices of the staged windows, in buffer row order
+        self.rows = []
+
+class InferenceBackend:
+    """Runs the gesture network of a device on one IMU window.
+
+    predict(data, model) preprocesses the decoded window with model.fill_input and returns
+    (action_index, confidence). It blocks, so the ai_server calls it off the event loop.
+    predict_batch(windows, model) does the same for several windows of one device in one call.
+
+    A batch runs in three steps, so the InferenceWorker can stage one while the device works on
+    another: stage() preprocesses the windows into one of BUFFER_SETS buffer sets, start() hands
+    them to the device and finish() waits for the results. A backend is not thread safe.
+    """
+
+    name = None
+    max_batch = 1
+
+    def predict(self, data, model):
+        raise NotImplementedError
+
+    def predict_batch(self, windows, model):
+        """Results of windows in order, the exception in place of the result of a window that failed."""
+        results = []
+        for start in range(0, len(windows), self.max_batch):
+            results.extend(self.predict_chunk(windows[start:start + self.max_batch], model))
+        return results
+
+    def predict_chunk(self, windows, model):
+        batch = self.stage(windows, model)
+        self.start(batch)
+        return self.finish(batch)
+
+    def input_rows(self, model, slot):
+        """The (max_batch, input_length) staging rows of a buffer set, None to run predict() per window."""
+        return None
+
+    def stage(self, windows, model, slot=0):
+        batch = Batch(windows, model, slot)
+        inputs = self.input_rows(model, slot)
+        if inputs is None:
+            return batch
+        # Staged windows are packed into the first rows, a malformed one fails alone
+        for index, data in enumerate(windows):
+            try:
+                model.fill_input(data, inputs[len(batch.rows)])
+            except Exception as e:
+                batch.results[index] = e
+                continue
+            batch.rows.append(index)
+        return batch
+
+    def start(self, batch):
+        pass
+
+    def finish(self, batch):
+        # Without staging rows, the windows run one at a time
+        for index, data in enumerate(batch.windows):
+            try:
+                batch.results[index] = self.predict(data, batch.model)
+            except Exception as e:
+                batch.results[index] = e
+        return batch.results
+
+    def collect(self, batch, probabilities):
+        # Row results back into window order
+        action_indices = np.argmax(probabilities[:len(batch.rows)], axis=1)
+        for row, index in enumerate(batch.rows):
+            batch.results[index] = (action_indices[row], probabilities[row, action_indices[row]])
+        return batch.results
+
+    def close(self):
+        pass
+
+class FpgaBackend(InferenceBackend):
+    """The networks of the bitstream, fed over AXI DMA from pynq buffers."""
+
+    name = 'fpga'
+
+    def __init__(self, models, bitstream=None, max_batch=None):
+        # Imported here so the other backends run without pynq
+        from pynq import Overlay, allocate, PL
+        self.max_batch = max_batch or AI_BATCH_MAX
+        try:
+            PL.reset()
+            self.ol = Overlay(bitstream or BITSTREAM)
+            self.nn = self.ol.gesture_model_0
+            self.nn.write(0x0, 0x81)
+            self.dma = self.ol.axi_dma_0
+            self.dma_send = self.dma.sendchannel
+            self.dma_recv = self.dma.recvchannel
+            self.input_stream_hand = allocate(shape=(models['glove'].input_length + 1,), dtype='float32')
+            self.output_stream_hand = allocate(shape=(models['glove'].output_length,), dtype='float32')
+            self.input_stream_leg = allocate(shape=(models['leg'].input_length + 1,), dtype='float32')
+            self.output_stream_leg = allocate(shape=(models['leg'].output_length,), dtype='float32')
+            self.streams = {
+                'glove': (self.input_stream_hand, self.output_stream_hand),
+                'leg': (self.input_stream_leg, self.output_stream_leg),
+            }
+            # BUFFER_SETS sets per device of one row per window of a batch, each row a DMA transfer of its own
+            self.batch_streams = {device: [] for device in models}
+            for device, model in models.items():
+                for _ in range(BUFFER_SETS):
+                    input_batch = allocate(shape=(self.max_batch, model.input_length + 1), dtype='float32')
+                    input_batch[:, 0] = DEVICE_HEADERS[device]
+                    self.batch_streams[device].append(
+                        (input_batch, allocate(shape=(self.max_batch, model.output_length), dtype='float32')))
+        except Exception as e:
+            log.error('Initialization error: %s', e)
+            self.cleanup_buffers()
+            raise
+
+    def cleanup_buffers(self):
+        """Free the allocated buffers to avoid memory issues."""
+        try:
+            if hasattr(self, 'input_stream_hand') and self.input_stream_hand is not None:
+                self.input_stream_hand.freebuffer()
+            if hasattr(self, 'output_stream_hand') and self.output_stream_hand is not None:
+                self.output_stream_hand.freebuffer()
+            if hasattr(self, 'input_stream_leg') and self.input_stream_leg is not None:
+                self.input_stream_leg.freebuffer()
+            if hasattr(self, 'output_stream_leg') and self.output_stream_leg is not None:
+                self.output_stream_leg.freebuffer()
+            for buffer_sets in getattr(self, 'batch_streams', {}).values():
+                for input_batch, output_batch in buffer_sets:
+                    input_batch.freebuffer()
+                    output_batch.freebuffer()
+        except Exception as cleanup_error:
+            log.error('Buffer cleanup error: %s', cleanup_error)
+
+    def close(self):
+        self.cleanup_buffers()
+
+    def __del__(self):
+        """Ensure buffers are cleaned up when the object is deleted."""
+        self.cleanup_buffers()
+
+    def predict(self, data, model):
+        input_stream, output_stream = self.streams[model.device]
+        input_stream[0] = DEVICE_HEADERS[model.device]
+        # The window is preprocessed straight into the DMA buffer, after the header word.
+        # A malformed window raises here, before the buffers are handed to the DMA
+        model.fill_input(data, input_stream[1:])
+        try:
+            self.dma_send.transfer(input_stream)
+            self.dma_send.wait()
+
+            self.dma_recv.transfer(output_stream)
+            self.dma_recv.wait()
+
+            # Assuming output_stream contains probabilities for each class
+            action_index = np.argmax(output_stream)
+            confidence = output_stream[action_index]
+
+            return action_index, confidence
+        except Exception as e:
+            log.error('Error during prediction: %s', e)
+            self.cleanup_buffers()
+            raise
+
+    def input_rows(self, model, slot):
+        # After the header word of every row, written at allocation
+        return self.batch_streams[model.device][slot][0][:, 1:]
+
+    def transfer(self, batch, row):
+        input_batch, output_batch = self.batch_streams[batch.model.device][batch.slot]
+        self.dma_send.transfer(input_batch[row])
+        self.dma_recv.transfer(output_batch[row])
+
+    def start(self, batch):
+        # The first window goes to the DMA now, the rest back to back from finish()
+        if batch.rows:
+            try:
+                self.transfer(batch, 0)
+            except Exception as e:
+                log.error('Error during prediction: %s', e)
+                self.cleanup_buffers()
+                raise
+
+    def finish(self, batch):
+        try:
+            for row in range(len(batch.rows)):
+                self.dma_send.wait()
+                self.dma_recv.wait()
+                if row + 1 < len(batch.rows):
+                    self.transfer(batch, row + 1)
+        except Exception as e:
+            log.error('Error during prediction: %s', e)
+            self.cleanup_buffers()
+            raise
+        return self.collect(batch, self.batch_streams[batch.model.device][batch.slot][1])
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+def softmax(x):
+    # Along the last axis, so batches of windows work too
+    x = np.exp(x - x.max(axis=-1, keepdims=True))
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+ACTIVATIONS = {'linear': lambda x: x, 'relu': relu, 'softmax': softmax, 'sigmoid': sigmoid, 'tanh': np.tanh}
+
+class DenseNetwork:
+    """A stack of dense layers, the structure of the gesture networks synthesised into the bitstream.
+
+    Weights files are .npz archives holding w0, b0, w1, b1, ... (weights shaped (inputs, outputs))
+    and 'activations', one name of ACTIVATIONS per layer. Export trained networks with save().
+    """
+
+    def __init__(self, layers):
+        self.layers = [(np.asarray(weights, dtype=np.float32), np.asarray(bias, dtype=np.float32), activation)
+                       for weights, bias, activation in layers]
+        for index, (weights, bias, activation) in enumerate(self.layers):
+            if activation not in ACTIVATIONS:
+                raise ValueError(f'Layer {index} has unknown activation "{activation}"')
+            if bias.shape != (weights.shape[1],):
+                raise ValueError(f'Layer {index} has {bias.shape[0]} biases for {weights.shape[1]} outputs')
+        self.input_length = self.layers[0][0].shape[0]
+        self.output_length = self.layers[-1][0].shape[1]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as archive:
+            activations = [str(activation) for activation in archive['activations']]
+            return cls([(archive[f'w{index}'], archive[f'b{index}'], activation)
+                        for index, activation in enumerate(activations)])
+
+    def save(self, path):
+        arrays = {'activations': np.array([activation for _, _, activation in self.layers])}
+        for index, (weights, bias, _) in enumerate(self.layers):
+            arrays[f'w{index}'] = weights
+            arrays[f'b{index}'] = bias
+        np.savez(path, **arrays)
+
+    def forward(self, inputs):
+        """Class probabilities of one window (input_length,) or of a batch (windows, input_length)."""
+        x = inputs
+        for weights, bias, activation in self.layers:
+            x = x @ weights
+            x += bias
+            x = ACTIVATIONS[activation](x)
+        return x
+
+class CpuBackend(InferenceBackend):
+    """The gesture networks run with NumPy from weights files named in the model bundle."""
+
+    name = 'cpu'
+
+    def __init__(self, models, weights_folder=None, max_batch=None):
+        self.max_batch = max_batch or AI_BATCH_MAX
+        self.networks = {}
+        self.inputs = {}
+        self.batch_inputs = {}
+        for device, model in models.items():
+            if model.weights is None:
+                raise ValueError(f'The model bundle names no weights file for {device}')
+            path = os.path.join(weights_folder or AI_FOLDER, model.weights)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f'{path} not found, export the trained {device} network with DenseNetwork.save')
+            network = DenseNetwork.load(path)
+            if (network.input_length, network.output_length) != (model.input_length, model.output_length):
+                raise ValueError(f'{model.weights} maps {network.input_length} inputs to {network.output_length} '
+                                 f'classes, the {device} model {model.input_length} to {model.output_length}')
+            self.networks[device] = network
+            # Preprocessed windows are written here, like into the DMA buffers
+            self.inputs[device] = np.zeros(model.input_length, dtype=np.float32)
+            self.batch_inputs[device] = [np.zeros((self.max_batch, model.input_length), dtype=np.float32)
+                                         for _ in range(BUFFER_SETS)]
+
+    def predict(self, data, model):
+        inputs = model.fill_input(data, self.inputs[model.device])
+        probabilities = self.networks[model.device].forward(inputs)
+        action_index = np.argmax(probabilities)
+        return action_index, probabilities[action_index]
+
+    def input_rows(self, model, slot):
+        return self.batch_inputs[model.device][slot]
+
+    def finish(self, batch):
+        # One matrix multiply per layer for the whole batch
+        inputs = self.batch_inputs[batch.model.device][batch.slot][:len(batch.rows)]
+        return self.collect(batch, self.networks[batch.model.device].forward(inputs))
+
+# Put on the request queue by close()
+CLOSE = object()
+
+class InferenceWorker:
+    """The one thread that runs an inference backend, fed from the event loop through a bounded queue.
+
+    Only this thread touches the backend's buffers and DMA channels, so concurrent windows cannot
+    race on them. While the device works on a batch, the next queued batch is staged into the other
+    buffer set of its device and started as soon as the first is finished. At most queue_size
+    batches are queued or running; predict_batch() waits on the event loop for room beyond that.
+    close() stops the thread and closes the backend.
+    """
+
+    # Batches of a device that can be in the worker at once without waiting for a buffer set
+    depth = BUFFER_SETS
+
+    def __init__(self, backend, queue_size=None):
+        self.backend = backend
+        self.max_batch = backend.max_batch
+        self.room = asyncio.Semaphore(queue_size or INFERENCE_QUEUE_SIZE)
+        self.requests = queue.SimpleQueue()
+        # device -> buffer set of its next batch
+        self.slots = {}
+        self.batches = 0
+        self.thread = threading.Thread(target=self.serve, name='inference', daemon=True)
+        self.thread.start()
+
+    def submit(self, windows, model):
+        """Queue at most max_batch windows of a device, returns a concurrent.futures.Future of their results."""
+        future = concurrent.futures.Future()
+        self.requests.put((windows, model, future))
+        return future
+
+    async def predict_batch(self, windows, model):
+        results = []
+        for start in range(0, len(windows), self.max_batch):
+            async with self.room:
+                results.extend(await asyncio.wrap_future(self.submit(windows[start:start + self.max_batch], model)))
+        return results
+
+    def serve(self):
+        running = None
+        closing = False
+        while running is not None or not closing:
+            request = None
+            if not closing:
+                # Wait for work when the device is idle, otherwise only take what is queued already
+                try:
+                    request = self.requests.get(block=running is None)
+                except queue.Empty:
+                    pass
+                if request is CLOSE:
+                    closing, request = True, None
+            staged = self.stage(request) if request is not None else None
+            finished = self.finish(*running) if running is not None else None
+            running = self.start(*staged) if staged is not None else None
+            # Results go back to the event loop once the device has its next batch
+            if finished is not None:
+                self.deliver(*finished)
+
+    def stage(self, request):
+        windows, model, future = request
+        if not future.set_running_or_notify_cancel():
+            return None
+        slot = self.slots.get(model.device, 0)
+        self.slots[model.device] = (slot + 1) % BUFFER_SETS
+        try:
+            return self.backend.stage(windows, model, slot), future
+        except Exception as e:
+            future.set_exception(e)
+            return None
+
+    def start(self, batch, future):
+        try:
+            self.backend.start(batch)
+        except Exception as e:
+            future.set_exception(e)
+            return None
+        return batch, future
+
+    def finish(self, batch, future):
+        self.batches += 1
+        try:
+            return future, self.backend.finish(batch), None
+        except Exception as e:
+            return future, None, e
+
+    def deliver(self, future, results, error):
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(results)
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.requests.put(CLOSE)
+        self.thread.join()
+        self.thread = None
+        self.backend.close()
+
+BACKENDS = {'fpga': FpgaBackend, 'cpu': CpuBackend}
+
+def create_backend(models, name=None):
+    name = name or INFERENCE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown inference backend "{name}"')
+    start = time.perf_counter()
+    backend = BACKENDS[name](models)
+    log.info('Loaded the %s inference backend in %.1f ms', name, (time.perf_counter() - start) * 1000)
+    return backend
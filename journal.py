@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+import collections
+import glob
+import json
+import os
+import struct
+import threading
+import time
+
+# Each record is its sequence number and body length followed by the message body as received
+RECORD_HEADER = struct.Struct('<QI')
+
+SNAPSHOT_FILE = 'snapshot.json'
+SEGMENT_PATTERN = 'journal-*.bin'
+
+def segment_path(directory, first_seq):
+    return os.path.join(directory, f'journal-{first_seq:012d}.bin')
+
+def segment_first_seq(path):
+    return int(os.path.basename(path)[len('journal-'):-len('.bin')])
+
+def read_records(data):
+    """Return the (seq, body) records of a segment and the length of the part holding them."""
+    records = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        seq, length = RECORD_HEADER.unpack_from(data, offset)
+        body = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+        if len(body) < length:
+            # Torn write at the end of the last segment
+            break
+        records.append((seq, body))
+        offset += RECORD_HEADER.size + length
+    return records, offset
+
+class Journal:
+    """Append-only journal of applied messages with periodic state snapshots.
+
+    append() only queues the record; a background thread writes queued records,
+    rotates segments and writes snapshots, so the caller never touches the disk.
+    """
+
+    def __init__(self, directory, flush_interval=0.05, fsync=False):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self.seq = 0
+        self.records_since_snapshot = 0
+        self.pending = collections.deque()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.file = None
+        self.thread = None
+        self.last_written_seq = 0
+
+    def load(self):
+        """Return (snapshot, records) where records are (seq, body) pairs in order, and resume seq after them."""
+        snapshot = None
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'rb') as file:
+                snapshot = json.loads(file.read())
+
+        records = []
+        for path in sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)), key=segment_first_seq):
+            with open(path, 'rb') as file:
+                records.extend(read_records(file.read())[0])
+
+        if records:
+            self.seq = records[-1][0]
+        elif snapshot is not None:
+            self.seq = snapshot['seq']
+        return snapshot, records
+
+    def reset(self):
+        """Delete the snapshot and every segment to start from fresh state."""
+        for path in glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)):
+            os.remove(path)
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        self.seq = 0
+
+    def start(self):
+        self.last_written_seq = self.seq
+        path = segment_path(self.directory, self.seq + 1)
+        if os.path.exists(path):
+            # Cut a torn record off the end, records appended after it could not be read back
+            with open(path, 'rb') as file:
+                valid_length = read_records(file.read())[1]
+            os.truncate(path, valid_length)
+        self.file = open(path, 'ab')
+        self.thread = threading.Thread(target=self.writer, name='journal-writer', daemon=True)
+        self.thread.start()
+
+    def append(self, body):
+        """Queue a message body and return its sequence number."""
+        self.seq += 1
+        self.records_since_snapshot += 1
+        self.pending.append((self.seq, body))
+        return self.seq
+
+    def snapshot(self, covered_seq, matches):
+        """Queue a snapshot of {match_id: (last applied seq, game state dict)}.
+
+        Every record up to covered_seq must be reflected in the snapshot.
+        """
+        self.records_since_snapshot = 0
+        self.pending.append(('snapshot', (covered_seq, matches)))
+        self.wakeup.set()
+
+    def writer(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+            if self.closed and not self.pending:
+                break
+
+    def flush(self):
+        chunks = []
+        while self.pending:
+            seq, item = self.pending.popleft()
+            if seq == 'snapshot':
+                self.write_records(chunks)
+                chunks = []
+                self.write_snapshot(*item)
+            else:
+                chunks.append(RECORD_HEADER.pack(seq, len(item)))
+                chunks.append(item)
+                self.last_written_seq = seq
+        self.write_records(chunks)
+
+    def write_records(self, chunks):
+        if not chunks:
+            return
+        self.file.write(b''.join(chunks))
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def write_snapshot(self, covered_seq, matches):
+        snapshot = {
+            'seq': covered_seq,
+            'time': time.time(),
+            'matches': {match_id: {'seq': seq, 'game_state': game_state} for match_id, (seq, game_state) in matches.items()},
+        }
+
+        # Start a new segment so old ones can be dropped once nothing in them is needed
+        self.file.close()
+        self.file = open(segment_path(self.directory, self.last_written_seq + 1), 'ab')
+
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        temporary_path = snapshot_path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(json.dumps(snapshot).encode('utf-8'))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, snapshot_path)
+
+        segments = sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)), key=segment_first_seq)
+        for path, next_path in zip(segments, segments[1:]):
+            if segment_first_seq(next_path) - 1 <= covered_seq:
+                os.remove(path)
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+        self.file.close()
+        self.thread = None
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+
+import asyncio
+import importlib
+import json
+import os
+import time
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+import purge_queues
+from gateway import http_response
+from log import get_logger
+from transport import create_transport
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Services started by the launcher, all in this process and sharing one broker connection
+SERVICES = [name.strip() for name in os.getenv('SERVICES', 'game_engine,eval_client,ai_server').split(',') if name.strip()]
+# Services the process cannot run without; when one fails to start the launcher exits, so pm2 restarts it
+REQUIRED_SERVICES = {name.strip() for name in os.getenv('REQUIRED_SERVICES', 'game_engine,eval_client').split(',')
+                     if name.strip()}
+# Attempts of the broker and eval server connections, retried after PHASE_RETRY_DELAY seconds, doubling each time
+PHASE_ATTEMPTS = int(os.getenv('PHASE_ATTEMPTS', '5'))
+PHASE_RETRY_DELAY = float(os.getenv('PHASE_RETRY_DELAY', '1'))
+# Readiness and health endpoints of the launcher, disabled when 0
+HEALTH_HOST = os.getenv('HEALTH_HOST', '0.0.0.0')
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', '8090'))
+
+log = get_logger('launcher')
+
+"""
+Startup phases, each started as soon as the phases it depends on are done:
+
+load         services imported and constructed, before every other phase
+connect      broker connection of the process
+restore      game_engine journal replay              (game_engine)
+purge        all queues declared and purged at once  after connect, restore; skipped when a match was restored
+game_engine  queues declared, consuming              after purge
+ai_overlay   ai_server import and inference backend  in a worker thread, from the start
+ai_server    ai_queue declared, consuming            after ai_overlay, purge
+eval_server  settings checked, eval server connected  from the start
+eval_client  queues declared, consuming              after eval_server, purge
+
+The connect and eval_server phases are retried with backoff, up to PHASE_ATTEMPTS attempts; a settings error
+(ValueError) is not. A failed phase only blocks the phases after it, the services that do not depend on it keep
+running, unless one of REQUIRED_SERVICES failed: then the launcher exits non-zero so pm2 restarts it.
+
+GET /ready   -> {"ready": ..., "services": {...}}, 200 once every service is ready, otherwise 503
+GET /health  -> {"status": "starting" | "ready" | "degraded" | "failed", "services": {"game_engine": "ready", ...},
+                 "cold_start_ms": ..., "phases": {...}}, 503 when every service failed
+"""
+
+class Phase:
+    def __init__(self, name, action, after=(), retry=False):
+        self.name = name
+        self.action = action
+        self.after = after
+        self.retry = retry
+        self.attempts = 0
+        self.state = 'pending'
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    def to_dict(self, origin):
+        # Times are in milliseconds since the launcher started
+        return {
+            'state': self.state,
+            'start_ms': None if self.started is None else round((self.started - origin) * 1000, 1),
+            'duration_ms': None if self.finished is None else round((self.finished - self.started) * 1000, 1),
+            'attempts': self.attempts,
+            'error': self.error,
+        }
+
+class Launcher:
+    """Starts the services in one process, overlapping every phase that does not depend on another."""
+
+    def __init__(self, services=None, health_port=None):
+        self.services = SERVICES if services is None else services
+        self.health_port = HEALTH_PORT if health_port is None else health_port
+        unknown = set(self.services) - {'game_engine', 'eval_client', 'ai_server'}
+        if unknown:
+            raise ValueError(f'Unknown services: {", ".join(sorted(unknown))}')
+        # Holds the process' broker connection open for the services
+        self.transport = create_transport()
+        self.phases = {}
+        self.tasks = {}
+        self.origin = None
+        self.cold_start = None
+        self.restored = False
+        self.game_engine = None
+        self.eval_client = None
+        self.ai_server = None
+        self.server = None
+
+    def add_phase(self, name, action, after=(), retry=False):
+        self.phases[name] = Phase(name, action, [dependency for dependency in after if dependency in self.phases], retry)
+
+    def plan(self):
+        self.add_phase('connect', self.transport.connect, retry=True)
+        if 'game_engine' in self.services:
+            import game_engine
+            self.game_engine = game_engine.GameEngine()
+            self.add_phase('restore', self.restore)
+        self.add_phase('purge', self.purge, after=('connect', 'restore'))
+        if 'game_engine' in self.services:
+            self.add_phase('game_engine', self.game_engine.start, after=('purge',))
+        if 'ai_server' in self.services:
+            self.add_phase('ai_overlay', self.load_ai_server)
+            self.add_phase('ai_server', lambda: self.ai_server.start(), after=('ai_overlay', 'purge'))
+        if 'eval_client' in self.services:
+            import eval_client
+            self.eval_client = eval_client.EvalClient('localhost', eval_client.PORT, eval_client.SECRET_KEY)
+            self.add_phase('eval_server', self.connect_eval_server, retry=True)
+            self.add_phase('eval_client', self.eval_client.start, after=('eval_server', 'purge'))
+
+    async def restore(self):
+        self.restored = self.game_engine.restore()
+
+    async def purge(self):
+        if self.restored:
+            # Messages still queued belong to the restored match, so keep them
+            return
+        await purge_queues.QueuePurger(self.transport).run_purge()
+
+    async def connect_eval_server(self):
+        # The settings eval_client.main() checks before connecting
+        importlib.import_module('eval_client').check_settings()
+        try:
+            await self.eval_client.connect_server()
+        except Exception:
+            # Each attempt opens a new socket
+            self.eval_client.close()
+            raise
+
+    async def load_ai_server(self):
+        # Resetting the FPGA and loading the overlay block for seconds, so neither holds up the loop
+        self.ai_server = await asyncio.to_thread(lambda: importlib.import_module('ai_server').AIServer(create_transport()))
+
+    async def run_phase(self, phase):
+        try:
+            await asyncio.gather(*(self.tasks[name] for name in phase.after))
+        except Exception:
+            phase.state = 'blocked'
+            phase.error = 'blocked by ' + ', '.join(
+                name for name in phase.after if self.phases[name].state in ('failed', 'blocked'))
+            raise
+        phase.state = 'running'
+        phase.started = time.perf_counter()
+        try:
+            await self.attempt(phase)
+        except Exception as e:
+            phase.state = 'failed'
+            phase.error = str(e) or type(e).__name__
+            log.error('Startup phase %s failed: %s', phase.name, phase.error)
+            raise
+        finally:
+            phase.finished = time.perf_counter()
+        phase.state = 'ready'
+        phase.error = None
+        log.info('Startup phase %s ready in %.1f ms', phase.name, (phase.finished - phase.started) * 1000)
+
+    async def attempt(self, phase):
+        delay = PHASE_RETRY_DELAY
+        while True:
+            phase.attempts += 1
+            try:
+                return await phase.action()
+            except ValueError:
+                # Bad settings fail the same way every time
+                raise
+            except Exception as e:
+                if not phase.retry or phase.attempts >= PHASE_ATTEMPTS:
+                    raise
+                phase.error = str(e) or type(e).__name__
+                log.warning('Startup phase %s failed (attempt %d of %d), retrying in %g s: %s',
+                            phase.name, phase.attempts, PHASE_ATTEMPTS, delay, phase.error)
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    async def start(self):
+        self.origin = time.perf_counter()
+        if self.health_port:
+            self.server = await asyncio.start_server(self.handle_connection, HEALTH_HOST, self.health_port)
+            self.health_port = self.server.sockets[0].getsockname()[1]
+            log.info('Health endpoints listening on %s:%s', HEALTH_HOST, self.health_port)
+        # Importing and constructing the services is the first phase
+        load = Phase('load', None)
+        load.started = time.perf_counter()
+        self.plan()
+        load.finished = time.perf_counter()
+        load.state = 'ready'
+        for name, phase in self.phases.items():
+            self.tasks[name] = asyncio.create_task(self.run_phase(phase))
+        self.phases = {'load': load, **self.phases}
+        # Failed phases were logged and recorded, the services that did not depend on them keep running
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.cold_start = time.perf_counter() - self.origin
+        log.info('Cold start in %.1f ms: %s', self.cold_start * 1000, ', '.join(
+            f'{phase.name} {(phase.finished - phase.started) * 1000:.1f} ms at {(phase.started - self.origin) * 1000:.1f} ms'
+            for phase in sorted((phase for phase in self.phases.values() if phase.state == 'ready'),
+                                key=lambda phase: phase.started)))
+        failed = [service for service, state in self.service_states().items() if state == 'failed']
+        if failed:
+            log.error('Services not started: %s', ', '.join(failed))
+
+    def service_states(self):
+        # A service is as far as the last phase of its startup, the phase named after it
+        states = {}
+        for service in self.services:
+            phase = self.phases.get(service)
+            if phase is None or phase.state in ('pending', 'running'):
+                states[service] = 'starting'
+            else:
+                states[service] = 'ready' if phase.state == 'ready' else 'failed'
+        return states
+
+    def required_failed(self):
+        return [service for service, state in self.service_states().items()
+                if state == 'failed' and service in REQUIRED_SERVICES]
+
+    def status(self):
+        states = set(self.service_states().values())
+        if 'starting' in states:
+            return 'starting'
+        if states == {'ready'}:
+            return 'ready'
+        return 'failed' if states == {'failed'} else 'degraded'
+
+    def health(self):
+        return {
+            'status': self.status(),
+            'services': self.service_states(),
+            'cold_start_ms': None if self.cold_start is None else round(self.cold_start * 1000, 1),
+            'phases': {name: phase.to_dict(self.origin) for name, phase in self.phases.items()},
+        }
+
+    async def handle_connection(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            path = urlsplit(head.decode('latin-1').split(' ')[1]).path
+            status = self.status()
+            if path == '/ready':
+                body = json.dumps({'ready': status == 'ready', 'services': self.service_states()}).encode('utf-8')
+                code = '200 OK' if status == 'ready' else '503 Service Unavailable'
+            elif path == '/health':
+                body = json.dumps(self.health()).encode('utf-8')
+                code = '503 Service Unavailable' if status == 'failed' else '200 OK'
+            else:
+                writer.write(http_response('404 Not Found', headers=('Connection: close',)))
+                return
+            writer.write(http_response(code, body, ('Content-Type: application/json', 'Connection: close')))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        if self.game_engine is not None and self.game_engine.journal is not None:
+            self.game_engine.journal.close()  # Write out any journal records still queued
+        if self.eval_client is not None:
+            self.eval_client.close()
+        if self.ai_server is not None:
+            self.ai_server.worker.close()
+
+async def main():
+    launcher = Launcher()
+    try:
+        await launcher.start()
+        if launcher.status() == 'failed':
+            raise RuntimeError('No service could be started')
+        required = launcher.required_failed()
+        if required:
+            # Exit so pm2 restarts the whole process rather than running without them
+            raise RuntimeError(f'Required services not started: {", ".join(required)}')
+        # Keep the program running
+        await asyncio.Future()
+    finally:
+        await launcher.close()
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        log.info('Launcher stopped by user')
+    except Exception as e:
+        log.error('%s', e)
+        raise SystemExit(1)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import atexit
+import collections
+import json
+import os
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+
+# Shared logging for the game engine, AI server and eval client.
+# Calls below the configured level return immediately, and enabled records are only
+# formatted and written by a background thread, so logging never blocks the event loop.
+
+# Load environment variables from .env file
+load_dotenv()
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' for "[LEVEL] message key=value" lines or 'json' for JSON lines
+LOG_BUFFER_SIZE = int(os.getenv('LOG_BUFFER_SIZE', '10000'))  # Records kept while the writer catches up, the oldest are dropped
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '0.05'))
+
+def format_value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('utf-8', 'replace')
+    return value
+
+class LogWriter:
+    """Drains queued records to a stream on a daemon thread.
+
+    The buffer is a ring: when it is full the oldest record is dropped and counted
+    instead of blocking the caller.
+    """
+
+    def __init__(self, stream=None, size=LOG_BUFFER_SIZE, flush_interval=LOG_FLUSH_INTERVAL, output_format=LOG_FORMAT):
+        self.stream = stream
+        self.records = collections.deque(maxlen=size)
+        self.flush_interval = flush_interval
+        self.output_format = output_format
+        self.dropped = 0
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def put(self, record):
+        if len(self.records) == self.records.maxlen:
+            self.dropped += 1
+        self.records.append(record)
+        if self.thread is None:
+            self.start()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.writer, name='log-writer', daemon=True)
+                self.thread.start()
+
+    def writer(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            lines = []
+            while self.records:
+                lines.append(self.format(self.records.popleft()))
+            if self.dropped:
+                lines.append(f'[WARNING] Dropped {self.dropped} log records, the log writer could not keep up')
+                self.dropped = 0
+            if not lines:
+                return
+            stream = self.stream or sys.stdout
+            try:
+                stream.write('\n'.join(lines) + '\n')
+                stream.flush()
+            except Exception:
+                pass
+
+    def format(self, record):
+        created, level, service, message, args, fields = record
+        try:
+            if args:
+                message = message % tuple(format_value(arg) for arg in args)
+        except Exception as e:
+            message = f'{message} {args} (format error: {e})'
+        if self.output_format == 'json':
+            entry = {'time': created, 'level': LEVEL_NAMES[level], 'service': service, 'message': message}
+            for key, value in fields.items():
+                entry[key] = format_value(value)
+            return json.dumps(entry, default=str)
+        if fields:
+            message += ' ' + ' '.join(f'{key}={format_value(value)}' for key, value in fields.items())
+        return f'[{LEVEL_NAMES[level]}] {message}'
+
+    def close(self):
+        self.flush()
+
+writer = LogWriter()
+atexit.register(writer.close)
+
+class Logger:
+    """Leveled logger of one service.
+
+    message is a %-format string; it is only formatted with args on the writer thread,
+    so args must not be mutated after the call (pass encoded bytes rather than live dicts).
+    Keyword arguments become structured fields of the record.
+    """
+
+    def __init__(self, service, level=LOG_LEVEL, writer=writer):
+        self.service = service
+        self.writer = writer
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level = LEVELS[level.upper()] if isinstance(level, str) else level
+        # Checked directly by hot paths that would otherwise build arguments for nothing
+        self.debug_enabled = self.level <= DEBUG
+
+    def log(self, level, message, args, fields):
+        if level >= self.level:
+            self.writer.put((time.time(), level, self.service, message, args, fields))
+
+    def debug(self, message, *args, **fields):
+        if self.debug_enabled:
+            self.writer.put((time.time(), DEBUG, self.service, message, args, fields))
+
+    def info(self, message, *args, **fields):
+        self.log(INFO, message, args, fields)
+
+    def warning(self, message, *args, **fields):
+        self.log(WARNING, message, args, fields)
+
+    def error(self, message, *args, **fields):
+        self.log(ERROR, message, args, fields)
+
+def get_logger(service):
+    return Logger(service)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import json
+import os
+import numpy as np
+from dotenv import load_dotenv
+from imu_wire import AXES
+
+# Load environment variables from .env file
+load_dotenv()
+
+AI_FOLDER = os.getenv('AI_FOLDER', './ai_folder/')
+MODEL_BUNDLE = os.getenv('MODEL_BUNDLE', os.path.join(AI_FOLDER, 'model_bundle.json'))
+BUNDLE_VERSION = 1
+
+# Window length per axis, model input length and number of classes of each device's network
+DEVICE_SHAPES = {
+    'glove': (59, 354, 10),
+    'leg': (40, 240, 4),
+}
+# Raw IMU samples are int16 and are scaled to [-1, 1], keeping the sign
+INPUT_RANGE = (-2**15, 2**15 - 1)
+FEATURE_RANGE = (-1, 1)
+
+"""
+model_bundle.json, everything the ai_server needs besides the bitstream:
+
+{
+  "version": 1,
+  "devices": {
+    "glove": {
+      "target_length": 59,     samples per axis
+      "input_length": 354,     six axes
+      "output_length": 10,
+      "scale": float,          scaled = raw * scale + offset
+      "offset": float,
+      "labels": ["basket", "bomb", ...],  class index -> action_type
+      "weights": "gesture_glove.npz"      network for the CPU inference backend, see inference.py
+    },
+    "leg": {...}
+  }
+}
+"""
+
+class DeviceModel:
+    """Preprocessing constants and class labels of one device's network."""
+
+    __slots__ = ('device', 'target_length', 'input_length', 'output_length', 'scale', 'offset', 'labels', 'weights')
+
+    def __init__(self, device, target_length, input_length, output_length, scale, offset, labels, weights=None):
+        if len(labels) != output_length:
+            raise ValueError(f'{device} model has {len(labels)} labels for {output_length} outputs')
+        self.device = device
+        self.target_length = target_length
+        self.input_length = input_length
+        self.output_length = output_length
+        self.scale = scale
+        self.offset = offset
+        self.labels = tuple(labels)
+        # Weights file of the network for the CPU inference backend, relative to AI_FOLDER
+        self.weights = weights
+
+    def scale_input(self, samples, out=None):
+        # The same operations as MinMaxScaler.transform, so float64 results are identical
+        scaled = np.multiply(samples, self.scale, out=out)
+        scaled += self.offset
+        return scaled
+
+    def fill_input(self, data, out):
+        """Write the IMU window of data into out, input_length floats such as a DMA buffer after its header.
+
+        Each axis is copied straight into its slot of out, zero padded or truncated to target_length,
+        and then scaled in place, so no per-sample Python objects or intermediate arrays are created.
+        data is a decoded binary window with (n, 6) 'samples' (see imu_wire.py) or has one list per axis.
+        """
+        target_length = self.target_length
+        window = out.reshape(len(AXES), target_length)
+        samples = data.get('samples')
+        if samples is not None:
+            # One strided copy transposes the interleaved samples into the axis slots
+            count = min(len(samples), target_length)
+            window[:, :count] = samples[:count].T
+            window[:, count:] = 0
+        else:
+            for row, axis in zip(window, AXES):
+                values = data[axis]
+                count = min(len(values), target_length)
+                row[:count] = values if count == len(values) else values[:count]
+                row[count:] = 0
+        self.scale_input(out, out)
+        return out
+
+    def label(self, index):
+        return self.labels[index]
+
+    def to_dict(self):
+        return {
+            'target_length': self.target_length,
+            'input_length': self.input_length,
+            'output_length': self.output_length,
+            'scale': self.scale,
+            'offset': self.offset,
+            'labels': list(self.labels),
+            'weights': self.weights,
+        }
+
+def load_bundle(path=None):
+    """Return {device: DeviceModel} from a model bundle."""
+    with open(path or MODEL_BUNDLE, 'r') as file:
+        bundle = json.load(file)
+    if bundle.get('version') != BUNDLE_VERSION:
+        raise ValueError(f'Unsupported model bundle version {bundle.get("version")}')
+    return {device: DeviceModel(device, **fields) for device, fields in bundle['devices'].items()}
+
+def save_bundle(models, path=None):
+    bundle = {'version': BUNDLE_VERSION, 'devices': {device: model.to_dict() for device, model in models.items()}}
+    with open(path or MODEL_BUNDLE, 'w') as file:
+        json.dump(bundle, file, indent=2)
+        file.write('\n')
+
+def convert_pickles(label_encoders):
+    """Build the models from {device: path of a pickled LabelEncoder}; needs scikit-learn."""
+    import pickle
+    from sklearn.preprocessing import MinMaxScaler
+
+    # Take the constants from a fitted scaler, so they match what the ai_server used to compute
+    scaler = MinMaxScaler(feature_range=FEATURE_RANGE)
+    scaler.fit(np.array(INPUT_RANGE).reshape(-1, 1))
+    scale, offset = float(scaler.scale_[0]), float(scaler.min_[0])
+    models = {}
+    for device, path in label_encoders.items():
+        with open(path, 'rb') as file:
+            label_encoder = pickle.load(file)
+        target_length, input_length, output_length = DEVICE_SHAPES[device]
+        labels = [str(label) for label in label_encoder.classes_]
+        models[device] = DeviceModel(device, target_length, input_length, output_length, scale, offset, labels,
+                                     f'gesture_{device}.npz')
+    return models
+
+if __name__ == '__main__':
+    # Convert the label encoders pickled next to the bitstream into MODEL_BUNDLE
+    models = convert_pickles({
+        'glove': os.path.join(AI_FOLDER, 'label_encoder.pkl'),
+        'leg': os.path.join(AI_FOLDER, 'label_encoder_leg.pkl'),
+    })
+    save_bundle(models)
+    print(f'[DEBUG] Wrote {MODEL_BUNDLE}: ' + ', '.join(f'{device} {len(model.labels)} labels' for device, model in models.items()))
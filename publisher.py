@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import asyncio
+import contextlib
+import contextvars
+import os
+from dotenv import load_dotenv
+from log import get_logger
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Publishes awaiting their broker confirm at once, 0 awaits every publish before returning
+PUBLISH_WINDOW = int(os.getenv('PUBLISH_WINDOW', '64'))
+
+log = get_logger('publisher')
+
+# Receipt of the delivery being handled by the current task, see Publisher.recording()
+current_receipt = contextvars.ContextVar('current_receipt', default=None)
+
+class Receipt:
+    """The publishes made while one delivery was handled, so it is only acked once they are confirmed."""
+
+    def __init__(self):
+        # (confirmed, publish, destination, body, content_type)
+        self.sent = []
+
+    async def failed(self):
+        """Wait for every publish and return the (publish, destination, body, content_type) that failed."""
+        results = await asyncio.gather(*(sent[0] for sent in self.sent))
+        return [sent[1:] for sent, confirmed in zip(self.sent, results) if not confirmed]
+
+class Publisher:
+    """Pipelined publishing through a Transport, bounded by an in-flight window.
+
+    publish() and publish_exchange() return once the message is handed to the transport, and only
+    wait when window publishes are already in flight. Publishes made inside recording() are added to
+    its Receipt, whose failed() awaits their confirms, so the lock that was held while they were made
+    can be released first. Publishes start in the order they were made and
+    the transports put messages on the wire in call order (aio_pika writes them under a FIFO channel
+    lock), so every destination receives its messages in order while their confirms are awaited
+    concurrently.
+    """
+
+    def __init__(self, transport, window=None):
+        self.transport = transport
+        self.window_size = PUBLISH_WINDOW if window is None else window
+        self.window = asyncio.Semaphore(self.window_size) if self.window_size > 0 else None
+        self.in_flight = set()
+        self.failures = 0
+
+    @contextlib.contextmanager
+    def recording(self):
+        """Record the publishes made by the current task in the yielded Receipt."""
+        receipt = Receipt()
+        token = current_receipt.set(receipt)
+        try:
+            yield receipt
+        finally:
+            current_receipt.reset(token)
+
+    async def publish(self, queue_name, body, content_type=None):
+        await self.submit(self.transport.publish, queue_name, body, content_type)
+
+    async def publish_exchange(self, exchange_name, body, content_type=None):
+        await self.submit(self.transport.publish_exchange, exchange_name, body, content_type)
+
+    async def submit(self, publish, destination, body, content_type):
+        if self.window is None:
+            confirmed = asyncio.get_running_loop().create_future()
+            confirmed.set_result(await self.send(publish, destination, body, content_type))
+        else:
+            await self.window.acquire()
+            confirmed = asyncio.create_task(self.send(publish, destination, body, content_type))
+            self.in_flight.add(confirmed)
+            confirmed.add_done_callback(self.in_flight.discard)
+        receipt = current_receipt.get()
+        if receipt is not None:
+            receipt.sent.append((confirmed, publish, destination, body, content_type))
+
+    async def resend(self, publishes):
+        """Publish (publish, destination, body, content_type) again, recorded like any other publish."""
+        for publish, destination, body, content_type in publishes:
+            await self.submit(publish, destination, body, content_type)
+
+    async def send(self, publish, destination, body, content_type):
+        # Returns whether the publish was confirmed; failures are reported through the Receipt
+        try:
+            await publish(destination, body, content_type)
+            return True
+        except Exception as e:
+            self.failures += 1
+            log.error('Failed to publish to "%s": %s', destination, e)
+            return False
+        finally:
+            if self.window is not None:
+                self.window.release()
+
+    async def flush(self):
+        """Wait for every publish made so far to be confirmed."""
+        while self.in_flight:
+            await asyncio.gather(*list(self.in_flight))
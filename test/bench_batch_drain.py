@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, FakeTransport, quiet
+import game_engine
+
+quiet(game_engine.log)
+
+# Simulated broker round-trip for every publish made by the game engine
+PUBLISH_LATENCY = float(os.getenv('PUBLISH_LATENCY', '0.001'))
+BURST_COUNT = int(os.getenv('BURST_COUNT', '100'))
+BURST_SIZE = int(os.getenv('BURST_SIZE', '20'))
+
+class CountingLock(asyncio.Lock):
+    def __init__(self):
+        super().__init__()
+        self.acquisitions = 0
+
+    async def acquire(self):
+        self.acquisitions += 1
+        return await super().acquire()
+
+def build_bursts(rng):
+    # Phones flood visibility updates, with an occasional action inside the burst
+    bursts = []
+    for _ in range(BURST_COUNT):
+        burst = []
+        for i in range(BURST_SIZE):
+            if i == BURST_SIZE // 2:
+                burst.append({'action': True, 'player_id': rng.choice([1, 2]), 'action_type': 'gun', 'hit': True})
+            else:
+                burst.append({'game_state': {rng.choice(['p1', 'p2']): {'opponent_visible': rng.random() < 0.5}}})
+        bursts.append(burst)
+    return bursts
+
+async def run(bursts, mode):
+    engine = game_engine.GameEngine(FakeTransport(PUBLISH_LATENCY))
+    match = engine.get_match(game_engine.DEFAULT_MATCH_ID)
+    match.lock = CountingLock()
+
+    total = sum(len(burst) for burst in bursts)
+    finished = asyncio.Event()
+    processed = 0
+
+    def done(message):
+        nonlocal processed
+        processed += 1
+        if processed == total:
+            finished.set()
+
+    if mode == 'batch':
+        consume = engine.enqueue_message
+        batch_task = asyncio.create_task(engine.drain_batches())
+    else:
+        consume = engine.process_message
+
+    start = time.perf_counter()
+    tasks = []
+    for burst in bursts:
+        # Every delivery of a burst lands at once, like the aio_pika consumer spawning a task per message
+        tasks.extend(asyncio.create_task(consume(FakeIncomingMessage(data, done))) for data in burst)
+        await asyncio.sleep(0)
+    await finished.wait()
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*tasks)
+    await engine.publisher.flush()
+    if mode == 'batch':
+        batch_task.cancel()
+
+    broadcasts = engine.transport.broadcasts
+    eval_messages = engine.transport.eval_messages
+    return total, elapsed, broadcasts, eval_messages, match.lock.acquisitions
+
+async def main():
+    bursts = build_bursts(random.Random(0))
+    print(f'[DEBUG] {BURST_COUNT} bursts of {BURST_SIZE} messages, publish latency {PUBLISH_LATENCY * 1000:.1f} ms')
+    print(f'{"mode":>6} {"seconds":>8} {"msg/s":>9} {"broadcasts":>11} {"eval msgs":>10} {"lock acquisitions":>18}')
+    for mode in ['event', 'batch']:
+        total, elapsed, broadcasts, eval_messages, acquisitions = await run(bursts, mode)
+        print(f'{mode:>6} {elapsed:>8.3f} {total / elapsed:>9.1f} {broadcasts:>11} {eval_messages:>10} {acquisitions:>18}')
+
+if __name__ == '__main__':
+    asyncio.run(main())
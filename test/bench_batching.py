@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ai_server
+import batcher
+import inference
+from bench_inference import HIDDEN, stand_in_network
+from imu_wire import AXES, encode_imu
+from inference import CpuBackend
+from model_bundle import load_bundle
+from transport import LocalBroker, LocalTransport
+from wire import decode
+
+# Keep the services' log records out of the results
+for logger in (ai_server.log, batcher.log, inference.log):
+    logger.set_level('WARNING')
+
+PLAYERS = int(os.getenv('PLAYERS', '4'))
+BURST = int(os.getenv('BURST', '4000'))
+ROUNDS = int(os.getenv('ROUNDS', '200'))
+# Every round each player sends a glove and a leg window, all within JITTER_MS
+ROUND_MS = float(os.getenv('ROUND_MS', '10'))
+JITTER_MS = float(os.getenv('JITTER_MS', '1'))
+BATCH_MS = [float(ms) for ms in os.getenv('BATCH_MS', '0,1,2,5').split(',')]
+
+class PerMessage:
+    """The former ai_server path, one executor call per window."""
+
+    def __init__(self, classifier):
+        self.classifier = classifier
+        self.batches = self.windows = 0
+
+    async def predict(self, data, model):
+        self.batches += 1
+        self.windows += 1
+        return await asyncio.get_running_loop().run_in_executor(None, self.classifier.predict, data, model)
+
+def build_windows(rng, models, count):
+    windows = []
+    for index in range(count):
+        model = models['glove' if index % 2 else 'leg']
+        window = {axis: rng.integers(-2**15, 2**15, model.target_length).tolist() for axis in AXES}
+        # match_id is carried into the prediction, which tells the bench which window it answers
+        window.update(player_id=1 + index // 2 % PLAYERS, imu_device=model.device, match_id=str(index))
+        windows.append(encode_imu(window))
+    return windows
+
+async def serve(classifier, batch_ms, windows, schedule):
+    """Publish windows[i] at schedule[i] seconds, return the elapsed time, latencies and mean batch size."""
+    broker = LocalBroker()
+    server = ai_server.AIServer(LocalTransport(broker), classifier)
+    server.batcher = PerMessage(classifier) if batch_ms is None else batcher.MicroBatcher(server.worker, batch_ms, capacity=ai_server.AI_PREFETCH_COUNT)
+    await server.start()
+    broker.bind('bench_predictions', ai_server.UPDATE_PREDICTIONS_EXCHANGE)
+    predictions = broker.queue('bench_predictions')
+    client = LocalTransport(broker)
+    sent = [0.0] * len(windows)
+    latencies = [0.0] * len(windows)
+
+    async def receive():
+        for _ in windows:
+            body, content_type = await predictions.get()
+            index = int(decode(body, content_type)['match_id'])
+            latencies[index] = time.perf_counter() - sent[index]
+
+    receiver = asyncio.create_task(receive())
+    start = time.perf_counter()
+    for index, ((body, content_type), at) in enumerate(zip(windows, schedule)):
+        delay = start + at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent[index] = time.perf_counter()
+        await client.publish(ai_server.AI_QUEUE, body, content_type)
+    await receiver
+    elapsed = time.perf_counter() - start
+    await server.transport.close()
+    server.worker.close()
+    latencies.sort()
+    return elapsed, latencies, server.batcher.windows / server.batcher.batches
+
+def main():
+    rng = np.random.default_rng(0)
+    models = load_bundle()
+    with tempfile.TemporaryDirectory() as folder:
+        for device, model in models.items():
+            network = stand_in_network(rng, model.input_length, model.output_length, HIDDEN)
+            network.save(os.path.join(folder, model.weights))
+        classifier = CpuBackend(models, folder)
+
+    # A batch answers every window like predict() does, and a malformed window fails alone
+    for model in models.values():
+        windows = [{axis: rng.integers(-2**15, 2**15, model.target_length) for axis in AXES} for _ in range(40)]
+        windows[7] = {'ax': [0]}
+        results = classifier.predict_batch(windows, model)
+        assert isinstance(results[7], Exception), 'A malformed window did not fail'
+        for index, data in enumerate(windows):
+            if index != 7:
+                action_index, confidence = classifier.predict(data, model)
+                assert results[index][0] == action_index and np.isclose(results[index][1], confidence), 'Batch differs'
+
+    burst = build_windows(rng, models, BURST)
+    per_round = 2 * PLAYERS
+    rounds = build_windows(rng, models, ROUNDS * per_round)
+    schedule = [index // per_round * ROUND_MS / 1000 + rng.uniform(0, JITTER_MS / 1000) for index in range(len(rounds))]
+    # Published in time order, the match_id still names the window
+    order = np.argsort(schedule, kind='stable')
+    rounds = [rounds[index] for index in order]
+    schedule = [schedule[index] for index in order]
+
+    print(f'[DEBUG] CPU backend with hidden layers {HIDDEN}, {PLAYERS} players, prefetch {ai_server.AI_PREFETCH_COUNT}, '
+          f'burst of {BURST} windows, {ROUNDS} rounds of {per_round} windows every {ROUND_MS:g} ms within {JITTER_MS:g} ms')
+    print(f'{"batching":>10} {"burst win/s":>12} {"batch":>6} {"rounds p50 ms":>14} {"p99 ms":>7} {"batch":>6}')
+    for batch_ms in [None, *BATCH_MS]:
+        name = 'off' if batch_ms is None else f'{batch_ms:g} ms'
+        elapsed, _, burst_batch = asyncio.run(serve(classifier, batch_ms, burst, [0.0] * len(burst)))
+        _, latencies, round_batch = asyncio.run(serve(classifier, batch_ms, rounds, schedule))
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        print(f'{name:>10} {BURST / elapsed:>12.0f} {burst_batch:>6.1f} {p50:>14.2f} {p99:>7.2f} {round_batch:>6.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import purge_queues
+from transport import BrokerClient, RabbitMQTransport, BROKER, BROKERUSER, PASSWORD, RABBITMQ_PORT
+
+# Keep the services' log records out of the results
+purge_queues.log.set_level('WARNING')
+
+MESSAGES = int(os.getenv('MESSAGES', '20000'))
+# Concurrent publishers, each to its own queue
+PUBLISHERS = int(os.getenv('PUBLISHERS', '8'))
+SERVICES = ['game_engine', 'ai_server', 'eval_client']
+
+BENCH_QUEUE = 'bench_broker_client_queue'
+
+def new_client(channels=None):
+    return BrokerClient(BROKER, RABBITMQ_PORT, BROKERUSER, PASSWORD, channels)
+
+async def startup(shared):
+    # What the co-located services do at startup: connect, purge and declare their queues
+    start = time.perf_counter()
+    client = new_client() if shared else None
+    transports = []
+    for _ in SERVICES:
+        transport = RabbitMQTransport(client=client or new_client())
+        await transport.connect()
+        await purge_queues.QueuePurger(transport).run_purge()
+        transports.append(transport)
+    elapsed = time.perf_counter() - start
+    for transport in transports:
+        await transport.close()
+    return elapsed
+
+async def publish_rate(channels):
+    client = new_client(channels)
+    transport = RabbitMQTransport(client=client)
+    await transport.connect()
+    queues = [f'{BENCH_QUEUE}_{index}' for index in range(PUBLISHERS)]
+    for queue_name in queues:
+        await transport.declare_queue(queue_name)
+        await transport.purge(queue_name)
+
+    async def publisher(queue_name):
+        for _ in range(MESSAGES // PUBLISHERS):
+            await transport.publish(queue_name, b'{}')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(publisher(queue_name) for queue_name in queues))
+    elapsed = time.perf_counter() - start
+    stats = transport.channel_stats()
+    for queue_name in queues:
+        await transport.purge(queue_name)
+    await transport.close()
+    return elapsed, stats
+
+async def main():
+    if not BROKER:
+        print('[DEBUG] Set BROKER to run against a RabbitMQ broker')
+        return
+    print(f'[DEBUG] Startup of {len(SERVICES)} co-located services')
+    print(f'  one connection each:  {await startup(False) * 1000:.1f} ms')
+    print(f'  shared connection:    {await startup(True) * 1000:.1f} ms')
+
+    print(f'[DEBUG] {MESSAGES} confirmed publishes from {PUBLISHERS} concurrent publishers')
+    for channels in (1, 2, 4, 8):
+        elapsed, stats = await publish_rate(channels)
+        print(f'  {channels} channel(s): {MESSAGES / elapsed:>9.1f} msg/s')
+        for channel in stats:
+            print(f'    {channel}')
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import quiet
+import game_engine
+from dedup import new_message_id
+from transport import LocalBroker, LocalMessage, LocalTransport
+
+quiet(game_engine.log)
+
+MESSAGE_COUNT = int(os.getenv('MESSAGE_COUNT', '2000'))
+# Share of messages delivered a second time, like the unacked messages after a reconnect
+REDELIVERY_RATE = float(os.getenv('REDELIVERY_RATE', '0.05'))
+# Simulated broker to consumer latency of every delivery
+DELIVERY_LATENCY = float(os.getenv('DELIVERY_LATENCY', '0.001'))
+PREFETCH_COUNTS = [1, 8, 64, 256]
+
+class SlowDeliveryTransport(LocalTransport):
+    async def handle(self, callback, message):
+        await asyncio.sleep(DELIVERY_LATENCY)
+        await super().handle(callback, message)
+
+def build_messages(rng, with_ids):
+    messages = []
+    for i in range(MESSAGE_COUNT):
+        player_id = rng.choice([1, 2])
+        if i % 3:
+            data = {'action': True, 'player_id': player_id,
+                    'action_type': rng.choice(['gun', 'bomb', 'basket', 'reload', 'shield']), 'hit': True}
+        else:
+            data = {'game_state': {f'p{player_id}': {'opponent_visible': rng.random() < 0.7}}}
+        if with_ids:
+            data['message_id'] = new_message_id()
+        messages.append(json.dumps(data).encode('utf-8'))
+    return messages
+
+def with_redeliveries(rng, messages):
+    # Each redelivered message comes again a little later in the stream
+    stream = list(messages)
+    for index in sorted(rng.sample(range(len(messages)), int(len(messages) * REDELIVERY_RATE)), reverse=True):
+        stream.insert(min(len(stream), index + rng.randint(1, 20)), messages[index])
+    return stream
+
+async def expected_state(messages):
+    # Every message applied exactly once, in order
+    engine = game_engine.GameEngine(LocalTransport(LocalBroker()))
+    for body in messages:
+        await engine.process_message(LocalMessage(body, None))
+    await engine.publisher.flush()
+    return engine.get_match(game_engine.DEFAULT_MATCH_ID).state.to_dict()
+
+async def run(stream, prefetch_count):
+    broker = LocalBroker()
+    engine = game_engine.GameEngine(SlowDeliveryTransport(broker))
+    done = asyncio.Event()
+    processed = 0
+
+    async def consume(message):
+        nonlocal processed
+        await engine.process_message(message)
+        processed += 1
+        if processed == len(stream):
+            done.set()
+
+    for body in stream:
+        broker.publish(game_engine.UPDATE_GE_QUEUE, body)
+    start = time.perf_counter()
+    await engine.transport.consume(game_engine.UPDATE_GE_QUEUE, consume, prefetch_count)
+    await done.wait()
+    await engine.publisher.flush()
+    elapsed = time.perf_counter() - start
+    await engine.transport.close()
+    return elapsed, engine.get_match(game_engine.DEFAULT_MATCH_ID).state.to_dict(), engine.dedup.duplicates
+
+async def main():
+    print(f'[DEBUG] {MESSAGE_COUNT} messages, {REDELIVERY_RATE:.0%} redelivered, '
+          f'{DELIVERY_LATENCY * 1000:.1f} ms delivery latency')
+    print(f'{"ids":>4} {"prefetch":>9} {"seconds":>8} {"msg/s":>9} {"skipped":>8} {"state":>8}')
+    for with_ids in (False, True):
+        rng = random.Random(0)
+        messages = build_messages(rng, with_ids)
+        stream = with_redeliveries(rng, messages)
+        expected = await expected_state(messages)
+        for prefetch_count in PREFETCH_COUNTS:
+            elapsed, state, skipped = await run(stream, prefetch_count)
+            verdict = 'exact' if state == expected else 'wrong'
+            print(f'{"yes" if with_ids else "no":>4} {prefetch_count:>9} {elapsed:>8.3f} '
+                  f'{len(stream) / elapsed:>9.1f} {skipped:>8} {verdict:>8}')
+            if with_ids:
+                assert state == expected, 'A redelivered message was applied twice'
+
+if __name__ == '__main__':
+    asyncio.run(main())
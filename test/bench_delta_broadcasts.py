@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, FakeTransport, quiet
+import game_engine
+
+quiet(game_engine.log)
+
+MESSAGE_COUNT = int(os.getenv('MESSAGE_COUNT', '5000'))
+KEYFRAME_INTERVAL = int(os.getenv('KEYFRAME_INTERVAL', '30'))
+
+class DeltaReceiver:
+    # Applies broadcasts the way a visualizer would and spots gaps in seq
+    def __init__(self):
+        self.game_state = None
+        self.last_seq = 0
+        self.gaps = 0
+
+    def receive(self, data):
+        seq = data['seq']
+        if seq != self.last_seq + 1:
+            self.gaps += 1
+        self.last_seq = seq
+        if data['keyframe']:
+            self.game_state = data['game_state']
+        elif self.game_state is not None:
+            for player_key, changed in data['game_state'].items():
+                self.game_state[player_key].update(changed)
+
+def build_messages(rng):
+    # Mostly visibility updates from phones, with actions mixed in
+    messages = []
+    for _ in range(MESSAGE_COUNT):
+        if rng.random() < 0.3:
+            messages.append({
+                'action': True,
+                'player_id': rng.choice([1, 2]),
+                'action_type': rng.choice(['gun', 'gun', 'reload', 'shield', 'bomb', 'basket']),
+                'hit': rng.random() < 0.5,
+            })
+        else:
+            messages.append({
+                'game_state': {
+                    rng.choice(['p1', 'p2']): {
+                        'opponent_visible': rng.random() < 0.5,
+                        'opponent_in_rain_bomb': rng.choice([0, 0, 1])
+                    }
+                }
+            })
+    return messages
+
+async def run(messages, delta):
+    game_engine.DELTA_BROADCASTS = delta
+    game_engine.KEYFRAME_INTERVAL = KEYFRAME_INTERVAL
+    engine = game_engine.GameEngine(FakeTransport(record=True))
+    for data in messages:
+        await engine.process_message(FakeIncomingMessage(data))
+    await engine.publisher.flush()
+    return engine.transport.published[game_engine.UPDATE_EVERYONE_EXCHANGE]
+
+async def main():
+    messages = build_messages(random.Random(0))
+    full_bodies = await run(messages, delta=False)
+    delta_bodies = await run(messages, delta=True)
+
+    # Every delta broadcast must rebuild exactly the full broadcast sent in its place
+    receiver = DeltaReceiver()
+    for full_body, delta_body in zip(full_bodies, delta_bodies):
+        receiver.receive(json.loads(delta_body))
+        assert receiver.game_state == json.loads(full_body)['game_state'], 'Delta receiver diverged from full state'
+    assert receiver.gaps == 0
+
+    full_bytes = sum(len(body) for body in full_bodies)
+    delta_bytes = sum(len(body) for body in delta_bodies)
+    print(f'[DEBUG] {len(full_bodies)} broadcasts for {MESSAGE_COUNT} messages, keyframe every {KEYFRAME_INTERVAL}')
+    print(f'  full:  {full_bytes:>9} bytes ({full_bytes / len(full_bodies):.0f} per broadcast)')
+    print(f'  delta: {delta_bytes:>9} bytes ({delta_bytes / len(delta_bodies):.0f} per broadcast, {delta_bytes / full_bytes:.0%} of full)')
+
+if __name__ == '__main__':
+    asyncio.run(main())
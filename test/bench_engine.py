@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import game_engine
+from transport import LocalBroker, LocalMessage, LocalTransport
+
+# Benchmark suite for GameEngine.process_message over synthetic message streams.
+#
+#   python test/bench_engine.py --output results.json
+#   python test/bench_engine.py --baseline results.json
+#
+# Messages go through a LocalTransport on a private broker, so no RabbitMQ is needed.
+
+# The engine's log records are written by a background thread
+game_engine.log.set_level('WARNING')
+
+SCENARIOS = ['action', 'visibility', 'rain_bomb', 'mixed']
+PLAYERS = [1, 2]
+SHOTS = ['gun', 'gun', 'gun', 'bomb', 'shield', 'reload', 'basket', 'volley', 'soccer', 'bowl']
+
+def action(rng):
+    return {'action': True, 'player_id': rng.choice(PLAYERS), 'action_type': rng.choice(SHOTS), 'hit': rng.random() < 0.7}
+
+def visibility(rng):
+    return {'game_state': {rng.choice(['p1', 'p2']): {'opponent_visible': rng.random() < 0.6}}}
+
+def rain_bomb(rng):
+    return {'game_state': {rng.choice(['p1', 'p2']): {
+        'opponent_visible': rng.random() < 0.8,
+        'opponent_in_rain_bomb': rng.choice([1, 1, 2, 3]),
+    }}}
+
+def correction(rng):
+    # Game state sent back by the eval client
+    stats = {'hp': rng.randint(10, 100), 'bullets': rng.randint(0, 6), 'bombs': rng.randint(0, 2),
+             'shield_hp': 0, 'deaths': rng.randint(0, 3), 'shields': rng.randint(0, 3)}
+    return {'update': True, 'game_state': {'p1': dict(stats), 'p2': dict(stats)}}
+
+def scenario_message(scenario, rng):
+    roll = rng.random()
+    if scenario == 'action':
+        return action(rng) if roll < 0.9 else visibility(rng)
+    if scenario == 'visibility':
+        return visibility(rng) if roll < 0.95 else action(rng)
+    if scenario == 'rain_bomb':
+        return rain_bomb(rng) if roll < 0.6 else action(rng)
+    # Mixed: telemetry dominated with actions, rain bombs and eval corrections in between
+    if roll < 0.5:
+        return visibility(rng)
+    if roll < 0.75:
+        return action(rng)
+    if roll < 0.95:
+        return rain_bomb(rng)
+    return correction(rng)
+
+def scenario_bodies(scenario, count, seed):
+    rng = random.Random(f'{scenario}-{seed}')
+    return [json.dumps(scenario_message(scenario, rng)).encode('utf-8') for _ in range(count)]
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+async def run_scenario(scenario, messages, warmup, seed, repeat):
+    transport = LocalTransport(LocalBroker())
+    engine = game_engine.GameEngine(transport)
+    engine.get_match(game_engine.DEFAULT_MATCH_ID)
+    bodies = scenario_bodies(scenario, warmup + messages, seed)
+
+    async def process(body):
+        await engine.process_message(LocalMessage(body, None))
+        # Nothing consumes the output queues here
+        await transport.purge(game_engine.UPDATE_EVAL_SERVER_QUEUE)
+
+    for body in bodies[:warmup]:
+        await process(body)
+    bodies = bodies[warmup:]
+
+    # Timed passes, the fastest one is reported to filter out noise from the rest of the machine
+    best = None
+    for _ in range(repeat):
+        latencies = []
+        gc.collect()
+        start = time.perf_counter()
+        for body in bodies:
+            message_start = time.perf_counter()
+            await engine.process_message(LocalMessage(body, None))
+            latencies.append(time.perf_counter() - message_start)
+            await transport.purge(game_engine.UPDATE_EVAL_SERVER_QUEUE)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, latencies)
+    elapsed, latencies = best
+
+    # Allocation pass, separate because tracing slows everything down
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    allocated = 0
+    for body in bodies:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        await process(body)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    gc.collect()
+    net_blocks = sys.getallocatedblocks() - blocks_before
+
+    latencies.sort()
+    return {
+        'messages': len(bodies),
+        'msg_per_s': len(bodies) / elapsed,
+        'p50_us': percentile(latencies, 0.50) * 1e6,
+        'p95_us': percentile(latencies, 0.95) * 1e6,
+        'p99_us': percentile(latencies, 0.99) * 1e6,
+        'peak_alloc_bytes_per_msg': allocated / len(bodies),
+        'net_blocks_per_msg': net_blocks / len(bodies),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+def print_results(results, baseline):
+    print(f'{"scenario":>10} {"msg/s":>10} {"p50 us":>8} {"p95 us":>8} {"p99 us":>8} {"alloc B/msg":>12} {"blocks/msg":>11}')
+    for scenario, result in results['scenarios'].items():
+        print(f'{scenario:>10} {result["msg_per_s"]:>10.0f} {result["p50_us"]:>8.1f} {result["p95_us"]:>8.1f} '
+              f'{result["p99_us"]:>8.1f} {result["peak_alloc_bytes_per_msg"]:>12.0f} {result["net_blocks_per_msg"]:>11.2f}')
+    if baseline is None:
+        return
+    print(f'[DEBUG] Change against baseline {baseline.get("commit")} (positive msg/s and negative latency are better)')
+    print(f'{"scenario":>10} {"msg/s":>10} {"p50":>8} {"p95":>8} {"p99":>8} {"alloc":>12}')
+    for scenario, result in results['scenarios'].items():
+        base = baseline['scenarios'].get(scenario)
+        if base is None:
+            continue
+        changes = [
+            (result[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            for key in ['msg_per_s', 'p50_us', 'p95_us', 'p99_us', 'peak_alloc_bytes_per_msg']
+        ]
+        print(f'{scenario:>10} {changes[0]:>+9.1f}% {changes[1]:>+7.1f}% {changes[2]:>+7.1f}% '
+              f'{changes[3]:>+7.1f}% {changes[4]:>+11.1f}%')
+
+def regressions(results, baseline, threshold):
+    # Scenarios whose throughput dropped by more than threshold percent
+    failed = []
+    for scenario, result in results['scenarios'].items():
+        base = baseline['scenarios'].get(scenario)
+        if base and result['msg_per_s'] < base['msg_per_s'] * (1 - threshold / 100):
+            failed.append(scenario)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='GameEngine throughput and latency benchmarks')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated subset of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--warmup', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='Timed passes per scenario, the fastest is reported')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results previously written with --output')
+    parser.add_argument('--fail-threshold', type=float, help='Exit with status 1 if msg/s drops by more than this percentage against the baseline')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f'Unknown scenario "{scenario}"')
+
+    results = {
+        'commit': git_commit(),
+        'time': time.time(),
+        'python': platform.python_version(),
+        'engine_mode': game_engine.ENGINE_MODE,
+        'delta_broadcasts': game_engine.DELTA_BROADCASTS,
+        'seed': args.seed,
+        'messages': args.messages,
+        'scenarios': {},
+    }
+    for scenario in scenarios:
+        results['scenarios'][scenario] = asyncio.run(run_scenario(scenario, args.messages, args.warmup, args.seed, args.repeat))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f'[DEBUG] Wrote results to {args.output}')
+
+    if baseline is not None and args.fail_threshold is not None:
+        failed = regressions(results, baseline, args.fail_threshold)
+        if failed:
+            print(f'[ERROR] Throughput regressed by more than {args.fail_threshold}% in: {", ".join(failed)}')
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
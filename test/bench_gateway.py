@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+import asyncio
+import base64
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, FakeTransport, quiet
+import game_engine
+import gateway
+from gateway import GatewayClient, StateGateway, OPCODE_CLOSE, OPCODE_PONG, read_websocket_frame
+
+quiet(game_engine.log, gateway.log)
+
+CLIENTS = int(os.getenv('CLIENTS', '300'))
+# Clients that connect and never read, like a phone on a dead link
+SLOW_CLIENTS = int(os.getenv('SLOW_CLIENTS', '50'))
+ACTION_COUNT = int(os.getenv('ACTION_COUNT', '3000'))
+POLLERS = int(os.getenv('POLLERS', '50'))
+POLLS = int(os.getenv('POLLS', '40'))  # Requests per poller
+
+async def open_websocket(port, receive_buffer=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if receive_buffer:
+        # Must be set before connecting to cap the advertised window
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    writer.write((f'GET /ws?match_id={game_engine.DEFAULT_MATCH_ID} HTTP/1.1\r\nHost: localhost\r\n'
+                  f'Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n'
+                  f'Sec-WebSocket-Version: 13\r\n\r\n').encode('ascii'))
+    head = await reader.readuntil(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 101'), head
+    return reader, writer
+
+class FastClient:
+    def __init__(self):
+        self.received = 0
+        self.last = None
+
+    async def run(self, reader):
+        while True:
+            _, payload = await read_websocket_frame(reader)
+            self.received += 1
+            self.last = payload
+
+async def drive_engine(engine):
+    # Actions from both players, yielding between messages so the gateway's senders can run
+    latencies = []
+    for index in range(ACTION_COUNT):
+        message = FakeIncomingMessage({'action': True, 'player_id': 1 + index % 2,
+                                       'action_type': ['gun', 'shield', 'reload', 'basket'][index % 4], 'hit': True})
+        start = time.perf_counter()
+        await engine.process_message(message)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0)
+    await engine.publisher.flush()
+    latencies.sort()
+    return statistics.median(latencies) * 1e6, latencies[int(len(latencies) * 0.99) - 1] * 1e6
+
+async def poll(port, results):
+    # Keep-alive connection polling the state with If-None-Match
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    etag = None
+    for _ in range(POLLS):
+        request = f'GET /state?match_id={game_engine.DEFAULT_MATCH_ID} HTTP/1.1\r\nHost: localhost\r\n'
+        if etag:
+            request += f'If-None-Match: {etag}\r\n'
+        writer.write((request + '\r\n').encode('ascii'))
+        head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+        headers = dict(line.split(': ', 1) for line in head.split('\r\n')[1:] if ': ' in line)
+        await reader.readexactly(int(headers['Content-Length']))
+        etag = headers.get('ETag', etag)
+        results[head.split(' ')[1]] = results.get(head.split(' ')[1], 0) + 1
+    writer.close()
+
+def check_control_frames():
+    # A client that falls behind loses stale states but still gets its pong and close frames
+    client = GatewayClient(None, 2)
+    client.push_control(b'pong 1', OPCODE_PONG)
+    client.push(b'state 1')
+    client.push_control(b'pong 2', OPCODE_PONG)
+    client.push_control(b'close', OPCODE_CLOSE)
+    for index in range(2, 6):
+        client.push(f'state {index}'.encode('ascii'))
+    frames = [frame for frame, _ in client.frames]
+    assert frames == [b'pong 2', b'close', b'state 5'], frames
+
+async def main():
+    check_control_frames()
+    engine = game_engine.GameEngine(FakeTransport())
+    p50, p99 = await drive_engine(engine)
+    print(f'[DEBUG] {ACTION_COUNT} actions, {CLIENTS} WebSocket clients ({SLOW_CLIENTS} never read), '
+          f'{POLLERS} pollers x {POLLS} requests')
+    print(f'  process_message without gateway: p50 {p50:.1f} us, p99 {p99:.1f} us')
+
+    engine = game_engine.GameEngine(FakeTransport())
+    engine.gateway = StateGateway(engine.matches, game_engine.DEFAULT_MATCH_ID, host='127.0.0.1', port=0)
+    await engine.gateway.start()
+    port = engine.gateway.port
+
+    fast_clients = []
+    readers = []
+    # Kept referenced, a collected StreamWriter closes its socket
+    writers = []
+    for index in range(CLIENTS):
+        slow = index < SLOW_CLIENTS
+        # Slow clients keep the socket open with a tiny receive window and never read from it
+        reader, writer = await open_websocket(port, 4096 if slow else None)
+        writers.append(writer)
+        if not slow:
+            client = FastClient()
+            fast_clients.append(client)
+            readers.append(asyncio.create_task(client.run(reader)))
+    while engine.gateway.client_count() < CLIENTS:
+        await asyncio.sleep(0.01)
+
+    start = time.perf_counter()
+    p50, p99 = await drive_engine(engine)
+    elapsed = time.perf_counter() - start
+    print(f'  process_message with gateway:    p50 {p50:.1f} us, p99 {p99:.1f} us ({elapsed:.1f} s with the clients sharing the loop)')
+
+    await asyncio.sleep(0.5)  # Let the fast clients catch up
+    final = json.loads(engine.get_match(game_engine.DEFAULT_MATCH_ID).snapshot.get_state_json())
+    up_to_date = sum(1 for client in fast_clients if json.loads(client.last)['game_state'] == final)
+    received = [client.received for client in fast_clients]
+    subscribers = engine.gateway.subscribers[game_engine.DEFAULT_MATCH_ID]
+    dropped = sum(client.dropped for client in subscribers)
+    stalled = sorted(client.sent for client in subscribers)[:SLOW_CLIENTS]
+    print(f'  fast clients: {up_to_date}/{len(fast_clients)} at the final state, '
+          f'frames received min {min(received)} median {statistics.median(received):.0f}')
+    if stalled:
+        print(f'  slow clients: {dropped} frames dropped, at most {stalled[-1]} frames written to each')
+
+    results = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(poll(port, results) for _ in range(POLLERS)))
+    elapsed = time.perf_counter() - start
+    print(f'  state polls: {POLLERS * POLLS / elapsed:.0f} req/s, responses {results}')
+
+    for task in readers:
+        task.cancel()
+    for writer in writers:
+        writer.close()
+    await engine.gateway.close()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dedup import new_message_id
+from imu_wire import AXES, decode_imu_message, encode_imu
+from model_bundle import load_bundle
+from transport import LocalMessage
+from wire import encode
+
+WINDOWS = int(os.getenv('WINDOWS', '5000'))
+
+def build_window(rng, device, length):
+    window = {'message_id': new_message_id(), 'player_id': 1, 'imu_device': device, 'timestamp': time.time()}
+    window.update({axis: rng.integers(-2**15, 2**15, length).tolist() for axis in AXES})
+    return window
+
+def check_uneven_window(rng, model):
+    # Uneven axes and a string player_id pack into a window that preprocesses like its JSON form
+    window = build_window(rng, model.device, model.target_length)
+    window['player_id'] = '2'
+    window['ay'] = window['ay'][:model.target_length // 2]
+    window['gz'] = window['gz'] + [7] * 5
+    expected = model.fill_input(window, np.zeros(model.input_length, dtype=np.float32))
+    body, content_type = encode_imu(window)
+    decoded = decode_imu_message(LocalMessage(body, None, content_type))
+    actual = model.fill_input(decoded, np.zeros(model.input_length, dtype=np.float32))
+    assert decoded['player_id'] == 2 and np.array_equal(actual, expected), 'Uneven window packed differently'
+
+def main():
+    rng = np.random.default_rng(0)
+    for model in load_bundle().values():
+        check_uneven_window(rng, model)
+    print(f'[DEBUG] {WINDOWS} windows per device, decoded and preprocessed into a float32 buffer')
+    print(f'{"device":>6} {"format":>8} {"bytes":>6} {"us/window":>10}')
+    for device, model in load_bundle().items():
+        windows = [build_window(rng, device, model.target_length) for _ in range(WINDOWS)]
+        out = np.zeros(model.input_length, dtype=np.float32)
+        results = {}
+        for wire_format in ('json', 'msgpack', 'int16'):
+            if wire_format == 'int16':
+                encoded = [encode_imu(window) for window in windows]
+            else:
+                encoded = [encode(window, wire_format) for window in windows]
+            messages = [LocalMessage(body, None, content_type) for body, content_type in encoded]
+            start = time.perf_counter()
+            for message in messages:
+                model.fill_input(decode_imu_message(message), out)
+            per_window = (time.perf_counter() - start) / WINDOWS * 1e6
+            results[wire_format] = out.copy()
+            size = sum(len(body) for body, _ in encoded) / WINDOWS
+            print(f'{device:>6} {wire_format:>8} {size:>6.0f} {per_window:>10.1f}')
+        assert all(np.array_equal(results['json'], result) for result in results.values()), 'Formats disagree'
+
+if __name__ == '__main__':
+    main()
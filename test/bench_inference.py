@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ai_server
+import inference
+from dedup import new_message_id
+from imu_wire import AXES, encode_imu
+from inference import CpuBackend, DenseNetwork, FpgaBackend
+from model_bundle import load_bundle
+from transport import LocalBroker, LocalTransport
+
+# Keep the services' log records out of the results
+ai_server.log.set_level('WARNING')
+inference.log.set_level('WARNING')
+
+WINDOWS = int(os.getenv('WINDOWS', '2000'))
+# Hidden layers of the stand-in networks, the trained weights are exported by the training notebooks
+HIDDEN = [int(size) for size in os.getenv('HIDDEN', '64,32').split(',')]
+
+def stand_in_network(rng, input_length, output_length, hidden=(64, 32)):
+    """An untrained network of the given shape, relu hidden layers and a softmax output."""
+    sizes = [input_length, *hidden, output_length]
+    return DenseNetwork([
+        (rng.normal(0, 1 / np.sqrt(inputs), (inputs, outputs)), rng.normal(0, 0.1, outputs),
+         'softmax' if index == len(sizes) - 2 else 'relu')
+        for index, (inputs, outputs) in enumerate(zip(sizes, sizes[1:]))
+    ])
+
+def reference_forward(network, inputs):
+    # float64 forward pass written out independently of DenseNetwork.forward
+    x = inputs.astype(np.float64)
+    for weights, bias, activation in network.layers:
+        x = x @ weights.astype(np.float64) + bias
+        if activation == 'relu':
+            x = np.maximum(x, 0)
+        elif activation == 'softmax':
+            x = np.exp(x - x.max())
+            x = x / x.sum()
+    return x
+
+def build_windows(rng, models):
+    windows = []
+    for index in range(WINDOWS):
+        model = models['glove' if index % 2 else 'leg']
+        window = {axis: rng.integers(-2**15, 2**15, model.target_length).tolist() for axis in AXES}
+        window.update(message_id=new_message_id(), player_id=1 + index % 2, imu_device=model.device)
+        windows.append(window)
+    return windows
+
+def backend_latency(backend, models, windows):
+    latencies = []
+    for window in windows:
+        start = time.perf_counter()
+        backend.predict(window, models[window['imu_device']])
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1e6, latencies[int(len(latencies) * 0.99) - 1] * 1e6
+
+async def serve_windows(backend, windows):
+    # The whole ai_server on a local transport, from ai_queue to the predictions exchange
+    broker = LocalBroker()
+    server = ai_server.AIServer(LocalTransport(broker), backend)
+    await server.start()
+    broker.bind('bench_predictions', ai_server.UPDATE_PREDICTIONS_EXCHANGE)
+    predictions = broker.queue('bench_predictions')
+    client = LocalTransport(broker)
+    start = time.perf_counter()
+    for window in windows:
+        body, content_type = encode_imu(window)
+        await client.publish(ai_server.AI_QUEUE, body, content_type)
+    while predictions.qsize() < len(windows):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    await server.transport.close()
+    # Also closes the backend
+    server.worker.close()
+    return len(windows) / elapsed
+
+def main():
+    rng = np.random.default_rng(0)
+    models = load_bundle()
+    windows = build_windows(rng, models)
+    with tempfile.TemporaryDirectory() as folder:
+        networks = {device: stand_in_network(rng, model.input_length, model.output_length, HIDDEN)
+                    for device, model in models.items()}
+        for device, network in networks.items():
+            network.save(os.path.join(folder, models[device].weights))
+        cpu = CpuBackend(models, folder)
+
+    # The CPU backend must give the probabilities of a plain float64 forward pass
+    for window in windows[:200]:
+        model = models[window['imu_device']]
+        inputs = model.fill_input(window, np.zeros(model.input_length, dtype=np.float32))
+        expected = reference_forward(networks[model.device], inputs)
+        actual = cpu.networks[model.device].forward(inputs)
+        assert np.allclose(actual, expected, atol=1e-5), 'CPU probabilities differ from the reference'
+
+    print(f'[DEBUG] {WINDOWS} windows, glove and leg alternating, hidden layers {HIDDEN}')
+    print(f'{"backend":>8} {"p50 us":>8} {"p99 us":>8} {"ai_server windows/s":>20}')
+    backends = [cpu]
+    try:
+        backends.append(FpgaBackend(models))
+    except ImportError:
+        print('  fpga backend skipped, pynq is not installed')
+    for backend in backends:
+        p50, p99 = backend_latency(backend, models, windows)
+        rate = asyncio.run(serve_windows(backend, windows))
+        print(f'{backend.name:>8} {p50:>8.1f} {p99:>8.1f} {rate:>20.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import inference
+from bench_inference import HIDDEN, stand_in_network
+from imu_wire import AXES
+from inference import CpuBackend, InferenceWorker
+from model_bundle import load_bundle
+
+# Keep the log records out of the results
+inference.log.set_level('WARNING')
+
+WINDOWS = int(os.getenv('WINDOWS', '4000'))
+# Requests in flight at once, like the ai_queue prefetch
+CONCURRENCY = int(os.getenv('CONCURRENCY', '16'))
+# Time the simulated device takes per window, the DMA round trip of the overlay
+DEVICE_US = float(os.getenv('DEVICE_US', '100'))
+BATCH_SIZES = [int(size) for size in os.getenv('BATCH_SIZES', '1,4').split(',')]
+
+class SimulatedDevice(CpuBackend):
+    """CPU networks behind a device that works DEVICE_US per window once started, as the overlay does.
+
+    Like the DMA channels, the device holds one batch at a time; locked makes concurrent callers wait
+    for it, as a correct shared-executor path would have to.
+    """
+
+    name = 'device'
+
+    def __init__(self, models, weights_folder, locked=False):
+        super().__init__(models, weights_folder)
+        self.busy_until = 0.0
+        # Seconds from start() until finish() has its results, the time the device is in use
+        self.busy = 0.0
+        self.lock = threading.Lock() if locked else None
+
+    def start(self, batch):
+        self.started = time.perf_counter()
+        self.busy_until = self.started + DEVICE_US / 1e6 * len(batch.rows)
+        # What the device writes to the output buffers
+        self.outputs = CpuBackend.finish(self, batch)
+
+    def finish(self, batch):
+        # The wait of the DMA channels, the GIL is free meanwhile
+        remaining = self.busy_until - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        self.busy += time.perf_counter() - self.started
+        return self.outputs
+
+    def predict_chunk(self, windows, model):
+        if self.lock is None:
+            return super().predict_chunk(windows, model)
+        with self.lock:
+            return super().predict_chunk(windows, model)
+
+class ExecutorRunner:
+    """The approach before the worker: every request runs the shared backend on the default executor."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def predict_batch(self, windows, model):
+        return await asyncio.get_running_loop().run_in_executor(None, self.backend.predict_batch, windows, model)
+
+async def run_requests(runner, requests):
+    """Run the (windows, model) requests CONCURRENCY at a time, return the results in order and the elapsed time."""
+    results = [None] * len(requests)
+    next_request = iter(range(len(requests)))
+
+    async def client():
+        for index in next_request:
+            windows, model = requests[index]
+            results[index] = await runner.predict_batch(windows, model)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+    return results, time.perf_counter() - start
+
+def main():
+    rng = np.random.default_rng(0)
+    models = load_bundle()
+    with tempfile.TemporaryDirectory() as folder:
+        for device, model in models.items():
+            network = stand_in_network(rng, model.input_length, model.output_length, HIDDEN)
+            network.save(os.path.join(folder, model.weights))
+        backends = {
+            'executor': SimulatedDevice(models, folder),
+            'executor+lock': SimulatedDevice(models, folder, locked=True),
+            'worker': SimulatedDevice(models, folder),
+        }
+        reference = CpuBackend(models, folder)
+
+    windows = []
+    for index in range(WINDOWS):
+        model = models['glove' if index % 2 else 'leg']
+        windows.append(({axis: rng.integers(-2**15, 2**15, model.target_length) for axis in AXES}, model))
+    # Each window run alone on a backend of its own
+    expected = [reference.predict(data, model)[0] for data, model in windows]
+
+    print(f'[DEBUG] {WINDOWS} windows, hidden layers {HIDDEN}, {CONCURRENCY} requests in flight, '
+          f'simulated device {DEVICE_US:g} us per window')
+    # device busy is how much of the run the device had a batch, meaningless for the unlocked executor that races on it
+    print(f'{"path":>14} {"batch":>6} {"inferences/s":>13} {"device busy":>12} {"wrong":>6}')
+    for size in BATCH_SIZES:
+        # Requests of size windows of one device, as the micro-batcher makes them
+        requests = []
+        for device in models:
+            device_windows = [(data, model) for data, model in windows if model.device == device]
+            for start in range(0, len(device_windows), size):
+                chunk = device_windows[start:start + size]
+                requests.append(([data for data, _ in chunk], chunk[0][1]))
+        order = [id(data) for request, _ in requests for data in request]
+        by_id = {id(data): label for (data, _), label in zip(windows, expected)}
+        for name, backend in backends.items():
+            runner = InferenceWorker(backend) if name == 'worker' else ExecutorRunner(backend)
+            backend.busy = 0.0
+            results, elapsed = asyncio.run(run_requests(runner, requests))
+            labels = [action_index for request in results for action_index, _ in request]
+            wrong = sum(label != by_id[key] for label, key in zip(labels, order))
+            print(f'{name:>14} {size:>6} {WINDOWS / elapsed:>13.0f} {backend.busy / elapsed:>11.0%} {wrong:>6}')
+            if name == 'worker':
+                assert wrong == 0, 'The inference worker returned wrong results'
+                runner.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import game_engine
+import purge_queues
+from transport import LocalBroker, LocalTransport, RabbitMQTransport
+
+# Keep the services' log records out of the results
+game_engine.log.set_level('WARNING')
+purge_queues.log.set_level('WARNING')
+
+ROUNDS = int(os.getenv('ROUNDS', '2000'))
+# Also measure against the broker at BROKER when set
+TRANSPORTS = os.getenv('TRANSPORTS', 'local,rabbitmq' if os.getenv('BROKER') else 'local').split(',')
+
+BENCH_QUEUE = 'bench_local_transport_queue'
+VISUALIZER_QUEUE = 'bench_local_transport_visualizer'
+
+def create(name, broker):
+    if name == 'local':
+        return LocalTransport(broker)
+    return RabbitMQTransport()
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99) - 1] * 1e6)
+
+async def single_hop(transport):
+    # One publish and its delivery to a consumer of the same queue
+    received = asyncio.Queue()
+
+    async def on_message(message):
+        async with message.process():
+            received.put_nowait(time.perf_counter())
+
+    await transport.declare_queue(BENCH_QUEUE)
+    await transport.purge(BENCH_QUEUE)
+    await transport.consume(BENCH_QUEUE, on_message)
+    latencies = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        await transport.publish(BENCH_QUEUE, b'{}')
+        latencies.append(await received.get() - start)
+    return latencies
+
+async def through_engine(name, broker):
+    # Action into update_ge_queue until its message arrives on update_eval_server_queue
+    engine = game_engine.GameEngine(create(name, broker))
+    engine_task = asyncio.create_task(engine.run())
+    client = create(name, broker)
+    await client.connect()
+    received = asyncio.Queue()
+    broadcasts = []
+
+    async def on_eval_message(message):
+        async with message.process():
+            received.put_nowait((time.perf_counter(), json.loads(message.body)))
+
+    async def on_broadcast(message):
+        async with message.process():
+            broadcasts.append(message.body)
+
+    await client.declare_queue(game_engine.UPDATE_EVAL_SERVER_QUEUE)
+    await client.consume(game_engine.UPDATE_EVAL_SERVER_QUEUE, on_eval_message)
+    if name == 'local':
+        # Stand-in for a visualizer subscribed to the fanout exchange
+        broker.bind(VISUALIZER_QUEUE, game_engine.UPDATE_EVERYONE_EXCHANGE)
+        await client.consume(VISUALIZER_QUEUE, on_broadcast)
+    await asyncio.sleep(0.5)  # Let the engine purge the queues and start consuming
+
+    latencies = []
+    for round_index in range(ROUNDS):
+        body = json.dumps({'action': True, 'player_id': round_index % 2 + 1, 'action_type': 'reload'}).encode('utf-8')
+        start = time.perf_counter()
+        await client.publish(game_engine.UPDATE_GE_QUEUE, body)
+        arrived, data = await received.get()
+        assert data['action'] == 'reload'
+        latencies.append(arrived - start)
+    await asyncio.sleep(0.01)
+
+    engine_task.cancel()
+    await client.close()
+    await engine.transport.close()
+    return latencies, len(broadcasts)
+
+async def main():
+    print(f'[DEBUG] {ROUNDS} sequential round trips per transport')
+    print(f'{"transport":>10} {"path":>16} {"p50 us":>10} {"p99 us":>10}')
+    for name in TRANSPORTS:
+        broker = LocalBroker()
+        transport = create(name, broker)
+        await transport.connect()
+        p50, p99 = percentiles(await single_hop(transport))
+        await transport.close()
+        print(f'{name:>10} {"single hop":>16} {p50:>10.1f} {p99:>10.1f}')
+
+        latencies, broadcasts = await through_engine(name, broker)
+        p50, p99 = percentiles(latencies)
+        print(f'{name:>10} {"ge -> eval queue":>16} {p50:>10.1f} {p99:>10.1f}')
+        if name == 'local':
+            print(f'[DEBUG] Visualizer queue received {broadcasts} broadcasts')
+
+if __name__ == '__main__':
+    asyncio.run(main())
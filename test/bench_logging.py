@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, FakeTransport
+import game_engine
+import log
+
+MESSAGES = int(os.getenv('MESSAGES', '20000'))
+
+class PipeStream:
+    """Write end of a pipe drained by another thread, like stdout of a process under pm2."""
+
+    def __init__(self):
+        read_fd, write_fd = os.pipe()
+        self.reader = os.fdopen(read_fd, 'rb')
+        self.file = os.fdopen(write_fd, 'w')
+        threading.Thread(target=self.drain, daemon=True).start()
+
+    def drain(self):
+        while self.reader.read1(65536):
+            pass
+
+    def write(self, text):
+        self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+class SyncWriter(log.LogWriter):
+    # Formats and writes every record on the calling thread, like the print() calls it replaces
+    def put(self, record):
+        stream = self.stream
+        stream.write(self.format(record) + '\n')
+        stream.flush()
+
+def messages():
+    rng = random.Random(0)
+    bodies = []
+    for index in range(MESSAGES):
+        if index % 10 == 0:
+            data = {'action': True, 'player_id': rng.choice([1, 2]), 'action_type': 'gun', 'hit': True}
+        else:
+            data = {'game_state': {rng.choice(['p1', 'p2']): {'opponent_visible': rng.random() < 0.5}}}
+        bodies.append(json.dumps(data).encode('utf-8'))
+    return bodies
+
+async def run(label, writer, level):
+    game_engine.log.writer = writer
+    game_engine.log.set_level(level)
+    engine = game_engine.GameEngine(FakeTransport())
+    engine.get_match(game_engine.DEFAULT_MATCH_ID)
+    bodies = messages()
+    start = time.perf_counter()
+    for body in bodies:
+        await engine.process_message(FakeIncomingMessage(body))
+    elapsed = time.perf_counter() - start
+    writer.flush()
+    print(f'{label:>24} {elapsed / MESSAGES * 1e6:>14.2f} {MESSAGES / elapsed:>10.0f}')
+
+async def main():
+    stream = PipeStream()
+    print(f'[DEBUG] {MESSAGES} messages through process_message, logs written to a pipe')
+    print(f'{"logging":>24} {"us per message":>14} {"msg/s":>10}')
+    await run('sync writes, DEBUG', SyncWriter(stream), 'DEBUG')
+    await run('background writer, DEBUG', log.LogWriter(stream), 'DEBUG')
+    await run('background writer, INFO', log.LogWriter(stream), 'INFO')
+    await run('disabled', log.LogWriter(stream), 'ERROR')
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from game_state import MatchState
+
+# Number of hosted matches used for the memory measurement
+MATCH_COUNT = int(os.getenv('MATCH_COUNT', '10000'))
+ITERATIONS = int(os.getenv('ITERATIONS', '200000'))
+
+VISIBILITY_UPDATE = {
+    'p1': {'opponent_visible': True, 'opponent_in_rain_bomb': 1},
+    'p2': {'opponent_visible': False, 'opponent_in_rain_bomb': 0}
+}
+
+def dict_update_internal_game_state(game_state, incoming_game_state):
+    # The compare loop used by the engine before the slot-based state
+    changed = False
+    for player_key in ['p1', 'p2']:
+        if player_key in incoming_game_state:
+            for key, value in game_state[player_key].items():
+                if key in incoming_game_state[player_key] and incoming_game_state[player_key][key] != value:
+                    changed = True
+            game_state[player_key].update(incoming_game_state[player_key])
+    return changed
+
+def measure_memory(factory):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    matches = [factory() for _ in range(MATCH_COUNT)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    # Exclude the list holding the matches
+    size -= sys.getsizeof(matches)
+    return size / MATCH_COUNT
+
+def main():
+    dict_bytes = measure_memory(lambda: MatchState().to_dict())
+    slot_bytes = measure_memory(MatchState)
+    print(f'[DEBUG] Memory per match over {MATCH_COUNT} matches:')
+    print(f'  dict-of-dicts: {dict_bytes:8.1f} bytes')
+    print(f'  MatchState:    {slot_bytes:8.1f} bytes ({dict_bytes / slot_bytes:.1f}x smaller)')
+
+    game_state = MatchState().to_dict()
+    state = MatchState()
+    dict_time = timeit.timeit(lambda: dict_update_internal_game_state(game_state, VISIBILITY_UPDATE), number=ITERATIONS)
+    slot_time = timeit.timeit(lambda: state.update(VISIBILITY_UPDATE), number=ITERATIONS)
+    print(f'[DEBUG] Visibility update over {ITERATIONS} iterations:')
+    print(f'  dict-of-dicts: {dict_time / ITERATIONS * 1e9:8.1f} ns')
+    print(f'  MatchState:    {slot_time / ITERATIONS * 1e9:8.1f} ns ({dict_time / slot_time:.1f}x faster)')
+
+    projection_time = timeit.timeit(state.to_dict, number=ITERATIONS)
+    print(f'[DEBUG] Projection to the JSON wire shape: {projection_time / ITERATIONS * 1e9:.1f} ns')
+
+if __name__ == '__main__':
+    main()
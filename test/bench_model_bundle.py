@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import os
+import pickle
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from model_bundle import AI_FOLDER, load_bundle
+
+STARTS = int(os.getenv('STARTS', '5'))
+PREDICTIONS = int(os.getenv('PREDICTIONS', '10000'))
+
+# What ai_server.py did at import before the model bundle
+SKLEARN_STARTUP = f'''
+import pickle
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler, LabelEncoder
+with open("{AI_FOLDER}label_encoder.pkl", "rb") as file:
+    label_encoder_hand = pickle.load(file)
+with open("{AI_FOLDER}label_encoder_leg.pkl", "rb") as file:
+    label_encoder_leg = pickle.load(file)
+scaler = MinMaxScaler(feature_range=(-1, 1))
+scaler.fit(np.array([-2**15, 2**15 - 1]).reshape(-1, 1))
+'''
+BUNDLE_STARTUP = '''
+import numpy as np
+from model_bundle import load_bundle
+models = load_bundle()
+'''
+
+def startup_seconds(code):
+    # Fresh interpreters, so module imports are not cached; the interpreter start itself is subtracted
+    times = []
+    for _ in range(STARTS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-W', 'ignore', '-c', code], cwd=ROOT, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def per_call_us(function, calls=PREDICTIONS):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e6
+
+def main():
+    interpreter = startup_seconds('pass')
+    sklearn_start = startup_seconds(SKLEARN_STARTUP) - interpreter
+    bundle_start = startup_seconds(BUNDLE_STARTUP) - interpreter
+    print(f'[DEBUG] {STARTS} cold starts, {PREDICTIONS} predictions')
+    print(f'  startup: sklearn {sklearn_start * 1000:.1f} ms, bundle {bundle_start * 1000:.1f} ms '
+          f'(interpreter {interpreter * 1000:.1f} ms excluded)')
+
+    from sklearn.preprocessing import MinMaxScaler
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with open(os.path.join(AI_FOLDER, 'label_encoder.pkl'), 'rb') as file:
+            label_encoder = pickle.load(file)
+    scaler = MinMaxScaler(feature_range=(-1, 1))
+    scaler.fit(np.array([-2**15, 2**15 - 1]).reshape(-1, 1))
+    model = load_bundle()['glove']
+
+    rng = np.random.default_rng(0)
+    window = rng.integers(-2**15, 2**15, model.input_length).astype(np.float64)
+    action_index = np.argmax(rng.random(model.output_length))
+    assert np.array_equal(scaler.transform(window.reshape(-1, 1)).flatten(), model.scale_input(window))
+    assert all(label_encoder.inverse_transform([index])[0] == model.label(index) for index in range(model.output_length))
+
+    print(f'  label lookup: inverse_transform {per_call_us(lambda: label_encoder.inverse_transform([action_index])[0]):.2f} us, '
+          f'bundle {per_call_us(lambda: model.label(action_index)):.2f} us')
+    print(f'  scaling:      MinMaxScaler {per_call_us(lambda: scaler.transform(window.reshape(-1, 1)).flatten()):.2f} us, '
+          f'bundle {per_call_us(lambda: model.scale_input(window)):.2f} us (identical output)')
+
+if __name__ == '__main__':
+    main()
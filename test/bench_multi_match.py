@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, FakeTransport, quiet
+import game_engine
+from publisher import PUBLISH_WINDOW, Publisher
+
+quiet(game_engine.log)
+
+# Simulated broker round-trip for every publish made by the game engine
+PUBLISH_LATENCY = float(os.getenv('PUBLISH_LATENCY', '0.002'))
+
+# Total number of messages is split evenly across the hosted matches
+TOTAL_MESSAGES = int(os.getenv('TOTAL_MESSAGES', '2000'))
+MATCH_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+# Without pipelining (0) every publish is awaited under the match lock, which the per-match locks overlap
+# across matches. With the pipeline the lock is never held across a round trip, so a single match already
+# overlaps its publishes and the engine is bound by the CPU of its one event loop at any match count.
+WINDOWS = [0, PUBLISH_WINDOW]
+
+def build_messages(match_count):
+    # Interleave actions and visibility updates from every match
+    messages = []
+    for i in range(TOTAL_MESSAGES // match_count):
+        for m in range(match_count):
+            if i % 2 == 0:
+                data = {
+                    'match_id': f'arena{m}',
+                    'action': True,
+                    'player_id': 1 + (i // 2) % 2,
+                    'action_type': 'gun',
+                    'hit': True,
+                }
+            else:
+                data = {
+                    'match_id': f'arena{m}',
+                    'game_state': {
+                        'p1': {'opponent_visible': (i // 2) % 2 == 0},
+                        'p2': {'opponent_visible': (i // 2) % 2 == 1}
+                    }
+                }
+            messages.append(FakeIncomingMessage(data))
+    return messages
+
+async def run_benchmark(match_count, window):
+    messages = build_messages(match_count)
+
+    # Deliver every message as its own task, like the aio_pika consumer does
+    engine = game_engine.GameEngine(FakeTransport(PUBLISH_LATENCY))
+    engine.publisher = Publisher(engine.transport, window)
+    start = time.perf_counter()
+    await asyncio.gather(*(engine.process_message(message) for message in messages))
+    await engine.publisher.flush()
+    elapsed = time.perf_counter() - start
+    return len(messages), elapsed
+
+async def main():
+    print(f'[DEBUG] Publish latency: {PUBLISH_LATENCY * 1000:.1f} ms, messages per run: {TOTAL_MESSAGES}')
+    print(f'{"window":>7} {"matches":>8} {"messages":>9} {"seconds":>9} {"msg/s":>10} {"speedup":>8}')
+    for window in WINDOWS:
+        baseline = None
+        for match_count in MATCH_COUNTS:
+            count, elapsed = await run_benchmark(match_count, window)
+            throughput = count / elapsed
+            if baseline is None:
+                baseline = throughput
+            print(f'{window:>7} {match_count:>8} {count:>9} {elapsed:>9.3f} {throughput:>10.1f} {throughput / baseline:>7.1f}x')
+
+if __name__ == '__main__':
+    asyncio.run(main())
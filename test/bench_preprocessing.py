@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from imu_wire import AXES
+from model_bundle import load_bundle
+
+WINDOWS = int(os.getenv('WINDOWS', '5000'))
+
+def pad_or_truncate(array, target_length=60):
+    if len(array) > target_length:
+        return array[:target_length]
+    elif len(array) < target_length:
+        return array + [0] * (target_length - len(array))
+    else:
+        return array
+
+def list_path(data, model, input_stream):
+    # The preprocessing of ai_server.py before the window was written straight into the DMA buffer
+    imu_data = []
+    for axis in AXES:
+        imu_data = imu_data + pad_or_truncate(data[axis], model.target_length)
+    input_data = model.scale_input(np.array(imu_data).reshape(-1, 1)).flatten()
+    input_stream[0] = 1.0
+    for i in range(0, model.input_length):
+        input_stream[i + 1] = input_data[i]
+
+def in_place_path(data, model, input_stream):
+    input_stream[0] = 1.0
+    model.fill_input(data, input_stream[1:])
+
+def build_windows(rng, model):
+    # Mostly full windows, some short ones that are padded and some long ones that are truncated
+    windows = []
+    for _ in range(WINDOWS):
+        length = model.target_length + int(rng.choice([0, 0, 0, -10, 5]))
+        windows.append({axis: rng.integers(-2**15, 2**15, length).tolist() for axis in AXES})
+    return windows
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f'[DEBUG] {WINDOWS} windows per device')
+    print(f'{"device":>6} {"path":>9} {"us/window":>10} {"max diff":>10}')
+    for device, model in load_bundle().items():
+        windows = build_windows(rng, model)
+        # float32 like the pynq buffers
+        expected = np.zeros(model.input_length + 1, dtype=np.float32)
+        actual = np.zeros(model.input_length + 1, dtype=np.float32)
+        max_diff = 0.0
+        for data in windows[:200]:
+            list_path(data, model, expected)
+            in_place_path(data, model, actual)
+            max_diff = max(max_diff, float(np.max(np.abs(expected - actual))))
+        for name, path in (('lists', list_path), ('in place', in_place_path)):
+            start = time.perf_counter()
+            for data in windows:
+                path(data, model, actual)
+            per_window = (time.perf_counter() - start) / WINDOWS * 1e6
+            print(f'{device:>6} {name:>9} {per_window:>10.1f} {max_diff if name == "in place" else 0.0:>10.1e}')
+
+if __name__ == '__main__':
+    main()
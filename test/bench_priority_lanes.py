@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import game_engine
+import purge_queues
+from transport import LocalBroker, LocalTransport
+
+# Keep the services' log records out of the results
+game_engine.log.set_level('WARNING')
+purge_queues.log.set_level('WARNING')
+
+DURATION = float(os.getenv('DURATION', '3'))
+# opponent_visible updates per second flooding update_ge_queue
+FLOOD_RATE = int(os.getenv('FLOOD_RATE', '50000'))
+ACTION_INTERVAL = float(os.getenv('ACTION_INTERVAL', '0.02'))
+BURST_INTERVAL = 0.005
+
+async def run(mode):
+    # 'event' is the single-queue engine, 'lanes' serves update_ge_action_queue first
+    game_engine.ENGINE_MODE = mode
+    broker = LocalBroker()
+    engine = game_engine.GameEngine(LocalTransport(broker))
+    engine_task = asyncio.create_task(engine.run())
+    client = LocalTransport(broker)
+    action_queue = game_engine.UPDATE_GE_ACTION_QUEUE if mode == 'lanes' else game_engine.UPDATE_GE_QUEUE
+    sent_at = []
+    latencies = []
+
+    async def on_eval_message(message):
+        async with message.process():
+            latencies.append(time.perf_counter() - sent_at[len(latencies)])
+
+    await client.consume(game_engine.UPDATE_EVAL_SERVER_QUEUE, on_eval_message)
+    await asyncio.sleep(0.2)  # Let the engine purge the queues and start consuming
+
+    async def flood():
+        visible = False
+        while True:
+            for _ in range(int(FLOOD_RATE * BURST_INTERVAL)):
+                visible = not visible
+                body = json.dumps({'game_state': {'p1': {'opponent_visible': visible}}}).encode('utf-8')
+                await client.publish(game_engine.UPDATE_GE_QUEUE, body)
+            await asyncio.sleep(BURST_INTERVAL)
+
+    flood_task = asyncio.create_task(flood())
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        body = json.dumps({'action': True, 'player_id': 2, 'action_type': 'shield'}).encode('utf-8')
+        sent_at.append(time.perf_counter())
+        await client.publish(action_queue, body)
+        await asyncio.sleep(ACTION_INTERVAL)
+    flood_task.cancel()
+    while len(latencies) < len(sent_at):
+        await asyncio.sleep(0.01)
+
+    backlog = broker.queue(game_engine.UPDATE_GE_QUEUE).qsize()
+    engine_task.cancel()
+    await client.close()
+    await engine.transport.close()
+    return latencies, backlog
+
+async def main():
+    print(f'[DEBUG] {FLOOD_RATE} telemetry msg/s for {DURATION:.0f} s, one action every {ACTION_INTERVAL * 1000:.0f} ms')
+    print(f'{"mode":>6} {"actions":>8} {"p50 ms":>8} {"p99 ms":>8} {"telemetry backlog":>18}')
+    for mode in ('event', 'lanes'):
+        latencies, backlog = await run(mode)
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        print(f'{mode:>6} {len(latencies):>8} {p50:>8.2f} {p99:>8.2f} {backlog:>18}')
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, quiet
+import game_engine
+from publisher import Publisher
+from transport import Transport
+
+quiet(game_engine.log)
+
+# Simulated broker round trip until a publish is confirmed
+PUBLISH_LATENCY = float(os.getenv('PUBLISH_LATENCY', '0.002'))
+ACTION_COUNT = int(os.getenv('ACTION_COUNT', '2000'))
+WINDOWS = [0, 1, 8, 64, 256]
+
+class SlowLinkTransport(Transport):
+    # Like a channel with publisher confirms: messages go on the wire in call order, the confirm comes a round trip later
+    def __init__(self):
+        self.delivered = {}
+
+    async def publish(self, queue_name, body, content_type=None):
+        await self.send(queue_name, body)
+
+    async def publish_exchange(self, exchange_name, body, content_type=None):
+        await self.send(exchange_name, body)
+
+    async def send(self, destination, body):
+        loop = asyncio.get_running_loop()
+        confirm = loop.create_future()
+        loop.call_later(PUBLISH_LATENCY, self.deliver, destination, body, confirm)
+        await confirm
+
+    def deliver(self, destination, body, confirm):
+        self.delivered.setdefault(destination, []).append(body)
+        confirm.set_result(None)
+
+class RecordingPublisher(Publisher):
+    def __init__(self, transport, window):
+        super().__init__(transport, window)
+        self.made = {}
+
+    async def submit(self, publish, destination, body, content_type):
+        self.made.setdefault(destination, []).append(body)
+        await super().submit(publish, destination, body, content_type)
+
+async def run(window):
+    # One match, every action published to the exchange and the eval queue
+    messages = [
+        FakeIncomingMessage({'action': True, 'player_id': 1 + i % 2, 'action_type': ['gun', 'reload', 'shield'][i % 3],
+                             'hit': True})
+        for i in range(ACTION_COUNT)
+    ]
+    transport = SlowLinkTransport()
+    engine = game_engine.GameEngine(transport)
+    engine.publisher = RecordingPublisher(transport, window)
+    # Deliveries are handled concurrently up to the prefetch count, like the consumer does, since each is
+    # only acked once its publishes are confirmed
+    prefetch = asyncio.Semaphore(game_engine.PREFETCH_COUNT)
+    async def deliver(message):
+        async with prefetch:
+            await engine.process_message(message)
+    start = time.perf_counter()
+    await asyncio.gather(*(deliver(message) for message in messages))
+    await engine.publisher.flush()
+    elapsed = time.perf_counter() - start
+
+    # Every destination must receive its messages in the order the engine made them
+    for destination, made in engine.publisher.made.items():
+        assert transport.delivered[destination] == made, f'Messages to {destination} out of order'
+    assert sum(len(made) for made in engine.publisher.made.values()) >= ACTION_COUNT
+    assert all(message.acked for message in messages), 'Every delivery is acked once its publishes are confirmed'
+    return elapsed
+
+async def main():
+    print(f'[DEBUG] {ACTION_COUNT} actions on one match, {PUBLISH_LATENCY * 1000:.1f} ms per publish confirm, '
+          f'prefetch {game_engine.PREFETCH_COUNT}')
+    print(f'{"window":>7} {"seconds":>8} {"actions/s":>10}')
+    for window in WINDOWS:
+        elapsed = await run(window)
+        print(f'{window:>7} {elapsed:>8.3f} {ACTION_COUNT / elapsed:>10.1f}')
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, FakeTransport, quiet
+import game_engine
+import game_state
+
+quiet(game_engine.log)
+
+ACTION_COUNT = int(os.getenv('ACTION_COUNT', '5000'))
+
+class CountingJson:
+    # Stands in for the json module to time every encode made while processing
+    def __init__(self):
+        self.encodes = 0
+        self.seconds = 0.0
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        result = json.dumps(obj, **kwargs)
+        self.seconds += time.perf_counter() - start
+        self.encodes += 1
+        return result
+
+    def loads(self, s, **kwargs):
+        return json.loads(s, **kwargs)
+
+async def main():
+    messages = [
+        FakeIncomingMessage({
+            'action': True,
+            'player_id': 1 + i % 2,
+            'action_type': ['gun', 'shield', 'reload', 'basket'][i % 4],
+            'hit': True,
+        })
+        for i in range(ACTION_COUNT)
+    ]
+
+    counter = CountingJson()
+    game_state.json = counter
+    engine = game_engine.GameEngine(FakeTransport())
+    start = time.perf_counter()
+    for message in messages:
+        await engine.process_message(message)
+    elapsed = time.perf_counter() - start
+
+    snapshot = engine.get_match(game_engine.DEFAULT_MATCH_ID).snapshot
+    print(f'[DEBUG] {ACTION_COUNT} actions')
+    print(f'  json encodes per action:     {counter.encodes / ACTION_COUNT:.2f}')
+    print(f'  snapshot encodes per action: {snapshot.encodes / ACTION_COUNT:.2f} (shared by the broadcast and the eval message)')
+    print(f'  serialization CPU per action: {counter.seconds / ACTION_COUNT * 1e6:.1f} us')
+    print(f'  process_message per action:   {elapsed / ACTION_COUNT * 1e6:.1f} us')
+    assert snapshot.encodes <= ACTION_COUNT, 'More than one state encode per action'
+
+    # Reference: what the three encodes of the old action path cost for the same state
+    full_state = engine.get_match(game_engine.DEFAULT_MATCH_ID).game_state
+    start = time.perf_counter()
+    for _ in range(ACTION_COUNT):
+        json.dumps({'game_state': full_state})
+        json.dumps({'game_state': full_state, 'action': 'gun', 'player_id': 1})
+        json.dumps({'game_state': full_state, 'action': 'gun', 'player_id': 1}, indent=2)
+    print(f'  old path (3 full encodes):    {(time.perf_counter() - start) / ACTION_COUNT * 1e6:.1f} us')
+
+if __name__ == '__main__':
+    asyncio.run(main())
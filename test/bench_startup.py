@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import eval_client
+import game_engine
+import launcher
+import purge_queues
+from transport import LocalBroker, LocalTransport
+
+# Keep the services' log records out of the results
+for module in (eval_client, game_engine, launcher, purge_queues):
+    module.log.set_level('WARNING')
+
+# Simulated round trip to the broker, paid by every declaration, purge and consume
+RTT = float(os.getenv('RTT', '0.005'))
+# Round trips of an AMQP connection: TCP, protocol header, start, tune, open and the channels
+CONNECT_ROUND_TRIPS = int(os.getenv('CONNECT_ROUND_TRIPS', '8'))
+
+class RoundTripTransport(LocalTransport):
+    """A local transport paying RTT per broker operation, and the connection once per process."""
+
+    connections = {}
+
+    def __init__(self, broker, process):
+        super().__init__(broker)
+        self.process = process
+
+    async def connect(self):
+        # Services of one process share its connection, like RabbitMQTransport does through BrokerClient
+        if self.process not in self.connections:
+            self.connections[self.process] = asyncio.ensure_future(asyncio.sleep(RTT * CONNECT_ROUND_TRIPS))
+        await self.connections[self.process]
+        await super().connect()
+
+    async def declare_queue(self, queue_name):
+        await asyncio.sleep(RTT)
+        await super().declare_queue(queue_name)
+
+    async def declare_exchange(self, exchange_name):
+        await asyncio.sleep(RTT)
+        await super().declare_exchange(exchange_name)
+
+    async def purge(self, queue_name):
+        await asyncio.sleep(RTT)
+        await super().purge(queue_name)
+
+    async def consume(self, queue_name, callback, prefetch_count=None):
+        await asyncio.sleep(RTT)
+        await super().consume(queue_name, callback, prefetch_count)
+
+async def serial_purge(transport):
+    # The purge before the launcher: one queue after another
+    await transport.connect()
+    for queue in (purge_queues.UPDATE_EVAL_SERVER_QUEUE, purge_queues.UPDATE_GE_QUEUE,
+                  purge_queues.UPDATE_GE_ACTION_QUEUE, purge_queues.AI_QUEUE):
+        await transport.declare_queue(queue)
+        await transport.purge(queue)
+
+async def serial_start(broker, port):
+    # One pm2 process per service, each purging and then setting up on its own connection
+    async def start_game_engine():
+        engine = game_engine.GameEngine(RoundTripTransport(broker, 'game_engine'))
+        engine.restore()
+        await serial_purge(engine.transport)
+        await engine.start()
+
+    async def start_eval_client():
+        client = eval_client.EvalClient('localhost', port, eval_client.SECRET_KEY,
+                                        RoundTripTransport(broker, 'eval_client'))
+        await serial_purge(client.transport)
+        await client.connect_server()
+        await client.start()
+        client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(start_game_engine(), start_eval_client())
+    return time.perf_counter() - start
+
+async def launcher_start(broker, port):
+    transport = lambda name=None: RoundTripTransport(broker, 'launcher')
+    launcher.create_transport = game_engine.create_transport = eval_client.create_transport = transport
+    eval_client.PORT = port
+    service_launcher = launcher.Launcher(services=['game_engine', 'eval_client'], health_port=0)
+    start = time.perf_counter()
+    await service_launcher.start()
+    elapsed = time.perf_counter() - start
+    await service_launcher.close()
+    return elapsed, service_launcher.health()
+
+async def main():
+    # Stands in for the eval server, which only has to accept the connection and the 'hello'
+    async def accept(reader, writer):
+        length = int((await reader.readuntil(b'_'))[:-1])
+        await reader.readexactly(length)
+        writer.close()
+
+    server = await asyncio.start_server(accept, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    print(f'[DEBUG] game_engine and eval_client, {RTT * 1000:.1f} ms broker round trip, '
+          f'{CONNECT_ROUND_TRIPS} round trips per connection')
+
+    serial = await serial_start(LocalBroker(), port)
+    RoundTripTransport.connections = {}
+    parallel, health = await launcher_start(LocalBroker(), port)
+    print(f'  serial per-service startup: {serial * 1000:7.1f} ms')
+    print(f'  launcher:                   {parallel * 1000:7.1f} ms, status {health["status"]}')
+    print(f'  {"phase":<12} {"start ms":>9} {"duration ms":>12}')
+    for name, phase in sorted(health['phases'].items(), key=lambda item: item[1]['start_ms']):
+        print(f'  {name:<12} {phase["start_ms"]:>9.1f} {phase["duration_ms"]:>12.1f}')
+
+    # A service that cannot start leaves the others running
+    secret_key = eval_client.SECRET_KEY
+    eval_client.SECRET_KEY = 'not 16 bytes'
+    RoundTripTransport.connections = {}
+    _, health = await launcher_start(LocalBroker(), port)
+    print(f'[DEBUG] With a bad eval_client secret key: status {health["status"]}, services {health["services"]}')
+    assert health['status'] == 'degraded', 'A failed service is reported without failing the others'
+    assert health['services'] == {'game_engine': 'ready', 'eval_client': 'failed'}
+    assert health['phases']['eval_server']['attempts'] == 1, 'A settings error is not retried'
+
+    # An eval server that comes up late is connected on a retry
+    eval_client.SECRET_KEY = secret_key
+    launcher.PHASE_RETRY_DELAY = 0.02
+    server.close()
+    await server.wait_closed()
+    late_start = asyncio.get_running_loop().call_later(
+        0.05, lambda: asyncio.ensure_future(asyncio.start_server(accept, '127.0.0.1', port)))
+    RoundTripTransport.connections = {}
+    _, health = await launcher_start(LocalBroker(), port)
+    attempts = health['phases']['eval_server']['attempts']
+    print(f'[DEBUG] With the eval server up after 50 ms: status {health["status"]}, {attempts} eval_server attempts')
+    assert health['status'] == 'ready' and attempts > 1, 'The eval server connection is retried'
+    late_start.cancel()
+
+if __name__ == '__main__':
+    asyncio.run(main())
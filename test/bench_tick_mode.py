@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, FakeTransport, quiet
+import game_engine
+from transport import LocalBroker, LocalTransport
+from wire import encode
+
+quiet(game_engine.log)
+
+# Input storm: telemetry from visualizers and IMU relays, with player actions mixed in
+INPUT_RATE = float(os.getenv('INPUT_RATE', '2000'))  # messages per second
+ACTION_RATE = float(os.getenv('ACTION_RATE', '10'))  # actions per second
+DURATION = float(os.getenv('DURATION', '3'))
+PUBLISH_LATENCY = float(os.getenv('PUBLISH_LATENCY', '0.0005'))
+# Messages queued before the engine starts, all applied by its first tick
+BACKLOG = int(os.getenv('BACKLOG', '6000'))
+
+async def run(mode):
+    game_engine.ENGINE_MODE = mode
+    rng = random.Random(0)
+    latencies = []
+
+    def settled(message):
+        # Acked once the state change has been broadcast
+        if message.data.get('action', False):
+            latencies.append(time.perf_counter() - message.received)
+
+    engine = game_engine.GameEngine(FakeTransport(PUBLISH_LATENCY))
+    if mode == 'batch':
+        consume = engine.enqueue_message
+        worker = asyncio.create_task(engine.drain_batches())
+    elif mode == 'tick':
+        consume = engine.enqueue_message
+        worker = asyncio.create_task(engine.run_ticks())
+    else:
+        consume = engine.process_message
+        worker = None
+
+    tasks = []
+    interval = 1 / INPUT_RATE
+    action_every = max(1, int(INPUT_RATE / ACTION_RATE))
+    start = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - start < DURATION:
+        # Deliver every message that is due, like the aio_pika consumer spawning a task per message
+        due = int((time.perf_counter() - start) / interval)
+        while sent < due:
+            if sent % action_every == 0:
+                data = {'action': True, 'player_id': rng.choice([1, 2]), 'action_type': 'gun', 'hit': True}
+            else:
+                data = {'game_state': {rng.choice(['p1', 'p2']): {'opponent_visible': rng.random() < 0.5}}}
+            tasks.append(asyncio.create_task(consume(FakeIncomingMessage(data, settled))))
+            sent += 1
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    if worker is not None:
+        worker.cancel()
+
+    latencies.sort()
+    broadcast_rate = engine.transport.broadcasts / elapsed
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    worst = latencies[-1] * 1000
+    print(f'{mode:>6} {sent:>8} {broadcast_rate:>13.1f} {p50:>10.2f} {p99:>10.2f} {worst:>10.2f}')
+    if mode == 'tick':
+        print(f'[DEBUG] Tick stats: {engine.tick_stats.report()}')
+
+async def drain_backlog():
+    # Deliveries are only acked once their tick is applied, so a prefetch limit would spread a backlog over many ticks
+    game_engine.ENGINE_MODE = 'tick'
+    broker = LocalBroker()
+    rng = random.Random(0)
+    for i in range(BACKLOG):
+        if i % 10 == 0:
+            data = {'action': True, 'player_id': rng.choice([1, 2]), 'action_type': 'gun', 'hit': True}
+        else:
+            data = {'game_state': {rng.choice(['p1', 'p2']): {'opponent_visible': rng.random() < 0.5}}}
+        broker.publish(game_engine.UPDATE_GE_QUEUE, *encode(data))
+    engine = game_engine.GameEngine(LocalTransport(broker))
+    start = time.perf_counter()
+    await engine.start()
+    while engine.tick_stats.messages == 0:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    engine.batch_task.cancel()
+    await engine.transport.close()
+    print(f'[DEBUG] Backlog of {BACKLOG} messages: {engine.tick_stats.messages} applied by the first tick '
+          f'with messages, {elapsed * 1000:.0f} ms after start')
+    assert engine.tick_stats.messages == BACKLOG, 'The backlog took more than one tick'
+
+async def main():
+    await drain_backlog()
+    print(f'[DEBUG] {INPUT_RATE:.0f} msg/s for {DURATION:.0f} s ({ACTION_RATE:.0f} actions/s), tick rate {game_engine.TICK_RATE:.0f} Hz')
+    print(f'{"mode":>6} {"messages":>8} {"broadcasts/s":>13} {"p50 ms":>10} {"p99 ms":>10} {"max ms":>10}')
+    for mode in ['event', 'batch', 'tick']:
+        await run(mode)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, FakeTransport, quiet
+import game_engine
+from timer_wheel import TimerWheel, VirtualClock
+
+quiet(game_engine.log)
+
+TIMERS = int(os.getenv('TIMERS', '100000'))
+MATCHES = int(os.getenv('MATCHES', '500'))
+SIMULATED_SECONDS = float(os.getenv('SIMULATED_SECONDS', '60'))
+
+TICK = game_engine.TIMER_TICK_MS / 1000
+
+def bench_wheel():
+    # Random delays up to a minute, a tenth of them cancelled before they are due
+    clock = VirtualClock()
+    wheel = TimerWheel(TICK, now=clock())
+    rng = random.Random(0)
+    delays = [rng.uniform(0, 60) for _ in range(TIMERS)]
+
+    start = time.perf_counter()
+    timers = [wheel.schedule(delay, (index, delay)) for index, delay in enumerate(delays)]
+    schedule_seconds = time.perf_counter() - start
+    cancelled = set(range(0, TIMERS, 10))
+    for index in cancelled:
+        wheel.cancel(timers[index])
+
+    expired = 0
+    start = time.perf_counter()
+    while len(wheel):
+        clock.advance(TICK)
+        for index, delay in wheel.advance(clock()):
+            assert index not in cancelled, 'Cancelled timer expired'
+            # Due at the first tick not before its delay
+            assert delay <= clock() + 1e-9 and clock() - delay < TICK + 1e-9, f'Timer {index} expired off time'
+            expired += 1
+    advance_seconds = time.perf_counter() - start
+    assert expired == TIMERS - len(cancelled)
+
+    print(f'[DEBUG] {TIMERS} timers over {clock():.0f} virtual seconds at a {TICK * 1000:.0f} ms tick')
+    print(f'  schedule:        {schedule_seconds / TIMERS * 1e9:.0f} ns per timer')
+    print(f'  advance/expire:  {advance_seconds / expired * 1e9:.0f} ns per expired timer')
+
+async def bench_engine():
+    # Every match has a rain bomb on each player and a raised shield, and takes a few actions
+    game_engine.TIMED_EFFECTS = True
+    clock = VirtualClock()
+    transport = FakeTransport(record=True)
+    engine = game_engine.GameEngine(transport, clock)
+    for index in range(MATCHES):
+        match_id = f'arena{index}'
+        for data in (
+            {'match_id': match_id, 'game_state': {'p1': {'opponent_visible': True, 'opponent_in_rain_bomb': 1},
+                                                  'p2': {'opponent_visible': True, 'opponent_in_rain_bomb': 1}}},
+            {'match_id': match_id, 'action': True, 'player_id': 1, 'action_type': 'shield'},
+            {'match_id': match_id, 'action': True, 'player_id': 2, 'action_type': 'basket'},
+            {'match_id': match_id, 'action': True, 'player_id': 2, 'action_type': 'basket'},  # Dropped by the cooldown
+        ):
+            await engine.process_message(FakeIncomingMessage(data))
+    await engine.publisher.flush()
+    pending = len(engine.timer_wheel)
+    broadcasts = transport.published[game_engine.UPDATE_EVERYONE_EXCHANGE]
+    broadcasts.clear()
+
+    ticks = 0
+    most_per_tick = 0
+    start = time.perf_counter()
+    while clock() < SIMULATED_SECONDS:
+        clock.advance(TICK)
+        before = len(broadcasts)
+        await engine.fire_timers()
+        await engine.publisher.flush()
+        ticks += 1
+        most_per_tick = max(most_per_tick, len(broadcasts) - before)
+    elapsed = time.perf_counter() - start
+    assert most_per_tick <= MATCHES, 'More than one broadcast per match in a tick'
+
+    effects = {}
+    for body in broadcasts:
+        for effect in json.loads(body)['effects']:
+            effects[effect] = effects.get(effect, 0) + 1
+    p2 = engine.get_match('arena0').state.p2
+    print(f'[DEBUG] {MATCHES} matches, {pending} timers pending after setup, {SIMULATED_SECONDS:.0f} virtual seconds')
+    print(f'  broadcasts: {len(broadcasts)} ({effects})')
+    print(f'  arena0 p2 after: hp={p2.hp} deaths={p2.deaths} shield_hp={engine.get_match("arena0").state.p1.shield_hp}')
+    print(f'  {ticks} ticks in {elapsed:.2f} s, {SIMULATED_SECONDS / elapsed:.0f}x faster than real time')
+
+def check_cancel_churn():
+    # Timers scheduled and cancelled while nothing else is pending are dropped when the wheel skips ahead
+    clock = VirtualClock()
+    wheel = TimerWheel(TICK, now=clock())
+    for round_number in range(100):
+        for timer in [wheel.schedule(1 + index % 50, index) for index in range(1000)]:
+            wheel.cancel(timer)
+        clock.advance(TICK)
+        assert wheel.advance(clock()) == []
+    stored = sum(len(slot) for slot in wheel.slots)
+    print(f'[DEBUG] Cancel churn: {stored} timers left in the slots after 100000 cancelled')
+    assert stored == 0, 'Cancelled timers pile up in the skipped slots'
+
+async def main():
+    bench_wheel()
+    check_cancel_churn()
+    await bench_engine()
+
+if __name__ == '__main__':
+    asyncio.run(main())
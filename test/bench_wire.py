@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import game_engine
+import purge_queues
+import wire
+from game_state import MatchState
+from transport import LocalBroker, LocalTransport
+
+# Keep the services' log records out of the results
+game_engine.log.set_level('WARNING')
+purge_queues.log.set_level('WARNING')
+
+ROUNDS = int(os.getenv('ROUNDS', '2000'))
+CODEC_ROUNDS = int(os.getenv('CODEC_ROUNDS', '20000'))
+
+FORMATS = ('json', 'msgpack')
+
+def sample_messages():
+    # One message of each kind exchanged between the services
+    state = MatchState().to_dict()
+    return {
+        'broadcast': {'match_id': 'default', 'action': 'gun', 'player_id': 1, 'game_state': state},
+        'eval': {'match_id': 'default', 'action': 'gun', 'player_id': 1, 'game_state': MatchState().to_eval_dict()},
+        'ge action': {'action': True, 'player_id': 1, 'action_type': 'basket'},
+        'ge update': {'update': True, 'game_state': {'p1': {'opponent_visible': True, 'opponent_in_rain_bomb': 1}}},
+        'prediction': {'player_id': 1, 'action_type': 'basket', 'confidence': 0.9731},
+    }
+
+def time_per_call(function, argument):
+    start = time.perf_counter()
+    for _ in range(CODEC_ROUNDS):
+        function(argument)
+    return (time.perf_counter() - start) / CODEC_ROUNDS * 1e6
+
+def bench_codecs():
+    print(f'[DEBUG] {CODEC_ROUNDS} encodes and decodes per message (msgpack C extension: {wire.MSGPACK_EXTENSION})')
+    print(f'{"message":>12} {"format":>8} {"bytes":>7} {"encode us":>10} {"decode us":>10}')
+    for name, message in sample_messages().items():
+        for wire_format in FORMATS:
+            body, content_type = wire.encode(message, wire_format)
+            assert wire.decode(body, content_type) == message
+            encode_us = time_per_call(lambda value: wire.encode(value, wire_format), message)
+            decode_us = time_per_call(lambda value: wire.decode(value, content_type), body)
+            print(f'{name:>12} {wire_format:>8} {len(body):>7} {encode_us:>10.2f} {decode_us:>10.2f}')
+
+async def through_engine(wire_format):
+    # Action into update_ge_queue until its message arrives on update_eval_server_queue, all in wire_format
+    game_engine.WIRE_FORMAT = wire_format
+    broker = LocalBroker()
+    engine = game_engine.GameEngine(LocalTransport(broker))
+    engine_task = asyncio.create_task(engine.run())
+    client = LocalTransport(broker)
+    received = asyncio.Queue()
+
+    async def on_eval_message(message):
+        async with message.process():
+            received.put_nowait((time.perf_counter(), wire.decode_message(message), len(message.body)))
+
+    await client.consume(game_engine.UPDATE_EVAL_SERVER_QUEUE, on_eval_message)
+    await asyncio.sleep(0.5)  # Let the engine purge the queues and start consuming
+
+    latencies = []
+    eval_bytes = 0
+    for round_index in range(ROUNDS):
+        message = {'action': True, 'player_id': round_index % 2 + 1, 'action_type': 'reload'}
+        start = time.perf_counter()
+        body, content_type = wire.encode(message, wire_format)
+        await client.publish(game_engine.UPDATE_GE_QUEUE, body, content_type)
+        arrived, data, size = await received.get()
+        assert data['action'] == 'reload'
+        latencies.append(arrived - start)
+        eval_bytes += size
+
+    engine_task.cancel()
+    await client.close()
+    await engine.transport.close()
+    return latencies, eval_bytes / ROUNDS
+
+async def main():
+    bench_codecs()
+    print(f'\n[DEBUG] {ROUNDS} sequential round trips through the engine on the local transport')
+    print(f'{"format":>8} {"p50 us":>10} {"p99 us":>10} {"eval bytes":>11}')
+    for wire_format in FORMATS:
+        latencies, eval_bytes = await through_engine(wire_format)
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1e6
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1e6
+        print(f'{wire_format:>8} {p50:>10.1f} {p99:>10.1f} {eval_bytes:>11.0f}')
+
+if __name__ == '__main__':
+    asyncio.run(main())
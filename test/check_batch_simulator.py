@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import quiet
+import game_engine
+from batch_simulator import BatchSimulator, random_sequences, ACTIONS, NO_ACTION
+
+quiet(game_engine.log)
+
+GAMES = int(os.getenv('GAMES', '20000'))
+STEPS = int(os.getenv('STEPS', '100'))
+# Games replayed through the scalar engine for the comparison
+SCALAR_GAMES = int(os.getenv('SCALAR_GAMES', '500'))
+
+def run_scalar(game, actors, actions, hits, opponent_visible, opponent_in_rain_bomb):
+    # Replay one game through the engine's Match, one action at a time
+    match = game_engine.Match(f'game{game}')
+    steps = []
+    for step in range(actions.shape[1]):
+        player_id = int(actors[game, step]) + 1
+        player = match.state.player(player_id)
+        player.opponent_visible = bool(opponent_visible[game, step])
+        player.opponent_in_rain_bomb = int(opponent_in_rain_bomb[game, step])
+        action = int(actions[game, step])
+        action_type = ACTIONS[action] if action < NO_ACTION else 'none'
+        registered, display = match.perform_action(player_id, action_type, {'hit': bool(hits[game, step])})
+        steps.append((registered, display, player.opponent_hit, player.opponent_shield_hit))
+        match.reset_hit_flags()
+    return match, steps
+
+def main():
+    rng = np.random.default_rng(0)
+    sequences = random_sequences(rng, GAMES, STEPS)
+    actors, actions, hits, opponent_visible, opponent_in_rain_bomb = sequences
+
+    # Vectorized run, keeping per-step outputs for the games that are compared
+    simulator = BatchSimulator(GAMES)
+    vector_steps = []
+    start = time.perf_counter()
+    for step in range(STEPS):
+        outputs = simulator.step(
+            actors[:, step], actions[:, step], hits[:, step],
+            opponent_visible[:, step], opponent_in_rain_bomb[:, step])
+        vector_steps.append([output[:SCALAR_GAMES].copy() for output in outputs])
+    vector_elapsed = time.perf_counter() - start
+
+    mismatches = 0
+    start = time.perf_counter()
+    scalar_runs = [run_scalar(game, *sequences) for game in range(SCALAR_GAMES)]
+    scalar_elapsed = time.perf_counter() - start
+
+    for game, (match, scalar_steps) in enumerate(scalar_runs):
+        expected = [list(match.state.p1.get_stats()), list(match.state.p2.get_stats())]
+        expected_login = [match.state.p1.login, match.state.p2.login]
+        same = (simulator.stats[game].tolist() == expected and simulator.login[game].tolist() == expected_login)
+        for step, scalar_step in enumerate(scalar_steps):
+            vector_step = tuple(bool(output[game]) for output in vector_steps[step])
+            if vector_step != tuple(scalar_step):
+                same = False
+                break
+        if not same:
+            mismatches += 1
+            print(f'[ERROR] Game {game} differs: scalar {expected} vectorized {simulator.stats[game].tolist()}')
+
+    scalar_rate = SCALAR_GAMES * STEPS / scalar_elapsed
+    vector_rate = GAMES * STEPS / vector_elapsed
+    print(f'[DEBUG] Compared {SCALAR_GAMES} games x {STEPS} actions: {mismatches} mismatches')
+    print(f'[DEBUG] Invariant violations: {simulator.check_invariants()}')
+    print(f'  scalar engine: {scalar_rate:>14,.0f} actions/s')
+    print(f'  vectorized:    {vector_rate:>14,.0f} actions/s ({vector_rate / scalar_rate:.0f}x)')
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import msgpack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakes import FakeIncomingMessage, FakeTransport, quiet
+import game_engine
+from journal import Journal
+from timer_wheel import VirtualClock
+
+quiet(game_engine.log)
+
+async def check_batch_isolation():
+    # A malformed message in the middle of a batch is rejected on its own
+    engine = game_engine.GameEngine(FakeTransport())
+    messages = [
+        FakeIncomingMessage({'action': True, 'player_id': 1, 'action_type': 'gun', 'hit': True}),
+        FakeIncomingMessage({'action': True, 'action_type': 'gun', 'hit': True}),
+        FakeIncomingMessage({'action': True, 'player_id': 2, 'action_type': 'shield'}),
+    ]
+    await engine.apply_batch(messages)
+    await engine.publisher.flush()
+
+    p2 = engine.get_match(game_engine.DEFAULT_MATCH_ID).state.p2
+    print(f'[DEBUG] Batch isolation: settled {[message.acked for message in messages]}, '
+          f'p2 hp={p2.hp} shield_hp={p2.shield_hp}, {engine.transport.eval_messages} eval messages, '
+          f'{engine.transport.broadcasts} broadcasts')
+    assert [message.acked for message in messages] == [True, False, True], 'Only the message without a player is rejected'
+    assert p2.hp == 95 and p2.shield_hp == 30, 'The actions around the rejected message are applied'
+    assert engine.transport.eval_messages == 2 and engine.transport.broadcasts == 1, 'The applied actions are published'
+
+async def check_snapshot():
+    # The snapshot only changes version with the state, and the eval projection is cut from the full encoding
+    engine = game_engine.GameEngine(FakeTransport())
+    match = engine.get_match(game_engine.DEFAULT_MATCH_ID)
+    update = {'game_state': {'p1': {'opponent_visible': True, 'profile_pic': 'p1.png'}, 'p2': {'glove_connected': True}}}
+    await engine.process_message(FakeIncomingMessage(update))
+    version = match.snapshot.version
+    await engine.process_message(FakeIncomingMessage(update))
+    assert match.snapshot.version == version, 'An update that changes nothing keeps the version and ETag'
+    await engine.process_message(FakeIncomingMessage({'game_state': {'p2': {'nickname': 'x' * 40}}}))
+    assert match.snapshot.version != version, 'A new unknown field changes the encoded state'
+
+    encodes = match.snapshot.encodes
+    await engine.process_message(FakeIncomingMessage({'action': True, 'player_id': 1, 'action_type': 'gun', 'hit': True}))
+    await engine.publisher.flush()
+    print(f'[DEBUG] Snapshot: {match.snapshot.encodes - encodes} encodes for an action broadcast and sent to the eval server')
+    assert match.snapshot.encodes - encodes == 1, 'The broadcast and the eval message share one encoding'
+
+    for extra in range(20):
+        match.state.p1.update({f'field{extra}': extra})
+    match.snapshot.invalidate()
+    for encoded, decode in ((match.snapshot.get_json(), json.loads), (match.snapshot.get_packed(), msgpack.unpackb)):
+        assert decode(encoded[0]) == match.state.to_dict()
+        assert decode(encoded[1]) == match.state.to_eval_dict()
+
+async def check_lane_order():
+    # A visibility update that arrived before an action is applied before it, one after it is not
+    engine = game_engine.GameEngine(FakeTransport())
+    await engine.enqueue_update(FakeIncomingMessage({'game_state': {'p1': {'opponent_visible': True}}}))
+    await engine.enqueue_action(FakeIncomingMessage({'action': True, 'player_id': 1, 'action_type': 'gun'}))
+    await engine.enqueue_update(FakeIncomingMessage({'game_state': {'p1': {'opponent_visible': False}}}))
+    await engine.enqueue_action(FakeIncomingMessage({'action': True, 'player_id': 1, 'action_type': 'gun'}))
+    lanes = asyncio.create_task(engine.serve_lanes())
+    await asyncio.sleep(0.01)
+    lanes.cancel()
+
+    state = engine.get_match(game_engine.DEFAULT_MATCH_ID).state
+    print(f'[DEBUG] Lane order: p2 hp={state.p2.hp}, p1 bullets={state.p1.bullets}')
+    assert state.p1.bullets == 4, 'Both actions are applied'
+    assert state.p2.hp == 95, 'Only the first shot, taken while the opponent was visible, hits'
+
+async def check_shield_timer():
+    # A shield broken and raised again within one batch expires SHIELD_DURATION after the new one was raised
+    settings = game_engine.TIMED_EFFECTS, game_engine.ACTION_COOLDOWN
+    game_engine.TIMED_EFFECTS, game_engine.ACTION_COOLDOWN = True, 0
+    clock = VirtualClock()
+    engine = game_engine.GameEngine(FakeTransport(), clock)
+    await engine.apply_batch([FakeIncomingMessage({'action': True, 'player_id': 1, 'action_type': 'shield'})])
+    clock.advance(game_engine.SHIELD_DURATION / 2)
+    await engine.fire_timers()
+    gun = {'action': True, 'player_id': 2, 'action_type': 'gun', 'hit': True}
+    await engine.apply_batch([FakeIncomingMessage(gun) for _ in range(6)] +
+                             [FakeIncomingMessage({'action': True, 'player_id': 1, 'action_type': 'shield'})])
+    p1 = engine.get_match(game_engine.DEFAULT_MATCH_ID).state.p1
+    raised = p1.shield_hp
+    clock.advance(game_engine.SHIELD_DURATION * 0.75)
+    await engine.fire_timers()
+    kept = p1.shield_hp
+    clock.advance(game_engine.SHIELD_DURATION / 2)
+    await engine.fire_timers()
+    game_engine.TIMED_EFFECTS, game_engine.ACTION_COOLDOWN = settings
+
+    print(f'[DEBUG] Shield timer: shield_hp {raised} when raised again, {kept} after the first shield\'s duration, '
+          f'{p1.shield_hp} after the second one\'s, shields left {p1.shields}')
+    assert raised == 30 and p1.shields == 1, 'The first shield is broken and a second one raised'
+    assert kept == 30, 'The timer of the broken shield does not expire the new one'
+    assert p1.shield_hp == 0, 'The new shield expires on its own timer'
+
+async def check_journal_rejects():
+    # A message rejected live leaves the recovered state as it left the live one
+    rejected = {'action': True, 'action_type': 'gun', 'hit': True, 'game_state': {'p2': {'hp': 7}}}
+    directory = tempfile.mkdtemp(prefix='journal-')
+    journal_dir = game_engine.JOURNAL_DIR
+    try:
+        game_engine.JOURNAL_DIR = directory
+        engine = game_engine.GameEngine(FakeTransport())
+        engine.journal.start()
+        message = FakeIncomingMessage(rejected)
+        with contextlib.suppress(ValueError):
+            await engine.process_message(message)
+        engine.journal.close()
+        live_hp = engine.get_match(game_engine.DEFAULT_MATCH_ID).state.p2.hp
+        recovered = game_engine.GameEngine(FakeTransport())
+        recovered.restore_from_journal()
+        recovered_hp = recovered.get_match(game_engine.DEFAULT_MATCH_ID).state.p2.hp
+        recovered.journal.close()
+
+        # Journals written before the check still hold such records, replay skips them
+        stale = os.path.join(directory, 'stale')
+        journal = Journal(stale)
+        journal.start()
+        journal.append(json.dumps(rejected).encode('utf-8'))
+        journal.close()
+        game_engine.JOURNAL_DIR = stale
+        replayed = game_engine.GameEngine(FakeTransport())
+        replayed.restore_from_journal()
+        replayed_hp = replayed.get_match(game_engine.DEFAULT_MATCH_ID).state.p2.hp
+        replayed.journal.close()
+    finally:
+        game_engine.JOURNAL_DIR = journal_dir
+        shutil.rmtree(directory)
+
+    print(f'[DEBUG] Journal rejects: p2 hp live {live_hp}, recovered {recovered_hp}, replayed from an old journal {replayed_hp}')
+    assert message.acked is False, 'The message without a player is rejected'
+    assert live_hp == recovered_hp == replayed_hp == 100, 'The rejected message changes neither state'
+
+class FlakyTransport(FakeTransport):
+    # The first publish to the eval server queue fails, like a lost broker connection
+    failed = False
+
+    async def publish(self, queue_name, body, content_type=None):
+        if not self.failed:
+            self.failed = True
+            raise ConnectionError('Connection lost')
+        await super().publish(queue_name, body, content_type)
+
+async def check_publish_failure():
+    # A delivery whose eval message was not confirmed is requeued, and its redelivery sends the eval message once
+    engine = game_engine.GameEngine(FlakyTransport(record=True))
+    action = {'message_id': 'gun-1', 'action': True, 'player_id': 1, 'action_type': 'gun', 'hit': True}
+    first = FakeIncomingMessage(action)
+    await engine.process_message(first)
+    redelivered = FakeIncomingMessage(action)
+    await engine.process_message(redelivered)
+    await engine.publisher.flush()
+
+    p2 = engine.get_match(game_engine.DEFAULT_MATCH_ID).state.p2
+    sent = engine.transport.published[game_engine.UPDATE_EVAL_SERVER_QUEUE]
+    print(f'[DEBUG] Publish failure: first delivery requeued={first.requeued}, redelivery acked={redelivered.acked}, '
+          f'{len(sent)} eval messages, p2 hp={p2.hp}')
+    assert first.acked is False and first.requeued, 'The delivery is requeued rather than acked'
+    assert redelivered.acked and len(sent) == 1, 'The redelivery sends the eval message'
+    assert p2.hp == 95, 'The action is applied once'
+
+async def main():
+    await check_batch_isolation()
+    await check_snapshot()
+    await check_lane_order()
+    await check_shield_timer()
+    await check_journal_rejects()
+    await check_publish_failure()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_inference import stand_in_network
+from imu_wire import AXES
+from inference import CpuBackend, DenseNetwork
+from model_bundle import load_bundle
+
+def check_weights_files():
+    # The weights files named by the bundle load through CpuBackend, and missing ones are refused by name
+    models = load_bundle()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as folder:
+        try:
+            CpuBackend(models, folder)
+        except FileNotFoundError as e:
+            missing = str(e)
+        else:
+            raise AssertionError('A bundle without its weights files loads')
+        for model in models.values():
+            stand_in_network(rng, model.input_length, model.output_length).save(os.path.join(folder, model.weights))
+        backend = CpuBackend(models, folder)
+
+    print(f'[DEBUG] Without weights: {missing}')
+    assert models['glove'].weights in missing
+    for device, model in models.items():
+        window = {axis: rng.integers(-2**15, 2**15, model.target_length).tolist() for axis in AXES}
+        action_index, confidence = backend.predict(window, model)
+        print(f'[DEBUG] {device}: {model.weights} loaded, predicted {model.label(action_index)} ({confidence:.2f})')
+        assert 0 <= action_index < model.output_length and 0 <= confidence <= 1
+
+def check_round_trip():
+    # A saved network loads back with the same layers
+    model = load_bundle()['leg']
+    network = stand_in_network(np.random.default_rng(0), model.input_length, model.output_length)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, model.weights)
+        network.save(path)
+        loaded = DenseNetwork.load(path)
+    assert len(loaded.layers) == len(network.layers)
+    for (weights, bias, activation), (saved_weights, saved_bias, saved_activation) in zip(loaded.layers, network.layers):
+        assert activation == saved_activation
+        assert np.array_equal(weights, saved_weights) and np.array_equal(bias, saved_bias)
+
+def main():
+    check_weights_files()
+    check_round_trip()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from transport import Transport
+
+# Broker stand-ins shared by the benchmarks and checks in this folder
+
+def quiet(*loggers):
+    # Log records are written by a background thread, so only the level keeps them out of the results
+    for logger in loggers:
+        logger.set_level('WARNING')
+
+class FakeTransport(Transport):
+    """Counts publishes, each taking latency seconds like a broker round trip.
+
+    With record=True the published bodies are also kept per queue or exchange in published.
+    """
+
+    def __init__(self, latency=0.0, record=False):
+        self.latency = latency
+        self.broadcasts = 0
+        self.eval_messages = 0
+        self.published = {} if record else None
+
+    async def publish(self, queue_name, body, content_type=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.eval_messages += 1
+        self.record(queue_name, body)
+
+    async def publish_exchange(self, exchange_name, body, content_type=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.broadcasts += 1
+        self.record(exchange_name, body)
+
+    def record(self, destination, body):
+        if self.published is not None:
+            self.published.setdefault(destination, []).append(body)
+
+class FakeIncomingMessage:
+    """A delivery of data (a dict sent as JSON, or a body) settled like an aio_pika message.
+
+    process() acks on a clean exit and rejects when the block raises. on_settle(message) is called
+    once the message is acked or rejected, with acked telling which.
+    """
+
+    def __init__(self, data, on_settle=None):
+        self.data = data
+        self.body = data if isinstance(data, bytes) else json.dumps(data).encode('utf-8')
+        self.on_settle = on_settle
+        self.received = time.perf_counter()
+        self.acked = None
+        self.requeued = False
+
+    def process(self, ignore_processed=False):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            await self.ack()
+        else:
+            await self.reject()
+
+    async def ack(self):
+        self.settle(True)
+
+    async def reject(self, requeue=False):
+        self.requeued = requeue and self.acked is None
+        self.settle(False)
+
+    def settle(self, acked):
+        if self.acked is not None:
+            return
+        self.acked = acked
+        if self.on_settle is not None:
+            self.on_settle(self)
@@ -3,8 +3,11 @@
 import asyncio
 import json
 import os
+import sys
 from dotenv import load_dotenv
 import aio_pika
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from imu_wire import encode_imu
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,14 +20,21 @@ RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT', '5672'))
 
 # RabbitMQ queues
 AI_QUEUE = 'ai_queue'
-UPDATE_GE_QUEUE = 'update_ge_queue'
+UPDATE_GE_ACTION_QUEUE = 'update_ge_action_queue'
+
+# 'json' or 'int16' for the packed binary windows of imu_wire.py
+IMU_FORMAT = os.getenv('IMU_FORMAT', 'json')
 
 # Test data
 TEST_IMU_DATA = {
-    'length': 40,
-    'ax': [1000] * 40,
-    'ay': [2000] * 40,
-    'az': [3000] * 40,
+    'length': 59,
+    'imu_device': 'glove',
+    'ax': [1000] * 59,
+    'ay': [2000] * 59,
+    'az': [3000] * 59,
+    'gx': [100] * 59,
+    'gy': [200] * 59,
+    'gz': [300] * 59,
     'player_id': 1
 }
 
@@ -32,7 +42,7 @@ class AITest:
     def __init__(self):
         self.connection = None
         self.channel = None
-        self.update_ge_queue = None
+        self.update_ge_action_queue = None
 
     async def setup_rabbitmq(self):
         # Connect to RabbitMQ
@@ -45,25 +55,28 @@ class AITest:
         self.channel = await self.connection.channel()
         # Declare queues
         await self.channel.declare_queue(AI_QUEUE, durable=True)
-        self.update_ge_queue = await self.channel.declare_queue(UPDATE_GE_QUEUE, durable=True)
+        self.update_ge_action_queue = await self.channel.declare_queue(UPDATE_GE_ACTION_QUEUE, durable=True)
         print('[DEBUG] Connected to RabbitMQ and declared queues')
 
     async def send_imu_data(self):
         # Publish test IMU data to ai_queue
-        message_body = json.dumps(TEST_IMU_DATA).encode('utf-8')
+        if IMU_FORMAT == 'int16':
+            message_body, content_type = encode_imu(TEST_IMU_DATA)
+        else:
+            message_body, content_type = json.dumps(TEST_IMU_DATA).encode('utf-8'), 'application/json'
         await self.channel.default_exchange.publish(
-            aio_pika.Message(body=message_body),
+            aio_pika.Message(body=message_body, content_type=content_type),
             routing_key=AI_QUEUE,
         )
-        print('[DEBUG] Published test IMU data to ai_queue')
+        print(f'[DEBUG] Published test IMU data to ai_queue as {IMU_FORMAT} ({len(message_body)} bytes)')
 
-    async def consume_update_ge_queue(self):
-        # Consume messages from update_ge_queue
-        async with self.update_ge_queue.iterator() as queue_iter:
+    async def consume_update_ge_action_queue(self):
+        # Consume messages from update_ge_action_queue
+        async with self.update_ge_action_queue.iterator() as queue_iter:
             async for message in queue_iter:
                 async with message.process():
                     data = json.loads(message.body.decode('utf-8'))
-                    print(f'[DEBUG] Received message from update_ge_queue: {data}')
+                    print(f'[DEBUG] Received message from update_ge_action_queue: {data}')
                     # Exit after receiving the message
                     return
 
@@ -71,9 +84,9 @@ class AITest:
         await self.setup_rabbitmq()
         # Send IMU data
         await self.send_imu_data()
-        # Wait and consume message from update_ge_queue
-        print('[DEBUG] Waiting for message from update_ge_queue...')
-        await self.consume_update_ge_queue()
+        # Wait and consume message from update_ge_action_queue
+        print('[DEBUG] Waiting for message from update_ge_action_queue...')
+        await self.consume_update_ge_action_queue()
         # Close the connection
         await self.connection.close()
 
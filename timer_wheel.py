@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import math
+
+class Timer:
+    __slots__ = ('payload', 'rounds', 'done')
+
+    def __init__(self, payload, rounds):
+        self.payload = payload
+        # Full turns of the wheel left before the timer is due
+        self.rounds = rounds
+        self.done = False
+
+class TimerWheel:
+    """Hashed timing wheel of payloads due after a delay.
+
+    schedule() and cancel() are O(1), and advance() does O(1) work per timer in the slots it passes,
+    so thousands of pending timers cost nothing until they are due. Delays are rounded up to whole ticks.
+    """
+
+    def __init__(self, tick, slots=512, now=0.0):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.start = now
+        self.current_tick = 0
+        self.pending = 0
+        # Cancelled timers still in their slots
+        self.cancelled = 0
+
+    def __len__(self):
+        return self.pending
+
+    def schedule(self, delay, payload):
+        """Return the Timer of payload, due delay seconds after the last advance()."""
+        ticks = max(1, math.ceil(delay / self.tick))
+        timer = Timer(payload, (ticks - 1) // len(self.slots))
+        self.slots[(self.current_tick + ticks) % len(self.slots)].append(timer)
+        self.pending += 1
+        return timer
+
+    def cancel(self, timer):
+        # The timer stays in its slot and is dropped when the wheel reaches it
+        if not timer.done:
+            timer.done = True
+            self.pending -= 1
+            self.cancelled += 1
+
+    def advance(self, now):
+        """Move the wheel to now and return the payloads that became due, in order."""
+        # The epsilon keeps clocks advanced in tick steps from landing just short of a tick by float error
+        target_tick = int((now - self.start) / self.tick + 1e-9)
+        if self.pending == 0:
+            # Nothing to expire, skip the slots; any timers left in them were cancelled, so drop them now
+            # rather than when the wheel comes round to them
+            if self.cancelled:
+                for slot in self.slots:
+                    slot.clear()
+                self.cancelled = 0
+            self.current_tick = max(self.current_tick, target_tick)
+            return []
+        expired = []
+        while self.current_tick < target_tick:
+            self.current_tick += 1
+            index = self.current_tick % len(self.slots)
+            slot = self.slots[index]
+            if not slot:
+                continue
+            remaining = []
+            for timer in slot:
+                if timer.done:
+                    self.cancelled -= 1
+                    continue
+                if timer.rounds:
+                    timer.rounds -= 1
+                    remaining.append(timer)
+                else:
+                    timer.done = True
+                    self.pending -= 1
+                    expired.append(timer.payload)
+            self.slots[index] = remaining
+        return expired
+
+class VirtualClock:
+    """Clock moved by hand, so timed effects can be tested and benchmarked faster than real time."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
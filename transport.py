@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+from log import get_logger
+
+# Load environment variables from .env file
+load_dotenv()
+
+# 'rabbitmq' talks to the broker at BROKER, 'local' hands message bytes to other services in the same process
+TRANSPORT = os.getenv('TRANSPORT', 'rabbitmq')
+
+BROKER = os.getenv('BROKER')
+BROKERUSER = os.getenv('BROKERUSER')
+PASSWORD = os.getenv('PASSWORD')
+RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT', '5672'))
+# Channels the shared RabbitMQ connection spreads publishes over
+RABBITMQ_CHANNELS = int(os.getenv('RABBITMQ_CHANNELS', '4'))
+
+log = get_logger('transport')
+
+class Transport:
+    """Messaging used by the services: durable queues fed through the default exchange,
+    and fanout exchanges.
+
+    Consumer callbacks get message objects with body, content_type, process(), ack() and
+    reject(requeue=False), the subset of aio_pika.IncomingMessage the services use.
+    content_type tells the wire format of the body, see wire.py.
+    """
+
+    async def connect(self):
+        raise NotImplementedError
+
+    async def declare_queue(self, queue_name):
+        raise NotImplementedError
+
+    async def declare_exchange(self, exchange_name):
+        raise NotImplementedError
+
+    async def consume(self, queue_name, callback, prefetch_count=None):
+        raise NotImplementedError
+
+    async def publish(self, queue_name, body, content_type=None):
+        # Publish through the default exchange straight to a queue
+        raise NotImplementedError
+
+    async def publish_exchange(self, exchange_name, body, content_type=None):
+        # Publish to every queue bound to a fanout exchange
+        raise NotImplementedError
+
+    async def purge(self, queue_name):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+class PooledChannel:
+    """A publishing channel of a BrokerClient and its publish statistics."""
+
+    def __init__(self, number, channel):
+        self.number = number
+        self.channel = channel
+        self.exchanges = {}
+        self.published = 0
+        self.failed = 0
+        self.bytes = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.confirm_seconds = 0.0
+
+    async def exchange(self, exchange_name, declare):
+        if exchange_name not in self.exchanges:
+            self.exchanges[exchange_name] = await declare(self.channel, exchange_name)
+        return self.exchanges[exchange_name]
+
+    async def publish(self, exchange, message, routing_key):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            await exchange.publish(message, routing_key=routing_key)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        self.confirm_seconds += time.perf_counter() - start
+        self.published += 1
+        self.bytes += len(message.body)
+
+    def stats(self):
+        return {
+            'channel': self.number,
+            'published': self.published,
+            'failed': self.failed,
+            'bytes': self.bytes,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'avg_confirm_ms': self.confirm_seconds / self.published * 1000 if self.published else 0.0,
+        }
+
+class BrokerClient:
+    """One robust RabbitMQ connection shared by every RabbitMQTransport of the process.
+
+    Publishes are spread over a pool of channels with publisher confirms; all messages to one
+    destination use the same channel so they stay in order. Every consumer gets a channel of its
+    own so prefetch counts do not interfere, and declarations are made once per channel.
+    """
+
+    def __init__(self, host, port, login, password, publish_channels=None):
+        self.host = host
+        self.port = port
+        self.login = login
+        self.password = password
+        self.publish_channel_count = publish_channels or RABBITMQ_CHANNELS
+        self.connection = None
+        self.control_channel = None
+        self.publish_channels = []
+        self.consumer_channels = []
+        self.queues = {}
+        self.exchanges = {}
+        self.users = 0
+        self.connect_lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self.connect_lock:
+            if self.connection is not None:
+                self.users += 1
+                return
+            # Imported here so the local transport works without aio_pika installed
+            import aio_pika
+            self.aio_pika = aio_pika
+            start = time.perf_counter()
+            self.connection = await aio_pika.connect_robust(
+                host=self.host,
+                port=self.port,
+                login=self.login,
+                password=self.password,
+                timeout=30,
+            )
+            # Declarations and purges go through their own channel; all channels are opened at once
+            try:
+                self.control_channel, *channels = await asyncio.gather(
+                    *(self.connection.channel() for _ in range(self.publish_channel_count + 1)))
+            except Exception:
+                connection, self.connection = self.connection, None
+                await connection.close()
+                raise
+            self.publish_channels = [PooledChannel(number, channel) for number, channel in enumerate(channels)]
+            log.info('Connected to RabbitMQ broker at %s:%s with %d publish channels in %.1f ms',
+                     self.host, self.port, self.publish_channel_count, (time.perf_counter() - start) * 1000)
+            # Only counted once connected, so a failed attempt can be retried
+            self.users += 1
+
+    async def declare_queue(self, queue_name):
+        if queue_name not in self.queues:
+            self.queues[queue_name] = await self.control_channel.declare_queue(queue_name, durable=True)
+        return self.queues[queue_name]
+
+    async def declare_exchange(self, exchange_name):
+        if exchange_name not in self.exchanges:
+            self.exchanges[exchange_name] = await self.declare_exchange_on(self.control_channel, exchange_name)
+            # Bind it on the publish channels now, so publishing never waits on a declaration that could reorder messages
+            await asyncio.gather(*(pooled.exchange(exchange_name, self.declare_exchange_on)
+                                   for pooled in self.publish_channels))
+        return self.exchanges[exchange_name]
+
+    async def declare_exchange_on(self, channel, exchange_name):
+        return await channel.declare_exchange(exchange_name, self.aio_pika.ExchangeType.FANOUT, durable=True)
+
+    async def consume(self, queue_name, callback, prefetch_count=None):
+        channel = await self.connection.channel()
+        self.consumer_channels.append(channel)
+        if prefetch_count is not None:
+            await channel.set_qos(prefetch_count=prefetch_count)
+        queue = await channel.declare_queue(queue_name, durable=True)
+        await queue.consume(callback)
+
+    def publish_channel(self, destination):
+        return self.publish_channels[hash(destination) % len(self.publish_channels)]
+
+    async def publish(self, queue_name, body, content_type=None):
+        pooled = self.publish_channel(queue_name)
+        await pooled.publish(
+            pooled.channel.default_exchange,
+            self.aio_pika.Message(body=body, content_type=content_type),
+            queue_name,
+        )
+
+    async def publish_exchange(self, exchange_name, body, content_type=None):
+        pooled = self.publish_channel(exchange_name)
+        exchange = await pooled.exchange(exchange_name, self.declare_exchange_on)
+        await pooled.publish(exchange, self.aio_pika.Message(body=body, content_type=content_type), '')
+
+    async def purge(self, queue_name):
+        queue = await self.declare_queue(queue_name)
+        await queue.purge()
+
+    def channel_stats(self):
+        """Publish statistics of every channel in the pool."""
+        return [pooled.stats() for pooled in self.publish_channels]
+
+    async def close(self):
+        # The connection is closed when the last transport using it closes
+        async with self.connect_lock:
+            self.users -= 1
+            if self.users > 0 or self.connection is None:
+                return
+            log.info('Publish channel stats: %s', self.channel_stats())
+            await self.connection.close()
+            self.connection = None
+            self.control_channel = None
+            self.publish_channels = []
+            self.consumer_channels = []
+            self.queues = {}
+            self.exchanges = {}
+
+broker_clients = {}
+
+def get_broker_client(host, port, login, password):
+    # One client per broker and user in the process
+    key = (host, port, login)
+    if key not in broker_clients:
+        broker_clients[key] = BrokerClient(host, port, login, password)
+    return broker_clients[key]
+
+class RabbitMQTransport(Transport):
+    def __init__(self, host=None, port=None, login=None, password=None, client=None):
+        self.client = client or get_broker_client(
+            host or BROKER, port or RABBITMQ_PORT, login or BROKERUSER, password or PASSWORD)
+        self.connected = False
+
+    async def connect(self):
+        if self.connected:
+            return
+        await self.client.connect()
+        self.connected = True
+
+    async def declare_queue(self, queue_name):
+        return await self.client.declare_queue(queue_name)
+
+    async def declare_exchange(self, exchange_name):
+        return await self.client.declare_exchange(exchange_name)
+
+    async def consume(self, queue_name, callback, prefetch_count=None):
+        await self.client.consume(queue_name, callback, prefetch_count)
+
+    async def publish(self, queue_name, body, content_type=None):
+        await self.client.publish(queue_name, body, content_type)
+
+    async def publish_exchange(self, exchange_name, body, content_type=None):
+        await self.client.publish_exchange(exchange_name, body, content_type)
+
+    async def purge(self, queue_name):
+        await self.client.purge(queue_name)
+
+    def channel_stats(self):
+        return self.client.channel_stats()
+
+    async def close(self):
+        if self.connected:
+            self.connected = False
+            await self.client.close()
+
+class LocalMessage:
+    def __init__(self, body, queue, content_type=None, window=None):
+        self.body = body
+        self.content_type = content_type
+        self.queue = queue
+        # Prefetch window of the consumer, freed when the message is acked or rejected
+        self.window = window
+        self.processed = False
+
+    def process(self, ignore_processed=False):
+        # Settled messages are left alone on exit whether or not ignore_processed is set
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    def settle(self):
+        if not self.processed and self.window is not None:
+            self.window.release()
+        self.processed = True
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        # Like aio_pika, a failed message is rejected without requeueing
+        if self.processed:
+            return
+        if exc_type is None:
+            await self.ack()
+        else:
+            await self.reject()
+
+    async def ack(self):
+        self.settle()
+
+    async def reject(self, requeue=False):
+        self.settle()
+        if requeue:
+            self.queue.put_nowait((self.body, self.content_type))
+
+class LocalBroker:
+    """Queues and fanout exchanges shared by every LocalTransport of the process."""
+
+    def __init__(self):
+        self.queues = {}
+        self.bindings = {}
+
+    def queue(self, queue_name):
+        if queue_name not in self.queues:
+            self.queues[queue_name] = asyncio.Queue()
+        return self.queues[queue_name]
+
+    def exchange(self, exchange_name):
+        return self.bindings.setdefault(exchange_name, [])
+
+    def bind(self, queue_name, exchange_name):
+        bound = self.exchange(exchange_name)
+        if queue_name not in bound:
+            bound.append(queue_name)
+        self.queue(queue_name)
+
+    def publish(self, queue_name, body, content_type=None):
+        self.queue(queue_name).put_nowait((body, content_type))
+
+    def publish_exchange(self, exchange_name, body, content_type=None):
+        for queue_name in self.exchange(exchange_name):
+            self.queues[queue_name].put_nowait((body, content_type))
+
+broker = LocalBroker()
+
+class LocalTransport(Transport):
+    def __init__(self, local_broker=None):
+        self.broker = local_broker or broker
+        self.consumers = []
+        self.handlers = set()
+
+    async def connect(self):
+        pass
+
+    async def declare_queue(self, queue_name):
+        return self.broker.queue(queue_name)
+
+    async def declare_exchange(self, exchange_name):
+        return self.broker.exchange(exchange_name)
+
+    async def consume(self, queue_name, callback, prefetch_count=None):
+        # Like RabbitMQ, at most prefetch_count deliveries are unsettled at once, 0 or None means no limit
+        window = asyncio.Semaphore(prefetch_count) if prefetch_count else None
+        self.consumers.append(asyncio.create_task(self.deliver(self.broker.queue(queue_name), callback, window)))
+
+    async def deliver(self, queue, callback, window=None):
+        # One task per delivery, like the aio_pika consumer
+        while True:
+            if window is not None:
+                await window.acquire()
+            body, content_type = await queue.get()
+            handler = asyncio.create_task(self.handle(callback, LocalMessage(body, queue, content_type, window)))
+            self.handlers.add(handler)
+            handler.add_done_callback(self.handlers.discard)
+
+    async def handle(self, callback, message):
+        try:
+            await callback(message)
+        except Exception as e:
+            log.error('Consumer callback failed: %s', e)
+
+    async def publish(self, queue_name, body, content_type=None):
+        self.broker.publish(queue_name, body, content_type)
+
+    async def publish_exchange(self, exchange_name, body, content_type=None):
+        self.broker.publish_exchange(exchange_name, body, content_type)
+
+    async def purge(self, queue_name):
+        queue = self.broker.queue(queue_name)
+        while not queue.empty():
+            queue.get_nowait()
+
+    async def close(self):
+        for consumer in self.consumers:
+            consumer.cancel()
+        self.consumers = []
+
+def create_transport(name=None):
+    name = name or TRANSPORT
+    if name == 'local':
+        return LocalTransport()
+    if name == 'rabbitmq':
+        return RabbitMQTransport()
+    raise ValueError(f'Unknown transport "{name}"')
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import json
+import os
+import struct
+import msgpack
+from dotenv import load_dotenv
+from log import get_logger
+
+# msgpack falls back to its own pure Python implementation when its C extension cannot be loaded
+MSGPACK_EXTENSION = not msgpack.Packer.__module__.startswith('msgpack.fallback')
+
+# Wire formats of the messages between the services. The format of every message is given by its
+# AMQP content_type, so services that only speak JSON keep working next to ones that send MessagePack.
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+CONTENT_TYPES = {'json': JSON_CONTENT_TYPE, 'msgpack': MSGPACK_CONTENT_TYPE}
+
+# Load environment variables from .env file
+load_dotenv()
+
+log = get_logger('wire')
+
+def negotiate_format(wire_format):
+    # Pure Python MessagePack is slower than json, so it is only published with the C extension
+    if wire_format == 'msgpack' and not MSGPACK_EXTENSION:
+        log.warning('WIRE_FORMAT=msgpack needs the msgpack C extension (pip install msgpack), publishing JSON')
+        return 'json'
+    return wire_format
+
+# Format this service publishes in, 'json' or 'msgpack'; both are always accepted
+WIRE_FORMAT = negotiate_format(os.getenv('WIRE_FORMAT', 'json'))
+
+def pack_header(small_tag, tag16, tag32, length, small_limit=16):
+    # MessagePack header of a map or array of length items, for maps spliced from encoded parts
+    if length < small_limit:
+        return bytes((small_tag | length,))
+    if length <= 0xFFFF:
+        return struct.pack('>BH', tag16, length)
+    return struct.pack('>BI', tag32, length)
+
+def is_msgpack(body):
+    # Messages are maps: JSON starts with '{' or whitespace, a MessagePack map with a map tag
+    return len(body) > 0 and (body[0] & 0xf0 == 0x80 or body[0] in (0xde, 0xdf))
+
+def decode(body, content_type=None):
+    """Decode a message body in either format; without a content_type the format is detected."""
+    if content_type == MSGPACK_CONTENT_TYPE or (content_type is None and is_msgpack(body)):
+        return msgpack.unpackb(body)
+    return json.loads(body)
+
+def decode_message(message):
+    # Test doubles of incoming messages may not carry a content_type
+    return decode(message.body, getattr(message, 'content_type', None))
+
+def encode(message, wire_format=None):
+    """Return (body, content_type) of message in wire_format, WIRE_FORMAT by default."""
+    wire_format = wire_format or WIRE_FORMAT
+    if wire_format == 'msgpack':
+        return msgpack.packb(message), MSGPACK_CONTENT_TYPE
+    return json.dumps(message).encode('utf-8'), JSON_CONTENT_TYPE
+
+def splice_packed(fields, packed_game_state):
+    """MessagePack counterpart of game_state.splice_game_state."""
+    out = [pack_header(0x80, 0xde, 0xdf, len(fields) + 1)]
+    for key, value in fields.items():
+        out.append(msgpack.packb(key))
+        out.append(msgpack.packb(value))
+    out.append(b'\xaagame_state')
+    out.append(packed_game_state)
+    return b''.join(out)